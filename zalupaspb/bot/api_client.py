@@ -1,4 +1,6 @@
 import os
+import asyncio
+import aiohttp
 import requests
 import logging
 import json
@@ -16,6 +18,40 @@ load_dotenv(os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file_
 API_URL = os.getenv('API_URL', 'https://dinozavrikgugl.ru/api')
 API_TOKEN = os.getenv('API_TOKEN')
 API_REFRESH_TOKEN = os.getenv('API_REFRESH_TOKEN')
+API_TIMEOUT = float(os.getenv('API_TIMEOUT', '10'))  # секунд на запрос
+API_POOL_SIZE = int(os.getenv('API_POOL_SIZE', '20'))  # соединений в пуле
+
+
+def save_tokens_to_env(token, refresh_token):
+    """Сохраняет токены в .env файл"""
+    try:
+        env_path = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'config', '.env')
+        with open(env_path, 'r') as file:
+            lines = file.readlines()
+        
+        # Обновляем значения токенов
+        new_lines = []
+        for line in lines:
+            if line.startswith('API_TOKEN='):
+                new_lines.append(f'API_TOKEN={token}\n')
+            elif line.startswith('API_REFRESH_TOKEN='):
+                new_lines.append(f'API_REFRESH_TOKEN={refresh_token}\n')
+            else:
+                new_lines.append(line)
+        
+        # Если строк с токенами нет, добавляем их
+        if not any(line.startswith('API_TOKEN=') for line in new_lines):
+            new_lines.append(f'API_TOKEN={token}\n')
+        if not any(line.startswith('API_REFRESH_TOKEN=') for line in new_lines):
+            new_lines.append(f'API_REFRESH_TOKEN={refresh_token}\n')
+        
+        # Записываем обновленные строки обратно в файл
+        with open(env_path, 'w') as file:
+            file.writelines(new_lines)
+        
+        logger.info("Токены успешно сохранены в .env файл")
+    except Exception as e:
+        logger.error(f"Ошибка при сохранении токенов в .env файл: {e}")
 
 
 class APIClient:
@@ -68,34 +104,7 @@ class APIClient:
     
     def _save_tokens_to_env(self):
         """Сохраняет токены в .env файл"""
-        try:
-            env_path = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'config', '.env')
-            with open(env_path, 'r') as file:
-                lines = file.readlines()
-            
-            # Обновляем значения токенов
-            new_lines = []
-            for line in lines:
-                if line.startswith('API_TOKEN='):
-                    new_lines.append(f'API_TOKEN={self.token}\n')
-                elif line.startswith('API_REFRESH_TOKEN='):
-                    new_lines.append(f'API_REFRESH_TOKEN={self.refresh_token}\n')
-                else:
-                    new_lines.append(line)
-            
-            # Если строк с токенами нет, добавляем их
-            if not any(line.startswith('API_TOKEN=') for line in new_lines):
-                new_lines.append(f'API_TOKEN={self.token}\n')
-            if not any(line.startswith('API_REFRESH_TOKEN=') for line in new_lines):
-                new_lines.append(f'API_REFRESH_TOKEN={self.refresh_token}\n')
-            
-            # Записываем обновленные строки обратно в файл
-            with open(env_path, 'w') as file:
-                file.writelines(new_lines)
-            
-            logger.info("Токены успешно сохранены в .env файл")
-        except Exception as e:
-            logger.error(f"Ошибка при сохранении токенов в .env файл: {e}")
+        save_tokens_to_env(self.token, self.refresh_token)
     
     def _ensure_token_valid(self):
         """Проверяет, не истек ли токен, и при необходимости обновляет его"""
@@ -240,4 +249,203 @@ class APIClient:
             'role': role
         }
         
-        return self._make_request('POST', f'/users/{user_id}/role/', json_data=payload)
\ No newline at end of file
+        return self._make_request('POST', f'/users/{user_id}/role/', json_data=payload)
+
+
+class AsyncAPIClient:
+    """
+    Асинхронный клиент для работы с API на aiohttp.
+    Использует общий пул keep-alive соединений и таймаут на каждый запрос,
+    поэтому медленный ответ API не блокирует цикл событий бота.
+    """
+    
+    def __init__(self, base_url=None, token=None, refresh_token=None, timeout=None, pool_size=None):
+        self.base_url = base_url or API_URL
+        self.token = token or API_TOKEN
+        self.refresh_token = refresh_token or API_REFRESH_TOKEN
+        self.timeout = aiohttp.ClientTimeout(total=timeout or API_TIMEOUT)
+        self.pool_size = pool_size or API_POOL_SIZE
+        self.token_expires_at = datetime.now() + timedelta(days=6)  # Предполагаем, что у нас есть 6 дней до истечения токена
+        self._session = None
+        self._refresh_lock = asyncio.Lock()
+    
+    async def _get_session(self):
+        """Возвращает общую сессию, создавая ее при первом обращении"""
+        if self._session is None or self._session.closed:
+            connector = aiohttp.TCPConnector(limit=self.pool_size, keepalive_timeout=60)
+            self._session = aiohttp.ClientSession(connector=connector, timeout=self.timeout)
+        return self._session
+    
+    async def close(self):
+        """Закрывает сессию и соединения пула"""
+        if self._session is not None and not self._session.closed:
+            await self._session.close()
+    
+    def _auth_headers(self):
+        """Заголовок авторизации для запроса"""
+        if self.token:
+            return {'Authorization': f'Bearer {self.token}'}
+        return {}
+    
+    async def refresh_access_token(self):
+        """Обновляет access token с помощью refresh token"""
+        if not self.refresh_token:
+            logger.error("Невозможно обновить токен: refresh_token не указан")
+            return False
+        
+        # Параллельные запросы не должны обновлять токен одновременно
+        token_before = self.token
+        async with self._refresh_lock:
+            if self.token != token_before:
+                return True
+            
+            try:
+                session = await self._get_session()
+                url = f"{self.base_url}/token/refresh/"
+                async with session.post(url, json={'refresh': self.refresh_token}) as response:
+                    if response.status != 200:
+                        logger.error(f"Ошибка при обновлении токена: {response.status} - {await response.text()}")
+                        return False
+                    data = await response.json()
+                
+                self.token = data.get('access')
+                # Если сервер возвращает новый refresh токен
+                if 'refresh' in data:
+                    self.refresh_token = data.get('refresh')
+                    # Сохраняем новые токены в .env файл
+                    await asyncio.to_thread(save_tokens_to_env, self.token, self.refresh_token)
+                
+                self.token_expires_at = datetime.now() + timedelta(days=6)  # Устанавливаем новое время истечения
+                logger.info("Токен успешно обновлен")
+                return True
+            except Exception as e:
+                logger.error(f"Исключение при обновлении токена: {e}")
+                return False
+    
+    async def _ensure_token_valid(self):
+        """Проверяет, не истек ли токен, и при необходимости обновляет его"""
+        # Если до истечения токена осталось менее 1 дня, обновляем его
+        if datetime.now() + timedelta(days=1) >= self.token_expires_at:
+            return await self.refresh_access_token()
+        return True
+    
+    async def _make_request(self, method, endpoint, json_data=None, params=None, retry_auth=True):
+        """Выполняет запрос к API с проверкой валидности токена"""
+        if not await self._ensure_token_valid():
+            logger.error("Невозможно обновить токен доступа")
+            return {'error': 'Невозможно обновить токен доступа'}
+        
+        url = f"{self.base_url}/{endpoint.lstrip('/')}"
+        logger.info(f"Выполняем запрос {method} {url}")
+        
+        try:
+            session = await self._get_session()
+            async with session.request(
+                method,
+                url,
+                json=json_data,
+                params=params,
+                headers=self._auth_headers()
+            ) as response:
+                text = await response.text()
+                logger.info(f"Статус ответа: {response.status}")
+                
+                if response.status == 401 and retry_auth:
+                    # Пробуем обновить токен и повторить запрос
+                    if await self.refresh_access_token():
+                        return await self._make_request(method, endpoint, json_data, params, retry_auth=False)
+                
+                try:
+                    data = json.loads(text) if text else {}
+                except json.JSONDecodeError:
+                    logger.error(f"Invalid JSON: {text[:500]}")
+                    if response.status >= 400:
+                        return {'error': f"HTTP {response.status}"}
+                    return {'error': 'Invalid JSON response'}
+                
+                if response.status >= 400:
+                    logger.error(f"API Error Details: {data}")
+                    if isinstance(data, dict):
+                        data.setdefault('error', f"HTTP {response.status}")
+                        return data
+                    return {'error': f"HTTP {response.status}", 'details': data}
+                
+                return data
+        except asyncio.TimeoutError:
+            logger.error(f"Таймаут при выполнении запроса {method} {url}")
+            return {'error': 'Сервер API не ответил вовремя'}
+        except aiohttp.ClientConnectionError as e:
+            logger.error(f"Ошибка соединения при выполнении запроса {method} {url}: {e}")
+            return {'error': f"Не удалось соединиться с сервером API: {str(e)}"}
+        except Exception as e:
+            logger.error(f"Ошибка при выполнении запроса {method} {url}: {e}")
+            return {'error': str(e)}
+    
+    async def check_url(self, url, timeout=5):
+        """Проверка доступности URL без авторизации. Возвращает (статус, текст ответа)"""
+        session = await self._get_session()
+        async with session.get(url, timeout=aiohttp.ClientTimeout(total=timeout)) as response:
+            return response.status, await response.text()
+    
+    async def get_user_by_discord_id(self, discord_id):
+        """Получение пользователя по Discord ID"""
+        return await self._make_request('GET', '/users/by-discord/', params={'discord_id': discord_id})
+    
+    async def bind_discord(self, code, discord_id, discord_username, discord_avatar=None):
+        """Привязка Discord аккаунта к аккаунту пользователя"""
+        payload = {
+            'code': code,
+            'discord_id': discord_id,
+            'discord_username': discord_username
+        }
+        
+        if discord_avatar:
+            payload['discord_avatar'] = discord_avatar
+        
+        return await self._make_request('POST', '/users/bind-discord/', json_data=payload)
+    
+    async def create_key(self, key_type='standard', duration_days=30, notes=None):
+        """Создание нового ключа (POST /keys/create/, поля KeyCreateSerializer)"""
+        payload = {'key_type': key_type}
+        
+        # Срок пожизненного ключа не учитывается, а 0 дней сериализатор не принимает
+        if duration_days:
+            payload['duration_days'] = duration_days
+        
+        if notes:
+            payload['notes'] = notes
+        
+        return await self._make_request('POST', '/keys/create/', json_data=payload)
+    
+    async def activate_key(self, key_code, user_id, discord_id=None):
+        """Активация ключа по коду для пользователя сайта (POST /keys/redeem/for-user/, только служебный аккаунт бота)"""
+        payload = {
+            'key_code': key_code,
+            'user_id': user_id
+        }
+        
+        if discord_id:
+            payload['discord_id'] = discord_id
+        
+        return await self._make_request('POST', '/keys/redeem/for-user/', json_data=payload)
+    
+    async def ban_user(self, user_id, reason=None):
+        """Блокировка пользователя"""
+        payload = {}
+        
+        if reason:
+            payload['reason'] = reason
+        
+        return await self._make_request('POST', f'/users/{user_id}/ban/', json_data=payload)
+    
+    async def unban_user(self, user_id):
+        """Разблокировка пользователя"""
+        return await self._make_request('POST', f'/users/{user_id}/unban/', json_data={})
+    
+    async def get_user_stats(self, user_id):
+        """Получение статистики пользователя"""
+        return await self._make_request('GET', f'/users/{user_id}/stats/')
+    
+    async def set_user_role(self, user_id, role):
+        """Установка роли пользователя"""
+        return await self._make_request('POST', f'/users/{user_id}/role/', json_data={'role': role})
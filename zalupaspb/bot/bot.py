@@ -9,10 +9,9 @@ import yaml
 from dotenv import load_dotenv
 import random
 import string
-import requests
 import json
 from datetime import datetime, timedelta
-from api_client import APIClient
+from api_client import AsyncAPIClient
 
 # Создаем директорию для логов, если она не существует
 log_dir = os.path.dirname(os.path.abspath(__file__))
@@ -32,8 +31,7 @@ logger.info(f"Запуск бота. Лог файл: {log_file}")
 
 # Устанавливаем уровень логирования для библиотек
 logging.getLogger('discord').setLevel(logging.INFO)
-logging.getLogger('requests').setLevel(logging.DEBUG)
-logging.getLogger('urllib3').setLevel(logging.INFO)
+logging.getLogger('aiohttp').setLevel(logging.INFO)
 
 # Загружаем переменные окружения
 sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
@@ -71,8 +69,8 @@ intents.message_content = True
 
 bot = commands.Bot(command_prefix='!', intents=intents)
 
-# Инициализируем API клиент
-api_client = APIClient()
+# Инициализируем асинхронный API клиент (общий пул соединений для всех команд)
+api_client = AsyncAPIClient()
 
 @bot.event
 async def on_ready():
@@ -131,12 +129,15 @@ async def code_command(interaction: discord.Interaction, code: str):
     try:
         logger.info(f"Пользователь {interaction.user.id} ({interaction.user.name}) пытается привязать аккаунт с кодом: {code}")
         
+        # Запросы к API могут быть долгими - откладываем ответ
+        await interaction.response.defer(ephemeral=True, thinking=True)
+        
         # Проверяем, не привязан ли уже аккаунт
-        user_data = api_client.get_user_by_discord_id(str(interaction.user.id))
+        user_data = await api_client.get_user_by_discord_id(str(interaction.user.id))
         logger.info(f"Результат проверки привязки: {user_data}")
         
         if user_data and not 'error' in user_data:
-            await interaction.response.send_message("Ваш Discord аккаунт уже привязан к аккаунту на сайте.", ephemeral=True)
+            await interaction.followup.send("Ваш Discord аккаунт уже привязан к аккаунту на сайте.", ephemeral=True)
             logger.info(f"Discord аккаунт {interaction.user.id} уже привязан")
             return
         
@@ -147,7 +148,7 @@ async def code_command(interaction: discord.Interaction, code: str):
         logger.info(f"Отправляем запрос на привязку с данными: code={code}, discord_id={interaction.user.id}, discord_username={discord_username}")
         
         # Отправляем запрос на привязку
-        result = api_client.bind_discord(
+        result = await api_client.bind_discord(
             code,
             str(interaction.user.id),
             discord_username,
@@ -157,52 +158,52 @@ async def code_command(interaction: discord.Interaction, code: str):
         logger.info(f"Результат привязки: {result}")
         
         if 'error' in result:
-            await interaction.response.send_message(f"Ошибка привязки аккаунта: {result.get('error')}", ephemeral=True)
+            await interaction.followup.send(f"Ошибка привязки аккаунта: {result.get('error')}", ephemeral=True)
             logger.error(f"Ошибка привязки для {interaction.user.id}: {result.get('error')}")
             return
         
-        await interaction.response.send_message("Аккаунт успешно привязан!", ephemeral=True)
+        await interaction.followup.send("Аккаунт успешно привязан!", ephemeral=True)
         await log_message(f"Пользователь {interaction.user.mention} привязал Discord-аккаунт к аккаунту на сайте")
         logger.info(f"Аккаунт {interaction.user.id} успешно привязан")
     except Exception as e:
         logger.error(f"Исключение при выполнении команды /code: {e}", exc_info=True)
-        try:
-            await interaction.response.send_message(f"Произошла ошибка при выполнении команды: {str(e)}", ephemeral=True)
-        except:
-            # Если не удалось отправить ответ через response, пробуем через followup
-            try:
-                await interaction.followup.send(f"Произошла ошибка при выполнении команды: {str(e)}", ephemeral=True)
-            except Exception as followup_error:
-                logger.error(f"Не удалось отправить сообщение об ошибке: {followup_error}")
-                pass
+        await send_error(interaction, f"Произошла ошибка при выполнении команды: {str(e)}")
 
 
 @bot.tree.command(name="redeem", description="Активировать ключ")
 @app_commands.describe(key="Ключ для активации")
 async def redeem_command(interaction: discord.Interaction, key: str):
     """Команда для активации ключа"""
+    # Запросы к API могут быть долгими - откладываем ответ
+    await interaction.response.defer(ephemeral=True, thinking=True)
+    
     # Проверяем наличие привязанного аккаунта
     user_id = str(interaction.user.id)
     
     # Получаем пользователя по discord_id
-    user_data = api_client.get_user_by_discord_id(user_id)
+    user_data = await api_client.get_user_by_discord_id(user_id)
     
     if 'error' in user_data or not user_data:
-        await interaction.response.send_message("Ваш Discord аккаунт не привязан к аккаунту на сайте. Используйте команду /code для получения кода привязки.", ephemeral=True)
+        await interaction.followup.send("Ваш Discord аккаунт не привязан к аккаунту на сайте. Используйте команду /code для получения кода привязки.", ephemeral=True)
         return
     
     # Отправляем запрос на API для активации ключа
     try:
-        result = api_client.activate_key(key, user_data.get('id'))
+        result = await api_client.activate_key(key, user_data.get('id'), user_id)
         
         if 'error' in result:
-            await interaction.response.send_message(f"Ошибка активации ключа: {result.get('error')}", ephemeral=True)
+            # Код с неверной контрольной группой отклоняется сериализатором: {'key_code': [сообщение]},
+            # отказ в доступе и ненайденный пользователь приходят в detail
+            error = result.get('key_code') or result.get('detail') or result.get('error')
+            if isinstance(error, list):
+                error = error[0]
+            await interaction.followup.send(f"Ошибка активации ключа: {error}", ephemeral=True)
             return
             
-        await interaction.response.send_message(f"Ключ успешно активирован!", ephemeral=True)
+        await interaction.followup.send(f"Ключ успешно активирован!", ephemeral=True)
         await log_message(f"Пользователь {interaction.user.mention} активировал ключ {key}")
     except Exception as e:
-        await interaction.response.send_message(f"Ошибка активации ключа: {str(e)}", ephemeral=True)
+        await send_error(interaction, f"Ошибка активации ключа: {str(e)}")
 
 
 @bot.tree.command(name="generate_key", description="Сгенерировать новый ключ (только для админов и модераторов)")
@@ -235,16 +236,19 @@ async def generate_key_command(
         else:  # lifetime
             duration_days = 0  # Бессрочно
     
+    # Запрос к API может быть долгим - откладываем ответ
+    await interaction.response.defer(ephemeral=True, thinking=True)
+    
     # Создаем ключ через API
-    result = api_client.create_key(key_type, duration_days)
+    result = await api_client.create_key(key_type, duration_days)
     
     if 'error' in result:
-        await interaction.response.send_message(f"Ошибка генерации ключа: {result.get('error')}", ephemeral=True)
+        await interaction.followup.send(f"Ошибка генерации ключа: {result.get('error')}", ephemeral=True)
         return
         
     key_code = result.get('key_code', 'Неизвестный ключ')
     
-    await interaction.response.send_message(f"Ключ успешно сгенерирован: `{key_code}`\nТип: {key_type}\nСрок действия: {duration_days} дней", ephemeral=True)
+    await interaction.followup.send(f"Ключ успешно сгенерирован: `{key_code}`\nТип: {key_type}\nСрок действия: {duration_days} дней", ephemeral=True)
     await log_message(f"Пользователь {interaction.user.mention} сгенерировал ключ типа {key_type}")
 
 
@@ -265,21 +269,24 @@ async def ban_command(interaction: discord.Interaction, user: discord.Member, re
         await interaction.response.send_message("Вы не можете заблокировать администратора.", ephemeral=True)
         return
     
+    # Запросы к API могут быть долгими - откладываем ответ
+    await interaction.response.defer(ephemeral=True, thinking=True)
+    
     # Получаем пользователя по discord_id
-    user_data = api_client.get_user_by_discord_id(str(user.id))
+    user_data = await api_client.get_user_by_discord_id(str(user.id))
     
     if 'error' in user_data or not user_data:
-        await interaction.response.send_message(f"Пользователь {user.mention} не найден в системе.", ephemeral=True)
+        await interaction.followup.send(f"Пользователь {user.mention} не найден в системе.", ephemeral=True)
         return
     
     # Блокируем пользователя через API
-    result = api_client.ban_user(user_data.get('id'), reason)
+    result = await api_client.ban_user(user_data.get('id'), reason)
     
     if 'error' in result:
-        await interaction.response.send_message(f"Ошибка блокировки пользователя: {result.get('error')}", ephemeral=True)
+        await interaction.followup.send(f"Ошибка блокировки пользователя: {result.get('error')}", ephemeral=True)
         return
     
-    await interaction.response.send_message(f"Пользователь {user.mention} заблокирован. Причина: {reason}", ephemeral=True)
+    await interaction.followup.send(f"Пользователь {user.mention} заблокирован. Причина: {reason}", ephemeral=True)
     await log_message(f"Пользователь {interaction.user.mention} заблокировал {user.mention}. Причина: {reason}")
 
 
@@ -294,21 +301,24 @@ async def unban_command(interaction: discord.Interaction, user: discord.Member):
         await interaction.response.send_message("У вас нет прав для выполнения этой команды.", ephemeral=True)
         return
     
+    # Запросы к API могут быть долгими - откладываем ответ
+    await interaction.response.defer(ephemeral=True, thinking=True)
+    
     # Получаем пользователя по discord_id
-    user_data = api_client.get_user_by_discord_id(str(user.id))
+    user_data = await api_client.get_user_by_discord_id(str(user.id))
     
     if 'error' in user_data or not user_data:
-        await interaction.response.send_message(f"Пользователь {user.mention} не найден в системе.", ephemeral=True)
+        await interaction.followup.send(f"Пользователь {user.mention} не найден в системе.", ephemeral=True)
         return
     
     # Разблокируем пользователя через API
-    result = api_client.unban_user(user_data.get('id'))
+    result = await api_client.unban_user(user_data.get('id'))
     
     if 'error' in result:
-        await interaction.response.send_message(f"Ошибка разблокировки пользователя: {result.get('error')}", ephemeral=True)
+        await interaction.followup.send(f"Ошибка разблокировки пользователя: {result.get('error')}", ephemeral=True)
         return
     
-    await interaction.response.send_message(f"Пользователь {user.mention} разблокирован.", ephemeral=True)
+    await interaction.followup.send(f"Пользователь {user.mention} разблокирован.", ephemeral=True)
     await log_message(f"Пользователь {interaction.user.mention} разблокировал {user.mention}")
 
 
@@ -327,18 +337,21 @@ async def stats_command(interaction: discord.Interaction, user: discord.Member =
         await interaction.response.send_message("У вас нет прав для просмотра статистики других пользователей.", ephemeral=True)
         return
     
+    # Запросы к API могут быть долгими - откладываем ответ
+    await interaction.response.defer(ephemeral=True, thinking=True)
+    
     # Получаем пользователя по discord_id
-    user_data = api_client.get_user_by_discord_id(str(user.id))
+    user_data = await api_client.get_user_by_discord_id(str(user.id))
     
     if 'error' in user_data or not user_data:
-        await interaction.response.send_message(f"Пользователь {user.mention} не найден в системе.", ephemeral=True)
+        await interaction.followup.send(f"Пользователь {user.mention} не найден в системе.", ephemeral=True)
         return
     
     # Получаем статистику пользователя
-    stats = api_client.get_user_stats(user_data.get('id'))
+    stats = await api_client.get_user_stats(user_data.get('id'))
     
     if 'error' in stats:
-        await interaction.response.send_message(f"Ошибка получения статистики: {stats.get('error')}", ephemeral=True)
+        await interaction.followup.send(f"Ошибка получения статистики: {stats.get('error')}", ephemeral=True)
         return
     
     # Создаем embed для отображения статистики
@@ -353,7 +366,7 @@ async def stats_command(interaction: discord.Interaction, user: discord.Member =
     if stats.get('is_banned'):
         embed.add_field(name="Статус", value="Заблокирован", inline=True)
     
-    await interaction.response.send_message(embed=embed, ephemeral=True)
+    await interaction.followup.send(embed=embed, ephemeral=True)
 
 
 # Вспомогательные функции
@@ -368,6 +381,17 @@ async def log_message(message):
                 logger.error(f"Ошибка отправки сообщения в лог-канал: {e}")
 
 
+async def send_error(interaction, message):
+    """Отправка сообщения об ошибке с учетом того, был ли уже отложен ответ"""
+    try:
+        if interaction.response.is_done():
+            await interaction.followup.send(message, ephemeral=True)
+        else:
+            await interaction.response.send_message(message, ephemeral=True)
+    except Exception as e:
+        logger.error(f"Не удалось отправить сообщение об ошибке: {e}")
+
+
 def has_permission(member, role_ids):
     """Проверка наличия у пользователя одной из ролей"""
     return any(role.id in role_ids for role in member.roles)
@@ -386,7 +410,7 @@ async def code_prefix_command(ctx, code: str = None):
         logger.info(f"Пользователь {ctx.author.id} ({ctx.author.name}) пытается привязать аккаунт с кодом: {code} (префиксная команда)")
         
         # Проверяем, не привязан ли уже аккаунт
-        user_data = api_client.get_user_by_discord_id(str(ctx.author.id))
+        user_data = await api_client.get_user_by_discord_id(str(ctx.author.id))
         logger.info(f"Результат проверки привязки: {user_data}")
         
         if user_data and not 'error' in user_data:
@@ -401,7 +425,7 @@ async def code_prefix_command(ctx, code: str = None):
         logger.info(f"Отправляем запрос на привязку с данными: code={code}, discord_id={ctx.author.id}, discord_username={discord_username}")
         
         # Отправляем запрос на привязку
-        result = api_client.bind_discord(
+        result = await api_client.bind_discord(
             code,
             str(ctx.author.id),
             discord_username,
@@ -487,9 +511,9 @@ async def api_check_command(ctx):
         
         try:
             # Проверяем базовый URL
-            response = requests.get(base_url, timeout=5)
-            message += f"\n**Базовый URL**\nСтатус: `{response.status_code}`\n"
-            message += f"Ответ: ```{response.text[:200]}...```\n" if len(response.text) > 200 else f"Ответ: ```{response.text}```\n"
+            status_code, text = await api_client.check_url(base_url)
+            message += f"\n**Базовый URL**\nСтатус: `{status_code}`\n"
+            message += f"Ответ: ```{text[:200]}...```\n" if len(text) > 200 else f"Ответ: ```{text}```\n"
             
             # Проверяем несколько ключевых эндпоинтов
             endpoints = [
@@ -508,8 +532,8 @@ async def api_check_command(ctx):
                 try:
                     endpoint_url = base_url + endpoint
                     logger.info(f"Проверка {endpoint_url}")
-                    endpoint_response = requests.get(endpoint_url, timeout=5)
-                    message += f"`{endpoint}`: Статус `{endpoint_response.status_code}`\n"
+                    endpoint_status, _ = await api_client.check_url(endpoint_url)
+                    message += f"`{endpoint}`: Статус `{endpoint_status}`\n"
                 except Exception as e:
                     message += f"`{endpoint}`: Ошибка - `{str(e)}`\n"
                     
@@ -577,10 +601,21 @@ async def force_bind_command(ctx, user: discord.Member, site_user_id: str):
         await ctx.send(f"Ошибка при ручной привязке: {str(e)}")
 
 
+async def main():
+    """Запуск бота с закрытием HTTP-сессии API клиента при остановке"""
+    try:
+        async with bot:
+            await bot.start(BOT_TOKEN)
+    finally:
+        await api_client.close()
+
+
 # Запуск бота
 if __name__ == "__main__":
     try:
-        bot.run(BOT_TOKEN)
+        asyncio.run(main())
+    except KeyboardInterrupt:
+        logger.info("Бот остановлен")
     except Exception as e:
         logger.error(f"Ошибка запуска бота: {e}")
         sys.exit(1) 
\ No newline at end of file
@@ -0,0 +1,106 @@
+#!/usr/bin/env python
+"""
+Нагрузочная проверка атомарной активации ключей (Key.objects.redeem).
+Создает набор ключей и пользователей, после чего параллельные потоки пытаются
+активировать одни и те же коды. Каждый ключ должен быть активирован ровно один раз.
+Используйте: python bench_redeem.py [--workers 200] [--keys 100] [--attempts 20]
+
+Каждый поток держит собственное соединение с PostgreSQL, поэтому max_connections
+должен быть больше количества потоков.
+"""
+
+import os
+import sys
+import time
+import argparse
+import threading
+import django
+from concurrent.futures import ThreadPoolExecutor
+from collections import Counter
+from dotenv import load_dotenv
+
+# Добавляем путь к Django проекту
+sys.path.append(os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'web'))
+
+# Загружаем переменные окружения
+load_dotenv(os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'config', '.env'))
+
+# Настраиваем Django
+os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'zalupaspb.settings')
+django.setup()
+
+from django.db import connection
+from django.contrib.auth import get_user_model
+from keys.models import Key, KeyHistory
+
+User = get_user_model()
+
+
+def prepare(keys_count, workers):
+    """Создает ключи и пользователей для теста"""
+    users = [
+        User.objects.get_or_create(username=f'bench_redeem_{i}')[0]
+        for i in range(workers)
+    ]
+    keys = Key.bulk_generate(keys_count, notes='bench_redeem')
+    return users, [key.key_code for key in keys]
+
+
+def cleanup(key_codes):
+    """Удаляет тестовые ключи и пользователей"""
+    Key.objects.filter(key_code__in=key_codes).delete()
+    User.objects.filter(username__startswith='bench_redeem_').delete()
+
+
+def main():
+    """Основная функция скрипта"""
+    parser = argparse.ArgumentParser(description='Проверка конкурентной активации ключей')
+    parser.add_argument('--workers', type=int, default=200, help='Количество параллельных потоков')
+    parser.add_argument('--keys', type=int, default=100, help='Количество ключей')
+    parser.add_argument('--attempts', type=int, default=20, help='Попыток активации на поток')
+    args = parser.parse_args()
+
+    users, key_codes = prepare(args.keys, args.workers)
+    barrier = threading.Barrier(args.workers)
+
+    def worker(index):
+        user = users[index]
+        results = []
+        barrier.wait()
+        try:
+            for attempt in range(args.attempts):
+                # Все потоки перебирают одни и те же коды, чтобы максимизировать конкуренцию
+                key_code = key_codes[(index + attempt) % len(key_codes)]
+                key = Key.objects.redeem(user, key_code=key_code)
+                results.append((key_code, key is not None))
+        finally:
+            connection.close()
+        return results
+
+    started = time.monotonic()
+    with ThreadPoolExecutor(max_workers=args.workers) as executor:
+        all_results = [result for results in executor.map(worker, range(args.workers)) for result in results]
+    elapsed = time.monotonic() - started
+
+    successes = Counter(key_code for key_code, ok in all_results if ok)
+    double_redeemed = [key_code for key_code, count in successes.items() if count > 1]
+    history_count = KeyHistory.objects.filter(
+        key__key_code__in=key_codes,
+        action=KeyHistory.ActionType.ACTIVATED
+    ).count()
+
+    print(f"Попыток активации: {len(all_results)} за {elapsed:.2f} с ({len(all_results) / elapsed:.0f} в секунду)")
+    print(f"Успешных активаций: {sum(successes.values())} из {len(key_codes)} ключей")
+    print(f"Записей истории ACTIVATED: {history_count}")
+
+    cleanup(key_codes)
+
+    if double_redeemed or history_count != sum(successes.values()):
+        print(f"ОШИБКА: ключи активированы повторно: {double_redeemed}")
+        sys.exit(1)
+
+    print("Повторных активаций нет")
+
+
+if __name__ == "__main__":
+    main()
@@ -1,15 +1,65 @@
-from django.db import models
+from django.db import models, transaction
 from django.utils.translation import gettext_lazy as _
 from django.utils import timezone
 from django.conf import settings
+from zalupaspb.tracking import FieldTrackerMixin
 import uuid
 import string
 import random
 
 
-class Invite(models.Model):
+class InviteQuerySet(models.QuerySet):
+    """Набор запросов для инвайтов с массовыми операциями"""
+    
+    def with_effective_status(self, now=None):
+        """
+        Добавляет аннотацию effective_status - статус с учетом истечения срока,
+        вычисленный в SQL без записи в базу.
+        """
+        now = now or timezone.now()
+        return self.annotate(
+            effective_status=models.Case(
+                models.When(
+                    status=Invite.InviteStatus.ACTIVE,
+                    expires_at__lt=now,
+                    then=models.Value(Invite.InviteStatus.EXPIRED),
+                ),
+                default=models.F('status'),
+                output_field=models.CharField(),
+            )
+        )
+    
+    def expire_overdue(self, batch_size=1000, now=None):
+        """
+        Переводит просроченные инвайты в статус EXPIRED пачками.
+        Возвращает количество истекших инвайтов.
+        """
+        now = now or timezone.now()
+        total = 0
+        
+        while True:
+            with transaction.atomic():
+                ids = list(
+                    self.filter(status=Invite.InviteStatus.ACTIVE, expires_at__lt=now)
+                    .order_by()
+                    .select_for_update(skip_locked=True)
+                    .values_list('id', flat=True)[:batch_size]
+                )
+                if not ids:
+                    break
+                
+                self.model.objects.filter(id__in=ids).update(status=Invite.InviteStatus.EXPIRED)
+            total += len(ids)
+        
+        return total
+
+
+class Invite(FieldTrackerMixin, models.Model):
     """Модель инвайт-кода для регистрации новых пользователей"""
     
+    # Поля, изменения которых отслеживаются сигналами без повторного чтения из базы
+    tracked_fields = ('status',)
+    
     class InviteStatus(models.TextChoices):
         ACTIVE = 'active', _('Активный')
         USED = 'used', _('Использован')
@@ -50,10 +100,22 @@ class Invite(models.Model):
     # Срок действия инвайта (по умолчанию 7 дней)
     expires_at = models.DateTimeField(verbose_name=_('Истекает'))
     
+    objects = InviteQuerySet.as_manager()
+    
     class Meta:
         verbose_name = _('Инвайт')
         verbose_name_plural = _('Инвайты')
         ordering = ['-created_at']
+        indexes = [
+            # Составной индекс для курсорной пагинации по (created_at, id)
+            models.Index(fields=['-created_at', '-id'], name='invites_created_id_idx'),
+            # Частичный индекс для поиска просроченных инвайтов фоновой очисткой
+            models.Index(
+                fields=['expires_at'],
+                name='invites_active_expires_idx',
+                condition=models.Q(status='active'),
+            ),
+        ]
     
     def __str__(self):
         return f"{self.code} ({self.created_by.username})"
@@ -71,7 +133,7 @@ class Invite(models.Model):
     
     def use(self, user, ip_address=None):
         """Использование инвайта пользователем"""
-        if self.status != self.InviteStatus.ACTIVE:
+        if self.current_status != self.InviteStatus.ACTIVE:
             return False
         
         self.used_by = user
@@ -104,11 +166,17 @@ class Invite(models.Model):
                 self.save()
         return self.status
     
+    @property
+    def current_status(self):
+        """Статус с учетом истечения срока (без записи в базу)"""
+        if self.status == self.InviteStatus.ACTIVE and timezone.now() > self.expires_at:
+            return self.InviteStatus.EXPIRED
+        return self.status
+    
     @property
     def is_active(self):
         """Проверка активности инвайта"""
-        self.check_expiry()
-        return self.status == self.InviteStatus.ACTIVE
+        return self.current_status == self.InviteStatus.ACTIVE
     
     @classmethod
     def generate_code(cls):
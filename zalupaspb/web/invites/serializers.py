@@ -6,6 +6,7 @@ class InviteSerializer(serializers.ModelSerializer):
     """Сериализатор для модели Invite"""
     created_by_username = serializers.SerializerMethodField()
     used_by_username = serializers.SerializerMethodField()
+    status = serializers.SerializerMethodField()
     status_display = serializers.SerializerMethodField()
     is_active = serializers.SerializerMethodField()
     remaining_time = serializers.SerializerMethodField()
@@ -28,18 +29,22 @@ class InviteSerializer(serializers.ModelSerializer):
             return obj.used_by.username
         return None
     
+    def get_status(self, obj):
+        """Статус инвайта с учетом истечения срока (аннотация with_effective_status)"""
+        return getattr(obj, 'effective_status', None) or obj.current_status
+    
     def get_status_display(self, obj):
         """Получение отображаемого значения статуса инвайта"""
-        return obj.get_status_display()
+        return Invite.InviteStatus(self.get_status(obj)).label
     
     def get_is_active(self, obj):
         """Проверка активности инвайта"""
-        return obj.is_active
+        return self.get_status(obj) == Invite.InviteStatus.ACTIVE
     
     def get_remaining_time(self, obj):
         """Получение оставшегося времени действия инвайта в часах"""
         from django.utils import timezone
-        if not obj.is_active:
+        if not self.get_is_active(obj):
             return 0
         
         delta = obj.expires_at - timezone.now()
@@ -12,16 +12,10 @@ def invite_post_save(sender, instance, created, **kwargs):
     if created:
         # Логируем создание инвайта
         logger.info(f"Invite {instance.code} created by {instance.created_by.username}")
-    else:
-        # Проверяем изменение статуса
-        try:
-            old_instance = Invite.objects.get(pk=instance.pk)
-            if old_instance.status != instance.status:
-                # Логируем изменение статуса
-                logger.info(f"Invite {instance.code} status changed from {old_instance.status} to {instance.status}")
-                
-                # Дополнительная логика при использовании инвайта
-                if instance.status == Invite.InviteStatus.USED and instance.used_by:
-                    logger.info(f"Invite {instance.code} used by {instance.used_by.username}")
-        except Invite.DoesNotExist:
-            pass 
\ No newline at end of file
+    elif instance.has_changed('status'):
+        # Логируем изменение статуса
+        logger.info(f"Invite {instance.code} status changed from {instance.previous('status')} to {instance.status}")
+        
+        # Дополнительная логика при использовании инвайта
+        if instance.status == Invite.InviteStatus.USED and instance.used_by:
+            logger.info(f"Invite {instance.code} used by {instance.used_by.username}") 
\ No newline at end of file
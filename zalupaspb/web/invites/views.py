@@ -3,31 +3,36 @@ from rest_framework.response import Response
 from rest_framework.views import APIView
 from django.shortcuts import get_object_or_404
 from django.utils import timezone
+from zalupaspb.pagination import KeysetPagination
+from zalupaspb.ratelimit import get_rate_limiter, request_identities
 from .models import Invite
 from .serializers import InviteSerializer, InviteCreateSerializer, InviteValidateSerializer
 import logging
 
 logger = logging.getLogger('invites')
 
+# Ограничение подбора инвайт-кодов
+invite_validate_limiter = get_rate_limiter('invite_validate')
+
 
 class InviteListView(generics.ListAPIView):
     """Список инвайтов текущего пользователя"""
     serializer_class = InviteSerializer
     permission_classes = [permissions.IsAuthenticated]
+    keyset_ordering = ('created_at', 'id')  # курсорная пагинация по ?cursor=
     
     def get_queryset(self):
         """Получение списка инвайтов с фильтрацией"""
         # Для админов и модераторов показываем все инвайты
-        if self.request.user.role in ['admin', 'moderator']:
-            queryset = Invite.objects.all()
-        else:
+        queryset = Invite.objects.with_effective_status().select_related('created_by', 'used_by')
+        if self.request.user.role not in ['admin', 'moderator']:
             # Для обычных пользователей только их инвайты
-            queryset = Invite.objects.filter(created_by=self.request.user)
+            queryset = queryset.filter(created_by=self.request.user)
         
-        # Фильтрация по статусу
+        # Фильтрация по статусу (с учетом истечения срока)
         status = self.request.query_params.get('status')
         if status:
-            queryset = queryset.filter(status=status)
+            queryset = queryset.filter(effective_status=status)
         
         return queryset
 
@@ -35,20 +40,27 @@ class InviteListView(generics.ListAPIView):
 class InviteCreateView(APIView):
     """Создание нового инвайта и получение списка инвайтов"""
     permission_classes = [permissions.IsAuthenticated]
+    keyset_ordering = ('created_at', 'id')
     
     def get(self, request, *args, **kwargs):
         """Получение списка инвайтов (перенаправляем на функционал InviteListView)"""
         # Для админов и модераторов показываем все инвайты
-        if request.user.role in ['admin', 'moderator']:
-            queryset = Invite.objects.all()
-        else:
+        queryset = Invite.objects.with_effective_status().select_related('created_by', 'used_by')
+        if request.user.role not in ['admin', 'moderator']:
             # Для обычных пользователей только их инвайты
-            queryset = Invite.objects.filter(created_by=request.user)
+            queryset = queryset.filter(created_by=request.user)
         
-        # Фильтрация по статусу
+        # Фильтрация по статусу (с учетом истечения срока)
         status_param = request.query_params.get('status')
         if status_param:
-            queryset = queryset.filter(status=status_param)
+            queryset = queryset.filter(effective_status=status_param)
+        
+        # С параметром cursor список отдается страницами, без него - целиком, как раньше
+        if KeysetPagination.cursor_query_param in request.query_params:
+            paginator = KeysetPagination()
+            page = paginator.paginate_queryset(queryset, request, view=self)
+            serializer = InviteSerializer(page, many=True)
+            return paginator.get_paginated_response(serializer.data)
         
         serializer = InviteSerializer(queryset, many=True)
         return Response(serializer.data)
@@ -96,11 +108,12 @@ class InviteDetailView(generics.RetrieveAPIView):
     permission_classes = [permissions.IsAuthenticated]
     
     def get_queryset(self):
+        queryset = Invite.objects.with_effective_status().select_related('created_by', 'used_by')
         # Для админов и модераторов показываем все инвайты
         if self.request.user.role in ['admin', 'moderator']:
-            return Invite.objects.all()
+            return queryset
         # Для обычных пользователей только их инвайты
-        return Invite.objects.filter(created_by=self.request.user)
+        return queryset.filter(created_by=self.request.user)
 
 
 class InviteRevokeView(APIView):
@@ -139,17 +152,29 @@ class InviteValidateView(APIView):
     
     def post(self, request, *args, **kwargs):
         """Проверка валидности инвайт-кода"""
+        # Эндпоинт доступен без входа - ограничиваем подбор кодов по IP до запросов к базе
+        identities = request_identities(request)
+        retry_after = invite_validate_limiter.check(identities)
+        if retry_after:
+            return Response(
+                {'valid': False, 'error': 'Слишком много неудачных попыток, попробуйте позже'},
+                status=status.HTTP_429_TOO_MANY_REQUESTS,
+                headers={'Retry-After': str(retry_after)}
+            )
+        
         serializer = InviteValidateSerializer(data=request.data)
         
         if serializer.is_valid():
             code = serializer.validated_data['code']
             try:
-                invite = Invite.objects.get(code=code)
+                invite = Invite.objects.select_related('created_by').get(code=code)
                 if invite.is_active:
                     return Response({'valid': True, 'created_by': invite.created_by.username})
                 else:
+                    invite_validate_limiter.register_failure(identities)
                     return Response({'valid': False, 'error': 'Инвайт-код не активен или уже использован'})
             except Invite.DoesNotExist:
+                invite_validate_limiter.register_failure(identities)
                 return Response({'valid': False, 'error': 'Инвайт-код не существует'})
         
         return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST) 
\ No newline at end of file
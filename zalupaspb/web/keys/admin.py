@@ -1,28 +1,29 @@
 from django.contrib import admin
 from django.utils.translation import gettext_lazy as _
-from django.utils.html import format_html
+from django.utils.html import format_html, format_html_join
 from django.shortcuts import render, redirect
-from django.urls import path
+from django.urls import path, reverse
+from django.http import FileResponse, Http404
 from django import forms
 from .models import Key, KeyHistory, Loader
-
-
-class KeyHistoryInline(admin.TabularInline):
-    model = KeyHistory
-    extra = 0
-    readonly_fields = ['action', 'user', 'timestamp', 'details']
-    can_delete = False
-    
-    def has_add_permission(self, request, obj=None):
-        return False
+from .importer import get_report_path, import_key_codes
+from .history import get_key_history
+from .downloads import loader_cache
+import os
 
 
 class BulkKeyCreationForm(forms.Form):
     """Форма для массового создания ключей"""
     key_codes = forms.CharField(
         widget=forms.Textarea(attrs={'rows': 10, 'cols': 40}),
+        required=False,
         help_text='Введите ключи по одному на строку. Пустые строки будут пропущены.'
     )
+    file = forms.FileField(
+        required=False,
+        label='Файл',
+        help_text='CSV или TXT в UTF-8, код ключа в первой колонке. Используется вместо поля выше.'
+    )
     key_type = forms.ChoiceField(
         choices=Key.KeyType.choices,
         initial=Key.KeyType.STANDARD
@@ -36,6 +37,12 @@ class BulkKeyCreationForm(forms.Form):
         widget=forms.Textarea(attrs={'rows': 3, 'cols': 40}),
         required=False
     )
+    
+    def clean(self):
+        cleaned_data = super().clean()
+        if not cleaned_data.get('file') and not (cleaned_data.get('key_codes') or '').strip():
+            raise forms.ValidationError('Введите коды ключей или загрузите файл')
+        return cleaned_data
 
 
 @admin.register(Key)
@@ -44,9 +51,10 @@ class KeyAdmin(admin.ModelAdmin):
     list_filter = ('key_type', 'status', 'created_at')
     search_fields = ('key_code', 'key', 'activated_by__username', 'created_by__username')
     date_hierarchy = 'created_at'
-    readonly_fields = ('key', 'id', 'created_at', 'activated_at')
+    readonly_fields = ('key', 'id', 'created_at', 'activated_at', 'history_preview')
     actions = ['revoke_keys']
-    inlines = [KeyHistoryInline]
+    # Количество записей истории на странице ключа (история не загружается целиком)
+    history_preview_size = 20
     fieldsets = (
         (_('Основная информация'), {
             'fields': ('id', 'key', 'key_code', 'key_type', 'status', 'notes')
@@ -63,50 +71,43 @@ class KeyAdmin(admin.ModelAdmin):
         urls = super().get_urls()
         custom_urls = [
             path('bulk-create/', self.admin_site.admin_view(self.bulk_create_keys), name='bulk_create_keys'),
+            path(
+                'bulk-create/report/<str:report_id>/',
+                self.admin_site.admin_view(self.import_report),
+                name='bulk_create_keys_report'
+            ),
         ]
         return custom_urls + urls
     
     def bulk_create_keys(self, request):
-        """Массовое создание ключей"""
+        """Массовое создание ключей из списка или файла (через COPY, см. keys.importer)"""
         if request.method == 'POST':
-            form = BulkKeyCreationForm(request.POST)
+            form = BulkKeyCreationForm(request.POST, request.FILES)
             if form.is_valid():
-                key_codes = form.cleaned_data['key_codes'].strip().split('\n')
-                key_type = form.cleaned_data['key_type']
-                duration_days = form.cleaned_data['duration_days']
-                notes = form.cleaned_data['notes']
+                upload = form.cleaned_data['file']
+                lines = upload if upload else form.cleaned_data['key_codes'].splitlines()
                 
-                created_count = 0
-                errors = []
+                result = import_key_codes(
+                    lines,
+                    key_type=form.cleaned_data['key_type'],
+                    duration_days=form.cleaned_data['duration_days'],
+                    created_by=request.user,
+                    notes=form.cleaned_data['notes'] or None,
+                )
                 
-                for key_code in key_codes:
-                    key_code = key_code.strip()
-                    if not key_code:
-                        continue
-                    
-                    # Проверяем, не существует ли уже такой ключ
-                    if Key.objects.filter(key_code=key_code).exists():
-                        errors.append(f"Ключ '{key_code}' уже существует.")
-                        continue
-                    
-                    try:
-                        Key.objects.create(
-                            key_code=key_code,
-                            key_type=key_type,
-                            duration_days=duration_days,
-                            notes=notes,
-                            created_by=request.user
-                        )
-                        created_count += 1
-                    except Exception as e:
-                        errors.append(f"Ошибка при создании ключа '{key_code}': {str(e)}")
+                if result.created > 0:
+                    self.message_user(request, f"Успешно создано {result.created} ключей.")
                 
-                if created_count > 0:
-                    self.message_user(request, f"Успешно создано {created_count} ключей.")
-                
-                if errors:
-                    for error in errors:
-                        self.message_user(request, error, level='error')
+                if result.rejected:
+                    report_url = reverse('admin:bulk_create_keys_report', args=[result.report_id])
+                    self.message_user(
+                        request,
+                        format_html(
+                            'Отклонено строк: {}. <a href="{}">Скачать отчет</a>',
+                            result.rejected, report_url
+                        ),
+                        level='error'
+                    )
                 
                 return redirect('..')
         else:
@@ -119,6 +120,39 @@ class KeyAdmin(admin.ModelAdmin):
         }
         return render(request, 'admin/keys/bulk_create_keys.html', context)
 
+    def import_report(self, request, report_id):
+        """Скачивание отчета об отклоненных строках импорта"""
+        report_path = get_report_path(report_id)
+        if report_path is None or not os.path.exists(report_path):
+            raise Http404
+        return FileResponse(open(report_path, 'rb'), as_attachment=True, filename=f'key-import-{report_id}.csv')
+
+    def get_fieldsets(self, request, obj=None):
+        """История показывается только для существующего ключа"""
+        fieldsets = super().get_fieldsets(request, obj)
+        if obj:
+            fieldsets = fieldsets + ((_('История'), {'fields': ('history_preview',)}),)
+        return fieldsets
+    
+    def history_preview(self, obj):
+        """Последние записи истории ключа (с учетом архива) и ссылка на полную историю"""
+        entries, has_more = get_key_history(obj.pk, limit=self.history_preview_size)
+        if not entries:
+            return '-'
+        rows = format_html_join(
+            '', '<tr><td>{}</td><td>{}</td><td>{}</td><td>{}</td></tr>',
+            (
+                (entry.timestamp.strftime('%Y-%m-%d %H:%M'), entry.get_action_display(), entry.user or '-', entry.details or '')
+                for entry in entries
+            )
+        )
+        link = ''
+        if has_more:
+            url = reverse('admin:keys_keyhistory_changelist') + f'?key__id__exact={obj.pk}'
+            link = format_html('<p><a href="{}">Вся история ключа</a></p>', url)
+        return format_html('<table>{}</table>{}', rows, link)
+    history_preview.short_description = _('Последние действия')
+    
     def get_readonly_fields(self, request, obj=None):
         """Динамически определяем readonly_fields для избежания проблем с property-полями"""
         if obj:  # Если редактируем существующий объект
@@ -127,11 +161,8 @@ class KeyAdmin(admin.ModelAdmin):
             return ('key', 'id', 'created_at', 'activated_at')
     
     def revoke_keys(self, request, queryset):
-        updated = 0
-        for key in queryset:
-            if key.status == 'active' or key.status == 'used':
-                key.revoke()
-                updated += 1
+        # Один UPDATE на пачку ключей вместо save() каждого (см. KeyQuerySet.bulk_set_status)
+        updated = queryset.bulk_set_status(Key.KeyStatus.REVOKED, user=request.user)
         self.message_user(request, f'Отозвано {updated} ключей.')
     revoke_keys.short_description = "Отозвать выбранные ключи"
     
@@ -160,6 +191,9 @@ class KeyHistoryAdmin(admin.ModelAdmin):
     search_fields = ('key__key_code', 'key__key', 'user__username')
     date_hierarchy = 'timestamp'
     readonly_fields = ('key', 'action', 'user', 'timestamp', 'details')
+    list_select_related = ('key', 'user')
+    # Без COUNT(*) по всей таблице истории при фильтрации
+    show_full_result_count = False
     
     def key_display(self, obj):
         """Отображение кода ключа вместо внутреннего ID"""
@@ -175,7 +209,7 @@ class LoaderAdmin(admin.ModelAdmin):
     list_filter = ('version_type', 'is_active', 'upload_date')
     search_fields = ('name', 'version', 'description')
     date_hierarchy = 'upload_date'
-    readonly_fields = ('upload_date', 'uploaded_by', 'download_count')
+    readonly_fields = ('upload_date', 'uploaded_by', 'download_count', 'checksum')
     actions = ['make_active', 'make_inactive']
     
     def save_model(self, request, obj, form, change):
@@ -187,10 +221,12 @@ class LoaderAdmin(admin.ModelAdmin):
         # При активации одного лоадера, деактивируем все остальные
         Loader.objects.all().update(is_active=False)
         updated = queryset.update(is_active=True)
+        loader_cache.invalidate()
         self.message_user(request, f'Активирован {updated} лоадер. Все остальные деактивированы.')
     make_active.short_description = "Сделать активным (деактивирует все остальные)"
     
     def make_inactive(self, request, queryset):
         updated = queryset.update(is_active=False)
+        loader_cache.invalidate()
         self.message_user(request, f'Деактивировано {updated} лоадеров.')
     make_inactive.short_description = "Деактивировать выбранные лоадеры" 
\ No newline at end of file
@@ -0,0 +1,132 @@
+import re
+import hmac
+import hashlib
+import secrets
+from collections import namedtuple
+from functools import lru_cache
+from django.conf import settings
+
+
+# Crockford base32: без I, L, O, U, чтобы код было проще переписать вручную
+CODE_ALPHABET = '0123456789ABCDEFGHJKMNPQRSTVWXYZ'
+CODE_VALUES = {char: value for value, char in enumerate(CODE_ALPHABET)}
+
+# Префикс версии формата. Коды без префикса - старые
+CODE_VERSION_PREFIX = 'K2-'
+
+# Старый формат: три группы по 4 символа A-Z0-9 (ABCD-1234-XYZ9)
+LEGACY_CODE_RE = re.compile(r'^[A-Z0-9]{4}-[A-Z0-9]{4}-[A-Z0-9]{4}$')
+
+# Похожие символы при ручном вводе приводятся к символам алфавита
+CONFUSABLES = str.maketrans({'I': '1', 'L': '1', 'O': '0'})
+
+# Тип ключа в заголовке кода ('0' - тип не закодирован)
+KEY_TYPE_CODES = {'standard': '1', 'premium': '2', 'lifetime': '3'}
+KEY_TYPES_BY_CODE = {code: key_type for key_type, code in KEY_TYPE_CODES.items()}
+
+# Длительность кодируется тремя символами ('000' - не закодирована)
+MAX_ENCODED_DURATION = len(CODE_ALPHABET) ** 3 - 1
+
+KeyCodeInfo = namedtuple('KeyCodeInfo', ['version', 'key_type', 'duration_days'])
+
+LEGACY_CODE = KeyCodeInfo(1, None, None)
+
+
+@lru_cache(maxsize=1)
+def _checksum_key():
+    """
+    Ключ HMAC для контрольной группы кода.
+    Берется из KEY_CODE_SECRET, иначе выводится из SECRET_KEY. При смене ключа
+    ранее выданные коды нового формата перестают проходить проверку.
+    """
+    secret = getattr(settings, 'KEY_CODE_SECRET', None) or f'key-code:{settings.SECRET_KEY}'
+    return hashlib.sha256(secret.encode('utf-8')).digest()
+
+
+def _encode(number, length):
+    """Число в base32 фиксированной длины"""
+    chars = []
+    for _ in range(length):
+        number, remainder = divmod(number, len(CODE_ALPHABET))
+        chars.append(CODE_ALPHABET[remainder])
+    return ''.join(reversed(chars))
+
+
+def _decode(chars):
+    """base32 в число"""
+    number = 0
+    for char in chars:
+        number = number * len(CODE_ALPHABET) + CODE_VALUES[char]
+    return number
+
+
+def _checksum(body):
+    """Контрольная группа: первые 20 бит HMAC-SHA256 от остальной части кода"""
+    digest = hmac.new(_checksum_key(), body.encode('ascii'), hashlib.sha256).digest()
+    return _encode(int.from_bytes(digest[:3], 'big') >> 4, 4)
+
+
+def generate_key_code(key_type=None, duration_days=None):
+    """
+    Новый код ключа вида K2-TDDD-XXXX-XXXX-CCCC:
+    T - тип ключа, DDD - длительность в днях, XXXX-XXXX - 40 случайных бит,
+    CCCC - контрольная группа. Уникальность кода не проверяется.
+    """
+    header = KEY_TYPE_CODES.get(key_type, '0')
+    if duration_days and 0 < duration_days <= MAX_ENCODED_DURATION:
+        header += _encode(duration_days, 3)
+    else:
+        header += '000'
+
+    random_part = ''.join(secrets.choice(CODE_ALPHABET) for _ in range(8))
+    body = f'{CODE_VERSION_PREFIX}{header}-{random_part[:4]}-{random_part[4:]}'
+    return f'{body}-{_checksum(body)}'
+
+
+def normalize_key_code(key_code):
+    """
+    Приведение введенного кода к виду, в котором он хранится.
+    Коды нового формата не зависят от регистра, старые коды не меняются.
+    """
+    key_code = key_code.strip()
+    if key_code[:len(CODE_VERSION_PREFIX)].upper() == CODE_VERSION_PREFIX:
+        key_code = CODE_VERSION_PREFIX + key_code[len(CODE_VERSION_PREFIX):].upper().translate(CONFUSABLES)
+    return key_code
+
+
+def parse_key_code(key_code):
+    """
+    Проверка кода без обращения к базе.
+    Возвращает KeyCodeInfo или None, если код не может существовать: неверная структура
+    или контрольная группа кода нового формата, строка без префикса не в старом формате
+    XXXX-XXXX-XXXX, либо старый код при KEY_CODE_ACCEPT_LEGACY = False.
+    Код должен быть предварительно приведен через normalize_key_code.
+    """
+    if not key_code.startswith(CODE_VERSION_PREFIX):
+        if not getattr(settings, 'KEY_CODE_ACCEPT_LEGACY', True):
+            return None
+        if not LEGACY_CODE_RE.match(key_code):
+            return None
+        return LEGACY_CODE
+
+    groups = key_code[len(CODE_VERSION_PREFIX):].split('-')
+    if len(groups) != 4 or any(len(group) != 4 for group in groups):
+        return None
+    if any(char not in CODE_VALUES for group in groups for char in group):
+        return None
+
+    body, checksum = key_code.rsplit('-', 1)
+    if not hmac.compare_digest(_checksum(body), checksum):
+        return None
+
+    header = groups[0]
+    return KeyCodeInfo(
+        version=2,
+        key_type=KEY_TYPES_BY_CODE.get(header[0]),
+        duration_days=_decode(header[1:]) or None,
+    )
+
+
+def is_valid_key_code(key_code):
+    """Может ли код существовать (см. parse_key_code)"""
+    return parse_key_code(key_code) is not None
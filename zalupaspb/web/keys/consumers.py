@@ -1,11 +1,32 @@
 import json
+import uuid
+import asyncio
+from collections import OrderedDict
 from channels.generic.websocket import AsyncWebsocketConsumer
 from channels.db import database_sync_to_async
+from asgiref.sync import sync_to_async
 from django.utils import timezone
+from collections import Counter
+from .notifications import KEY_STATUS_GROUP, KEY_INVENTORY_GROUP, key_group, key_type_group
+from .subscriptions import key_subscriptions
 
 
 class KeyStatusConsumer(AsyncWebsocketConsumer):
-    """WebSocket потребитель для обновлений статуса ключей"""
+    """
+    WebSocket потребитель для обновлений статуса ключей.
+    После подключения сокет получает обновления всех ключей. Первое сообщение subscribe
+    или unsubscribe переводит его на выборочную подписку: обновления приходят только
+    по ключам и типам ключей из подписки (или всем, если передано "all": true).
+    Изменения счетчиков ключей приходят сокетам, подписанным на все обновления
+    или на счетчики ("inventory": true).
+    """
+    
+    # Ограничения на количество подписок сокета и id в одном запросе статусов
+    max_subscriptions = 1000
+    max_status_ids = 1000
+    
+    # Сколько последних event_id помнить для отбрасывания повторов из разных групп
+    recent_events_size = 1000
     
     async def connect(self):
         """Обработка подключения к WebSocket"""
@@ -22,44 +43,152 @@ class KeyStatusConsumer(AsyncWebsocketConsumer):
             await self.close()
             return
         
-        # Подключаем пользователя к группе обновлений статуса ключей
-        await self.channel_layer.group_add(
-            'key_status_updates',
-            self.channel_name
-        )
+        # Подписки сокета: группы отдельных ключей и типов, все ключи - до первого subscribe
+        self.groups_joined = set()
+        await self._join([KEY_STATUS_GROUP])
+        self.selective = False
+        self.recent_events = OrderedDict()
         
         await self.accept()
     
     async def disconnect(self, close_code):
         """Обработка отключения от WebSocket"""
-        # Отключаем пользователя от группы обновлений статуса
-        await self.channel_layer.group_discard(
-            'key_status_updates',
-            self.channel_name
-        )
+        # Отключаем сокет от всех групп, на которые он подписан
+        await self._leave(getattr(self, 'groups_joined', set()))
     
     async def receive(self, text_data):
         """Обработка сообщений от клиента"""
         try:
             data = json.loads(text_data)
-            
-            # Обрабатываем запрос на получение статуса ключа
-            if data.get('action') == 'get_key_status' and data.get('key_id'):
-                key_status = await self.get_key_status(data['key_id'])
-                
-                if key_status:
-                    await self.send(text_data=json.dumps({
-                        'type': 'key_status_response',
-                        'key_id': data['key_id'],
-                        'status': key_status['status'],
-                        'remaining_days': key_status['remaining_days'],
-                        'timestamp': timezone.now().isoformat(),
-                    }))
         except json.JSONDecodeError:
-            pass
+            return
+        if not isinstance(data, dict):
+            return
+        
+        action = data.get('action')
+        
+        # Обрабатываем запрос на получение статуса ключа
+        if action == 'get_key_status' and data.get('key_id'):
+            key_status = await self.get_key_status(data['key_id'])
+            
+            if key_status:
+                await self.send(text_data=json.dumps({
+                    'type': 'key_status_response',
+                    'key_id': data['key_id'],
+                    'status': key_status['status'],
+                    'remaining_days': key_status['remaining_days'],
+                    'timestamp': timezone.now().isoformat(),
+                }))
+        
+        # Статусы списка ключей одним запросом
+        elif action == 'get_key_statuses':
+            key_ids = self._parse_key_ids(data.get('key_ids'))
+            if key_ids is None or len(key_ids) > self.max_status_ids:
+                await self.send_error(f'key_ids должен быть списком не более чем из {self.max_status_ids} id ключей')
+                return
+            
+            statuses = await self.get_key_statuses(key_ids)
+            await self.send(text_data=json.dumps({
+                'type': 'key_statuses_response',
+                'keys': statuses,
+                'missing': [key_id for key_id in key_ids if key_id not in statuses],
+                'timestamp': timezone.now().isoformat(),
+            }))
+        
+        elif action in ('subscribe', 'unsubscribe'):
+            await self.update_subscription(action, data)
+    
+    async def update_subscription(self, action, data):
+        """Подписка на ключи и типы ключей или отписка от них"""
+        from .models import Key
+        
+        key_ids = self._parse_key_ids(data.get('key_ids', []))
+        key_types = data.get('key_types', [])
+        if key_ids is None:
+            await self.send_error('key_ids должен быть списком id ключей')
+            return
+        if not isinstance(key_types, list) or any(key_type not in Key.KeyType.values for key_type in key_types):
+            await self.send_error(f'key_types должен быть списком из: {", ".join(Key.KeyType.values)}')
+            return
+        
+        groups = {key_group(key_id) for key_id in key_ids} | {key_type_group(key_type) for key_type in key_types}
+        if data.get('inventory'):
+            groups.add(KEY_INVENTORY_GROUP)
+        subscribe_all = data.get('all')
+        
+        if action == 'subscribe':
+            if subscribe_all:
+                groups.add(KEY_STATUS_GROUP)
+            elif not self.selective:
+                # Первая выборочная подписка - перестаем получать все обновления
+                await self._leave([KEY_STATUS_GROUP])
+            
+            if len(self.groups_joined | groups) > self.max_subscriptions:
+                await self.send_error(f'Не больше {self.max_subscriptions} подписок на одно подключение')
+                return
+            await self._join(groups)
+        else:
+            if subscribe_all or not self.selective:
+                groups.add(KEY_STATUS_GROUP)
+            await self._leave(groups)
+        
+        self.selective = True
+        await self.send(text_data=json.dumps({
+            'type': 'subscriptions',
+            'all': KEY_STATUS_GROUP in self.groups_joined,
+            'inventory': KEY_INVENTORY_GROUP in self.groups_joined,
+            'key_ids': sorted(
+                group[len(key_group('')):] for group in self.groups_joined if group.startswith(key_group(''))
+            ),
+            'key_types': sorted(
+                group[len(key_type_group('')):] for group in self.groups_joined if group.startswith(key_type_group(''))
+            ),
+        }))
+    
+    async def _join(self, groups):
+        """Добавление сокета в группы и учет подписок на отдельные ключи в реестре"""
+        groups = set(groups) - self.groups_joined
+        await asyncio.gather(*(self.channel_layer.group_add(group, self.channel_name) for group in groups))
+        self.groups_joined |= groups
+        await sync_to_async(key_subscriptions.add, thread_sensitive=False)(groups)
+    
+    async def _leave(self, groups):
+        """Удаление сокета из групп и снятие подписок на отдельные ключи в реестре"""
+        groups = set(groups) & self.groups_joined
+        await asyncio.gather(*(self.channel_layer.group_discard(group, self.channel_name) for group in groups))
+        self.groups_joined -= groups
+        await sync_to_async(key_subscriptions.remove, thread_sensitive=False)(groups)
+    
+    @staticmethod
+    def _parse_key_ids(key_ids):
+        """Список id ключей в каноническом виде; None, если передан не список UUID"""
+        if not isinstance(key_ids, list):
+            return None
+        try:
+            return list(dict.fromkeys(str(uuid.UUID(str(key_id))) for key_id in key_ids))
+        except ValueError:
+            return None
+    
+    async def send_error(self, message):
+        """Сообщение об ошибке в запросе клиента"""
+        await self.send(text_data=json.dumps({'type': 'error', 'error': message}))
+    
+    def is_duplicate(self, event):
+        """Событие уже пришло через другую группу, в которой состоит сокет"""
+        event_id = event.get('event_id')
+        if event_id is None:
+            return False
+        if event_id in self.recent_events:
+            return True
+        self.recent_events[event_id] = None
+        if len(self.recent_events) > self.recent_events_size:
+            self.recent_events.popitem(last=False)
+        return False
     
     async def key_status_update(self, event):
         """Отправка обновления статуса ключа клиенту"""
+        if self.is_duplicate(event):
+            return
         await self.send(text_data=json.dumps({
             'type': 'key_status_update',
             'key_id': event['key_id'],
@@ -68,6 +197,51 @@ class KeyStatusConsumer(AsyncWebsocketConsumer):
             'timestamp': event['timestamp'],
         }))
     
+    async def key_status_batch(self, event):
+        """Отправка объединенных обновлений статуса ключей одним сообщением"""
+        events = [item for item in event['events'] if not self.is_duplicate(item)]
+        if not events:
+            return
+        await self.send(text_data=json.dumps({
+            'type': 'key_status_batch',
+            'events': [
+                {
+                    'key_id': item['key_id'],
+                    'status': item['status'],
+                    'action': item['action'],
+                    'timestamp': item['timestamp'],
+                }
+                for item in events
+            ],
+        }))
+    
+    async def key_inventory_update(self, event):
+        """Отправка изменений счетчиков ключей клиенту"""
+        await self.key_inventory_batch({'events': [event]})
+    
+    async def key_inventory_batch(self, event):
+        """Изменения счетчиков из нескольких событий суммируются в одно сообщение"""
+        deltas = Counter()
+        timestamp = None
+        for item in event['events']:
+            if self.is_duplicate(item):
+                continue
+            for delta in item['deltas']:
+                deltas[(delta['key_type'], delta['status'])] += delta['delta']
+            timestamp = item['timestamp']
+        
+        deltas = {pair: delta for pair, delta in deltas.items() if delta}
+        if not deltas:
+            return
+        await self.send(text_data=json.dumps({
+            'type': 'key_inventory_update',
+            'deltas': [
+                {'key_type': key_type, 'status': status, 'delta': delta}
+                for (key_type, status), delta in sorted(deltas.items())
+            ],
+            'timestamp': timestamp,
+        }))
+    
     @database_sync_to_async
     def get_user_role(self, user):
         """Получение роли пользователя из базы данных"""
@@ -75,14 +249,31 @@ class KeyStatusConsumer(AsyncWebsocketConsumer):
     
     @database_sync_to_async
     def get_key_status(self, key_id):
-        """Получение статуса ключа из базы данных"""
-        from .models import Key
+        """Получение статуса ключа (через кеш поиска ключей)"""
+        from django.core.exceptions import ValidationError
+        from .lookup import key_lookup
         try:
-            key = Key.objects.get(id=key_id)
-            key.check_expiry()  # Проверяем и обновляем статус, если срок истек
-            return {
-                'status': key.status,
+            key = key_lookup.get(key_id=key_id)
+        except ValidationError:
+            return None
+        if key is None:
+            return None
+        return {
+            'status': key.current_status,
+            'remaining_days': key.remaining_days,
+        }
+    
+    @database_sync_to_async
+    def get_key_statuses(self, key_ids):
+        """Статусы списка ключей одним запросом, без записи истекших ключей в базу"""
+        from .models import Key
+        from .lookup import KeyLookup
+        rows = Key.objects.filter(id__in=key_ids).values_list(*KeyLookup._fields)
+        statuses = {}
+        for row in rows:
+            key = KeyLookup(*row)
+            statuses[str(key.id)] = {
+                'status': key.current_status,
                 'remaining_days': key.remaining_days,
             }
-        except Key.DoesNotExist:
-            return None 
\ No newline at end of file
+        return statuses
@@ -0,0 +1,212 @@
+import os
+import re
+import time
+import logging
+import mimetypes
+import threading
+from collections import namedtuple
+from urllib.parse import quote
+from django.conf import settings
+from django.db import transaction
+from django.db.models import F
+from django.utils.text import get_valid_filename
+from django.http import HttpResponse, HttpResponseNotModified
+from zalupaspb.export import streaming_response
+from .models import Loader
+
+logger = logging.getLogger('keys')
+
+# Один диапазон байт в заголовке Range: bytes=0-499, bytes=500-, bytes=-500
+RANGE_RE = re.compile(r'^bytes=(\d*)-(\d*)$')
+
+# Размер порции при отдаче диапазона файла самим Django
+CHUNK_SIZE = 64 * 1024
+
+
+class ActiveLoader(namedtuple('ActiveLoader', ['id', 'name', 'version', 'file_name', 'size', 'checksum'])):
+    """Сведения об активном лоадере, достаточные для отдачи файла без запроса к базе"""
+    __slots__ = ()
+
+    @property
+    def etag(self):
+        """ETag по контрольной сумме файла; без нее - по имени и размеру файла (слабый)"""
+        if self.checksum:
+            return f'"{self.checksum}"'
+        return f'W/"{self.id}-{self.size}"'
+
+    @property
+    def download_name(self):
+        """Имя файла для пользователя: файлы хранятся под именем из контрольной суммы (keys.storage)"""
+        extension = os.path.splitext(self.file_name)[1]
+        return get_valid_filename(f'{self.name}-{self.version}{extension}')
+
+
+class ActiveLoaderCache:
+    """
+    Кеш активного лоадера в памяти процесса.
+    Запись живет ttl секунд и сбрасывается при сохранении, удалении и (де)активации лоадера
+    в этом процессе; остальные воркеры увидят изменение не позже чем через ttl.
+    """
+
+    def __init__(self, ttl=30):
+        self.ttl = ttl
+        self._value = None
+        self._expires = 0
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self):
+        """Активный лоадер (ActiveLoader) или None, если активного лоадера нет"""
+        if time.monotonic() < self._expires:
+            self.hits += 1
+            return self._value
+
+        with self._lock:
+            if time.monotonic() < self._expires:
+                self.hits += 1
+                return self._value
+            self.misses += 1
+            self._value = self._load()
+            self._expires = time.monotonic() + self.ttl
+            return self._value
+
+    def _load(self):
+        loader = Loader.objects.filter(is_active=True).order_by('-upload_date').first()
+        if loader is None or not loader.file:
+            return None
+        try:
+            size = loader.file.size
+        except OSError:
+            logger.error(f"Файл лоадера {loader.file.name} не найден")
+            return None
+        return ActiveLoader(loader.id, loader.name, loader.version, loader.file.name, size, loader.checksum)
+
+    def invalidate(self, using=None):
+        """Сброс кеша после фиксации транзакции, изменившей лоадеры"""
+        def reset():
+            self._expires = 0
+        transaction.on_commit(reset, using=using)
+
+    def stats(self):
+        total = self.hits + self.misses
+        return {
+            'hits': self.hits,
+            'misses': self.misses,
+            'hit_ratio': round(self.hits / total, 3) if total else None,
+        }
+
+
+loader_cache = ActiveLoaderCache(ttl=getattr(settings, 'LOADER_DOWNLOAD', {}).get('cache_ttl', 30))
+
+
+def parse_range(header, size):
+    """
+    Разбор заголовка Range для файла размером size.
+    Возвращает (начало, конец включительно), None - если заголовка нет или он не поддерживается
+    (несколько диапазонов отдаются целым файлом), 'unsatisfiable' - если диапазон вне файла.
+    """
+    match = RANGE_RE.match(header.strip()) if header else None
+    if match is None:
+        return None
+
+    start, end = match.groups()
+    if not start and not end:
+        return None
+    if not start:
+        # Последние end байт файла
+        length = int(end)
+        if length == 0:
+            return 'unsatisfiable'
+        return max(size - length, 0), size - 1
+
+    start = int(start)
+    end = min(int(end), size - 1) if end else size - 1
+    if start >= size or start > end:
+        return 'unsatisfiable'
+    return start, end
+
+
+def count_download(loader_id):
+    """Атомарное увеличение счетчика загрузок одним UPDATE (без чтения значения)"""
+    Loader.objects.filter(pk=loader_id).update(download_count=F('download_count') + 1)
+
+
+def _file_range(path, start, length):
+    """Чтение диапазона файла порциями"""
+    with open(path, 'rb') as f:
+        f.seek(start)
+        while length > 0:
+            chunk = f.read(min(CHUNK_SIZE, length))
+            if not chunk:
+                break
+            length -= len(chunk)
+            yield chunk
+
+
+_accel_warned = False
+
+
+def _warn_no_accel():
+    """Предупреждение (один раз на процесс), что без DEBUG файл отдает воркер, а не nginx"""
+    global _accel_warned
+    if settings.DEBUG or _accel_warned:
+        return
+    _accel_warned = True
+    logger.warning(
+        "LOADER_ACCEL_REDIRECT_PREFIX не задан: файлы лоадера отдает воркер Django, а не nginx. "
+        "Каждая загрузка занимает воркер на все время передачи"
+    )
+
+
+def serve_loader(request, loader):
+    """
+    Ответ с файлом лоадера.
+    If-None-Match проверяется по ETag из контрольной суммы. Если задан accel_redirect_prefix,
+    передача файла (в том числе диапазонов Range) отдается nginx через X-Accel-Redirect
+    из internal location; иначе Django сам отдает файл или запрошенный диапазон (206)
+    порциями - под ASGI через асинхронный итератор, без чтения файла в память целиком.
+    Загрузкой считается запрос файла с начала: докачка диапазона счетчик не увеличивает.
+    """
+    if_none_match = request.META.get('HTTP_IF_NONE_MATCH', '')
+    if loader.etag in [tag.strip() for tag in if_none_match.split(',')]:
+        response = HttpResponseNotModified()
+        response['ETag'] = loader.etag
+        return response
+
+    byte_range = parse_range(request.META.get('HTTP_RANGE'), loader.size)
+    # If-Range: диапазон отдается, только если файл не изменился, иначе - весь файл
+    if_range = request.META.get('HTTP_IF_RANGE')
+    if byte_range is not None and if_range and if_range.strip() != loader.etag:
+        byte_range = None
+
+    if byte_range == 'unsatisfiable':
+        response = HttpResponse(status=416)
+        response['Content-Range'] = f'bytes */{loader.size}'
+        return response
+
+    if byte_range is None or byte_range[0] == 0:
+        count_download(loader.id)
+
+    content_type = mimetypes.guess_type(loader.download_name)[0] or 'application/octet-stream'
+    accel_prefix = getattr(settings, 'LOADER_DOWNLOAD', {}).get('accel_redirect_prefix')
+    if accel_prefix:
+        response = HttpResponse(content_type=content_type)
+        response['X-Accel-Redirect'] = accel_prefix.rstrip('/') + '/' + quote(loader.file_name)
+    else:
+        _warn_no_accel()
+        path = os.path.join(settings.MEDIA_ROOT, loader.file_name)
+        start, end = byte_range or (0, loader.size - 1)
+        response = streaming_response(
+            request, _file_range(path, start, end - start + 1),
+            status=200 if byte_range is None else 206, content_type=content_type
+        )
+        if byte_range is not None:
+            response['Content-Range'] = f'bytes {start}-{end}/{loader.size}'
+        response['Content-Length'] = str(end - start + 1)
+
+    response['ETag'] = loader.etag
+    response['Accept-Ranges'] = 'bytes'
+    response['Cache-Control'] = 'private, no-cache'
+    response['Content-Disposition'] = f"attachment; filename*=UTF-8''{quote(loader.download_name)}"
+    return response
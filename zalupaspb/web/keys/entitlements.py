@@ -0,0 +1,99 @@
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.db import transaction
+from django.db.models import Count, Max, Q
+from django.utils import timezone
+from django.utils.dateparse import parse_datetime
+from .models import Key
+
+# Порядок типов ключей: ключ более высокого типа дает доступ и к более низким
+KEY_TYPE_RANK = {
+    Key.KeyType.STANDARD: 1,
+    Key.KeyType.PREMIUM: 2,
+    Key.KeyType.LIFETIME: 3,
+}
+
+
+def entitlement_cache_key(user_id):
+    return f'entitlement:{user_id}'
+
+
+def build_entitlement(user_id, now=None):
+    """
+    Расчет права доступа пользователя одним агрегирующим запросом:
+    для каждого типа ключа - количество действующих активированных ключей и наибольшая дата истечения.
+    Возвращает запись {'key_type', 'expires_at'} для самого высокого типа или key_type=None.
+    """
+    now = now or timezone.now()
+    valid = (
+        Q(activated_keys__status=Key.KeyStatus.USED)
+        & (Q(activated_keys__expires_at__isnull=True) | Q(activated_keys__expires_at__gt=now))
+    )
+    aggregates = {}
+    for key_type in KEY_TYPE_RANK:
+        type_filter = valid & Q(activated_keys__key_type=key_type)
+        aggregates[f'{key_type}_count'] = Count('activated_keys', filter=type_filter)
+        aggregates[f'{key_type}_expires'] = Max('activated_keys__expires_at', filter=type_filter)
+        aggregates[f'{key_type}_unlimited'] = Count(
+            'activated_keys', filter=type_filter & Q(activated_keys__expires_at__isnull=True)
+        )
+
+    row = (
+        get_user_model().objects.filter(pk=user_id)
+        .values('is_banned')
+        .annotate(**aggregates)
+        .first()
+    )
+
+    entitlement = {'key_type': None, 'expires_at': None}
+    if row is None or row['is_banned']:
+        return entitlement
+
+    for key_type in sorted(KEY_TYPE_RANK, key=KEY_TYPE_RANK.get, reverse=True):
+        if row[f'{key_type}_count']:
+            expires_at = None if row[f'{key_type}_unlimited'] else row[f'{key_type}_expires']
+            entitlement['key_type'] = str(key_type)
+            entitlement['expires_at'] = expires_at.isoformat() if expires_at else None
+            break
+    return entitlement
+
+
+def get_entitlement(user_id, now=None):
+    """
+    Право доступа пользователя из кеша, при промахе - расчет и сохранение в кеш.
+    Запись живет до expires_at права (но не дольше ENTITLEMENT_CACHE_MAX_TTL)
+    и удаляется при изменении ключей или блокировке пользователя.
+    """
+    now = now or timezone.now()
+    cache_key = entitlement_cache_key(user_id)
+    entitlement = cache.get(cache_key)
+    if entitlement is not None:
+        expires_at = entitlement['expires_at']
+        if expires_at is None or parse_datetime(expires_at) > now:
+            return entitlement
+
+    entitlement = build_entitlement(user_id, now=now)
+
+    timeout = getattr(settings, 'ENTITLEMENT_CACHE_MAX_TTL', 3600)
+    if entitlement['expires_at']:
+        seconds_left = int((parse_datetime(entitlement['expires_at']) - now).total_seconds())
+        timeout = max(1, min(timeout, seconds_left))
+    cache.set(cache_key, entitlement, timeout)
+    return entitlement
+
+
+def has_entitlement(entitlement, key_type=None):
+    """Проверка, что право доступа покрывает указанный тип ключа (или любой тип)"""
+    if entitlement['key_type'] is None:
+        return False
+    if key_type is None:
+        return True
+    return KEY_TYPE_RANK[entitlement['key_type']] >= KEY_TYPE_RANK.get(key_type, len(KEY_TYPE_RANK) + 1)
+
+
+def invalidate_entitlement(*user_ids, using=None):
+    """Удаление записей из кеша после фиксации транзакции"""
+    keys = [entitlement_cache_key(user_id) for user_id in user_ids if user_id]
+    if keys:
+        transaction.on_commit(lambda: cache.delete_many(keys), using=using)
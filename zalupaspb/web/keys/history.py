@@ -0,0 +1,447 @@
+import os
+import json
+import gzip
+import uuid
+import bisect
+import logging
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.db import connection, transaction
+from django.db.models import Q
+from django.utils import timezone
+from django.utils.dateparse import parse_datetime
+from logs.partitions import UPPER_BOUND_RE, period_start, next_period
+from .models import Key, KeyHistory
+
+logger = logging.getLogger('keys')
+
+# Суффиксы файлов архива партиции: данные (gzip NDJSON) и индекс по key_id
+ARCHIVE_SUFFIX = '.ndjson.gz'
+INDEX_SUFFIX = '.idx.json'
+
+
+def get_history_settings():
+    """Настройки партиционирования и архивации истории ключей с значениями по умолчанию"""
+    history_settings = getattr(settings, 'KEY_HISTORY', {})
+    return {
+        'premake': history_settings.get('premake', 2),
+        'archive_after_months': history_settings.get('archive_after_months'),
+        'archive_dir': history_settings.get('archive_dir', os.path.join(settings.BASE_DIR, 'archive', 'key_history')),
+        'member_rows': history_settings.get('member_rows', 5000),
+    }
+
+
+def _table():
+    return KeyHistory._meta.db_table
+
+
+def partition_name(start):
+    """Имя месячной партиции: keys_keyhistory_p202610"""
+    return f"{_table()}_p{start:%Y%m}"
+
+
+def months_before(start, months):
+    """Начало месяца, отстоящего от start на months месяцев назад"""
+    month_index = start.year * 12 + start.month - 1 - months
+    return start.replace(year=month_index // 12, month=month_index % 12 + 1)
+
+
+def is_partitioned():
+    """Проверка, что таблица истории ключей уже преобразована в партиционированную"""
+    if connection.vendor != 'postgresql':
+        return False
+    with connection.cursor() as cursor:
+        cursor.execute(
+            "SELECT 1 FROM pg_partitioned_table p JOIN pg_class c ON c.oid = p.partrelid WHERE c.relname = %s",
+            [_table()]
+        )
+        return cursor.fetchone() is not None
+
+
+def list_partitions():
+    """Список партиций истории ключей: [(имя, верхняя граница или None для партиции по умолчанию)]"""
+    with connection.cursor() as cursor:
+        cursor.execute(
+            """
+            SELECT child.relname, pg_get_expr(child.relpartbound, child.oid)
+            FROM pg_inherits
+            JOIN pg_class parent ON parent.oid = pg_inherits.inhparent
+            JOIN pg_class child ON child.oid = pg_inherits.inhrelid
+            WHERE parent.relname = %s
+            ORDER BY child.relname
+            """,
+            [_table()]
+        )
+        partitions = []
+        for name, bound in cursor.fetchall():
+            match = UPPER_BOUND_RE.search(bound or '')
+            partitions.append((name, parse_datetime(match.group(1)) if match else None))
+        return partitions
+
+
+def create_partition(start):
+    """Создание месячной партиции с переносом строк этого месяца из партиции по умолчанию"""
+    table = _table()
+    name = partition_name(start)
+    end = next_period(start, 'month')
+    qn = connection.ops.quote_name
+
+    with transaction.atomic(), connection.cursor() as cursor:
+        cursor.execute("SELECT to_regclass(%s)", [name])
+        if cursor.fetchone()[0] is not None:
+            return False
+
+        cursor.execute(f"CREATE TABLE {qn(name)} (LIKE {qn(table)} INCLUDING DEFAULTS INCLUDING CONSTRAINTS)")
+        cursor.execute(
+            f"""
+            WITH moved AS (
+                DELETE FROM {qn(table + '_default')}
+                WHERE "timestamp" >= %s AND "timestamp" < %s
+                RETURNING *
+            )
+            INSERT INTO {qn(name)} SELECT * FROM moved
+            """,
+            [start, end]
+        )
+        cursor.execute(
+            f"ALTER TABLE {qn(table)} ATTACH PARTITION {qn(name)} FOR VALUES FROM (%s) TO (%s)",
+            [start, end]
+        )
+
+    logger.info(f"Создана партиция истории ключей {name} [{start:%Y-%m-%d} - {end:%Y-%m-%d})")
+    return True
+
+
+def ensure_partitions(premake=None, now=None):
+    """Создание партиций на текущий месяц и premake месяцев вперед. Возвращает имена созданных партиций"""
+    premake = get_history_settings()['premake'] if premake is None else premake
+
+    start = period_start(now or timezone.now(), 'month')
+    end = start
+    for _ in range(premake + 1):
+        end = next_period(end, 'month')
+
+    # Месяцы до верхней границы уже существующих партиций (в т.ч. legacy) пропускаем
+    covered = [upper for _, upper in list_partitions() if upper is not None]
+    if covered:
+        start = max(start, period_start(max(covered), 'month'))
+
+    created = []
+    while start < end:
+        if create_partition(start):
+            created.append(partition_name(start))
+        start = next_period(start, 'month')
+    return created
+
+
+def setup_partitioning(premake=None, keep_legacy=False):
+    """
+    Однократное преобразование keys_keyhistory в таблицу, партиционированную по месяцам timestamp.
+    Существующие строки раскладываются по месячным партициям (от самого старого месяца до текущего)
+    одним INSERT ... SELECT, поэтому старая история архивируется и удаляется по месяцам, как и новая.
+    На время копирования запись истории (и изменения ключей) ждет. С keep_legacy существующая
+    таблица без копирования становится одной партицией keys_keyhistory_legacy (до конца текущего
+    месяца), которая архивируется целиком, только когда срок архивации пройдет ее верхнюю границу.
+    Первичный ключ партиционированной таблицы - (id, timestamp).
+    """
+    if connection.vendor != 'postgresql':
+        raise RuntimeError('Партиционирование истории ключей поддерживается только для PostgreSQL')
+    if is_partitioned():
+        return False
+
+    table = _table()
+    legacy = f"{table}_legacy"
+    user_table = get_user_model()._meta.db_table
+    boundary = next_period(period_start(timezone.now(), 'month'), 'month')
+    qn = connection.ops.quote_name
+
+    with transaction.atomic(), connection.cursor() as cursor:
+        cursor.execute(f"LOCK TABLE {qn(table)} IN ACCESS EXCLUSIVE MODE")
+        cursor.execute(f"ALTER TABLE {qn(table)} RENAME TO {qn(legacy)}")
+        cursor.execute(f"ALTER TABLE {qn(legacy)} RENAME CONSTRAINT {qn(table + '_pkey')} TO {qn(legacy + '_pkey')}")
+
+        cursor.execute(
+            f"""CREATE TABLE {qn(table)} (LIKE {qn(legacy)} INCLUDING DEFAULTS INCLUDING CONSTRAINTS)
+            PARTITION BY RANGE ("timestamp")"""
+        )
+        cursor.execute(f'ALTER TABLE {qn(table)} ADD CONSTRAINT {qn(table + "_pkey")} PRIMARY KEY (id, "timestamp")')
+        # Индекс совпадает с keys_history_key_ts_idx модели, поэтому при ATTACH legacy используется существующий
+        cursor.execute(f'CREATE INDEX {qn(table + "_key_ts_idx")} ON {qn(table)} (key_id, "timestamp" DESC)')
+        cursor.execute(f'CREATE INDEX {qn(table + "_user_id_idx")} ON {qn(table)} (user_id)')
+        cursor.execute(
+            f"""ALTER TABLE {qn(table)} ADD CONSTRAINT {qn(table + '_key_id_fk')}
+            FOREIGN KEY (key_id) REFERENCES {qn(Key._meta.db_table)} (id) DEFERRABLE INITIALLY DEFERRED"""
+        )
+        cursor.execute(
+            f"""ALTER TABLE {qn(table)} ADD CONSTRAINT {qn(table + '_user_id_fk')}
+            FOREIGN KEY (user_id) REFERENCES {qn(user_table)} (id) DEFERRABLE INITIALLY DEFERRED"""
+        )
+
+        if keep_legacy:
+            cursor.execute(
+                f"ALTER TABLE {qn(table)} ATTACH PARTITION {qn(legacy)} FOR VALUES FROM (MINVALUE) TO (%s)",
+                [boundary]
+            )
+        else:
+            # Месячные партиции от самого старого месяца истории до текущего, затем перенос строк в них
+            cursor.execute(f'SELECT min("timestamp") FROM {qn(legacy)}')
+            oldest = cursor.fetchone()[0]
+            start = period_start(oldest or timezone.now(), 'month')
+            while start < boundary:
+                end = next_period(start, 'month')
+                cursor.execute(
+                    f"CREATE TABLE {qn(partition_name(start))} PARTITION OF {qn(table)} FOR VALUES FROM (%s) TO (%s)",
+                    [start, end]
+                )
+                start = end
+        cursor.execute(f"CREATE TABLE {qn(table + '_default')} PARTITION OF {qn(table)} DEFAULT")
+        if not keep_legacy:
+            cursor.execute(f"INSERT INTO {qn(table)} SELECT * FROM {qn(legacy)}")
+            copied = cursor.rowcount
+            cursor.execute(f"DROP TABLE {qn(legacy)}")
+
+    if keep_legacy:
+        logger.info(f"Таблица {table} преобразована в партиционированную, существующие данные в {legacy}")
+    else:
+        logger.info(f"Таблица {table} преобразована в партиционированную, {copied} строк разложено по месячным партициям")
+    ensure_partitions(premake=premake, now=boundary)
+    return True
+
+
+def _archive_paths(name, archive_dir=None):
+    """Пути к файлу архива партиции и его индексу"""
+    archive_dir = archive_dir or get_history_settings()['archive_dir']
+    base = os.path.join(archive_dir, name)
+    return base + ARCHIVE_SUFFIX, base + INDEX_SUFFIX
+
+
+def _write_durable(path, write):
+    """Запись файла через временный файл с fsync и атомарной заменой"""
+    tmp_path = path + '.tmp'
+    with open(tmp_path, 'wb') as f:
+        write(f)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp_path, path)
+
+
+def archive_partition(name):
+    """
+    Перенос партиции в архив: строки выгружаются серверным курсором в порядке (key_id, timestamp)
+    в gzip NDJSON, каждые member_rows строк - отдельный gzip-член. Индекс хранит для каждого члена
+    диапазон key_id и смещение в файле, поэтому история одного ключа читается распаковкой одного члена.
+    Файл целиком остается обычным gzip (читается zcat). Партиция удаляется только после записи
+    файлов на диск и сверки количества строк. Возвращает количество перенесенных строк.
+    """
+    history_settings = get_history_settings()
+    data_path, index_path = _archive_paths(name, history_settings['archive_dir'])
+    os.makedirs(os.path.dirname(data_path), exist_ok=True)
+    qn = connection.ops.quote_name
+
+    members = []
+    stats = {'rows': 0, 'min_timestamp': None, 'max_timestamp': None}
+
+    def write_members(f):
+        offset = 0
+        with transaction.atomic():
+            cursor = connection.chunked_cursor()
+            cursor.execute(
+                f'SELECT id, key_id, action, user_id, "timestamp", details FROM {qn(name)}'
+                f' ORDER BY key_id, "timestamp", id'
+            )
+            while True:
+                rows = cursor.fetchmany(history_settings['member_rows'])
+                if not rows:
+                    break
+                lines = []
+                for entry_id, key_id, action, user_id, timestamp, details in rows:
+                    lines.append(json.dumps({
+                        'id': str(entry_id),
+                        'key_id': str(key_id),
+                        'action': action,
+                        'user_id': user_id,
+                        'timestamp': timestamp.isoformat(),
+                        'details': details,
+                    }, ensure_ascii=False))
+                    if stats['min_timestamp'] is None or timestamp < stats['min_timestamp']:
+                        stats['min_timestamp'] = timestamp
+                    if stats['max_timestamp'] is None or timestamp > stats['max_timestamp']:
+                        stats['max_timestamp'] = timestamp
+
+                member = gzip.compress(('\n'.join(lines) + '\n').encode('utf-8'))
+                f.write(member)
+                members.append([str(rows[0][1]), str(rows[-1][1]), offset, len(member)])
+                offset += len(member)
+                stats['rows'] += len(rows)
+            cursor.close()
+
+    _write_durable(data_path, write_members)
+    index = {
+        'partition': name,
+        'rows': stats['rows'],
+        'min_timestamp': stats['min_timestamp'].isoformat() if stats['min_timestamp'] else None,
+        'max_timestamp': stats['max_timestamp'].isoformat() if stats['max_timestamp'] else None,
+        'members': members,
+    }
+    _write_durable(index_path, lambda f: f.write(json.dumps(index).encode('utf-8')))
+
+    with transaction.atomic(), connection.cursor() as cursor:
+        cursor.execute(f"LOCK TABLE {qn(name)} IN ACCESS EXCLUSIVE MODE")
+        cursor.execute(f"SELECT count(*) FROM {qn(name)}")
+        count = cursor.fetchone()[0]
+        if count != stats['rows']:
+            raise RuntimeError(f'В партиции {name} {count} строк, в архиве {stats["rows"]} - партиция не удалена')
+        cursor.execute(f"ALTER TABLE {qn(_table())} DETACH PARTITION {qn(name)}")
+        cursor.execute(f"DROP TABLE {qn(name)}")
+
+    history_archive.forget(index_path)
+    logger.info(f"Партиция истории ключей {name} перенесена в архив {data_path}: {stats['rows']} строк")
+    return stats['rows']
+
+
+def archive_partitions_before(cutoff):
+    """
+    Архивация партиций, целиком лежащих до cutoff (партиция по умолчанию не архивируется).
+    Возвращает (количество партиций, количество перенесенных строк).
+    """
+    if not is_partitioned():
+        return 0, 0
+
+    archived, rows = 0, 0
+    for name, upper in list_partitions():
+        if upper is None or upper > cutoff:
+            continue
+        rows += archive_partition(name)
+        archived += 1
+    return archived, rows
+
+
+def maintain_partitions(now=None, archive=True):
+    """
+    Плановое обслуживание: создание будущих партиций и архивация партиций
+    старше archive_after_months месяцев (если задано и archive=True). Для непартиционированной таблицы ничего не делает.
+    Служба очистки вызывает его с archive=False: архивация читает партиции целиком
+    и запускается только командой key_history_partitions по своему расписанию.
+    """
+    if not is_partitioned():
+        return {'created': [], 'archived': 0, 'rows': 0}
+
+    now = now or timezone.now()
+    history_settings = get_history_settings()
+    created = ensure_partitions(now=now)
+
+    archived, rows = 0, 0
+    if archive and history_settings['archive_after_months']:
+        cutoff = months_before(period_start(now, 'month'), history_settings['archive_after_months'])
+        archived, rows = archive_partitions_before(cutoff)
+
+    return {'created': created, 'archived': archived, 'rows': rows}
+
+
+class KeyHistoryArchive:
+    """
+    Чтение архивированной истории ключей из файлов archive_partition.
+    Индексы файлов кешируются в процессе (с проверкой mtime), для ключа распаковываются
+    только gzip-члены, диапазон key_id которых его содержит.
+    """
+
+    def __init__(self, archive_dir=None):
+        self._archive_dir = archive_dir
+        self._indexes = {}
+
+    @property
+    def archive_dir(self):
+        return self._archive_dir or get_history_settings()['archive_dir']
+
+    def _load_index(self, index_path):
+        """Индекс архива из кеша или с диска"""
+        mtime = os.stat(index_path).st_mtime
+        cached = self._indexes.get(index_path)
+        if cached is not None and cached[0] == mtime:
+            return cached[1]
+
+        with open(index_path, 'rb') as f:
+            index = json.loads(f.read())
+        index['first_keys'] = [member[0] for member in index['members']]
+        self._indexes[index_path] = (mtime, index)
+        return index
+
+    def forget(self, index_path):
+        """Сброс кешированного индекса после перезаписи архива"""
+        self._indexes.pop(index_path, None)
+
+    def index_paths(self):
+        """Пути к индексам всех архивов"""
+        try:
+            names = os.listdir(self.archive_dir)
+        except FileNotFoundError:
+            return []
+        return sorted(os.path.join(self.archive_dir, name) for name in names if name.endswith(INDEX_SUFFIX))
+
+    def get(self, key_id):
+        """Архивированные записи истории ключа (несохраненные KeyHistory) от новых к старым"""
+        key_id = str(key_id)
+        records = []
+        for index_path in self.index_paths():
+            index = self._load_index(index_path)
+            # Члены отсортированы по key_id: первый кандидат - последний член, начинающийся не позже key_id
+            start = max(bisect.bisect_left(index['first_keys'], key_id) - 1, 0)
+            end = bisect.bisect_right(index['first_keys'], key_id)
+            members = [member for member in index['members'][start:end] if member[1] >= key_id]
+            if not members:
+                continue
+
+            data_path = index_path[:-len(INDEX_SUFFIX)] + ARCHIVE_SUFFIX
+            with open(data_path, 'rb') as f:
+                for _, _, offset, length in members:
+                    f.seek(offset)
+                    for line in gzip.decompress(f.read(length)).splitlines():
+                        record = json.loads(line)
+                        if record['key_id'] == key_id:
+                            records.append(record)
+
+        users = get_user_model().objects.in_bulk({record['user_id'] for record in records if record['user_id']})
+        entries = []
+        for record in records:
+            entry = KeyHistory(
+                id=uuid.UUID(record['id']),
+                key_id=uuid.UUID(record['key_id']),
+                action=record['action'],
+                timestamp=parse_datetime(record['timestamp']),
+                details=record['details'],
+            )
+            # Пользователь мог быть удален после архивации - как и в основной таблице, ссылка обнуляется
+            entry.user = users.get(record['user_id'])
+            entries.append(entry)
+
+        entries.sort(key=lambda entry: (entry.timestamp, entry.id), reverse=True)
+        return entries
+
+
+history_archive = KeyHistoryArchive()
+
+
+def get_key_history(key_id, before=None, limit=50):
+    """
+    Страница истории ключа от новых записей к старым, строго после позиции before = (timestamp, id).
+    Сначала читается основная таблица, когда она исчерпана - архив, поэтому история
+    архивированных ключей доступна через тот же вызов. Возвращает (записи, есть ли продолжение).
+    """
+    queryset = KeyHistory.objects.filter(key_id=key_id).select_related('user').order_by('-timestamp', '-id')
+    if before is not None:
+        value, pk = before
+        queryset = queryset.filter(Q(timestamp__lt=value) | Q(timestamp=value, id__lt=pk), timestamp__lte=value)
+
+    entries = list(queryset[:limit + 1])
+    if len(entries) <= limit:
+        # Записи архива старше записей основной таблицы; повторы возможны, если архивация
+        # прервалась между записью файла и удалением партиции
+        seen = {entry.id for entry in entries}
+        for entry in history_archive.get(key_id):
+            if entry.id in seen or (before is not None and (entry.timestamp, entry.id) >= before):
+                continue
+            entries.append(entry)
+            if len(entries) > limit:
+                break
+
+    return entries[:limit], len(entries) > limit
@@ -0,0 +1,205 @@
+import os
+import re
+import csv
+import time
+import uuid
+import tempfile
+from collections import namedtuple
+from django.conf import settings
+from django.db import connection, transaction
+from .codes import is_valid_key_code, normalize_key_code
+from .lookup import key_lookup
+from .inventory import record_inventory_deltas, status_change_deltas
+from .models import Key, KeyHistory
+
+
+# Отчеты об отклоненных строках содержат действующие коды, поэтому хранятся вне MEDIA_ROOT
+# и отдаются только через админ-панель (настройка KEY_IMPORT_REPORTS)
+REPORT_ID_RE = re.compile(r'^[0-9a-f]{32}$')
+
+# Заголовки первой строки файла, которые пропускаются
+HEADER_NAMES = {'key_code', 'code', 'key', 'код'}
+
+# Максимальный размер файла для COPY, который держится в памяти; больше - во временном файле
+SPOOL_MAX_SIZE = 8 * 1024 * 1024
+
+KEY_CODE_MAX_LENGTH = Key._meta.get_field('key_code').max_length
+
+ImportResult = namedtuple('ImportResult', ['created', 'rejected', 'report_id'])
+
+REJECT_REASONS = {
+    'duplicate': 'Повтор кода в файле',
+    'exists': 'Ключ уже существует',
+}
+
+
+def get_report_path(report_id):
+    """Путь к файлу отчета; None для некорректного идентификатора"""
+    if not REPORT_ID_RE.match(report_id or ''):
+        return None
+    return os.path.join(settings.KEY_IMPORT_REPORTS['dir'], f'{report_id}.csv')
+
+
+def purge_reports(now=None):
+    """Удаление отчетов импорта старше KEY_IMPORT_REPORTS['max_age_days']; возвращает количество удаленных"""
+    reports_dir = settings.KEY_IMPORT_REPORTS['dir']
+    max_age = settings.KEY_IMPORT_REPORTS['max_age_days'] * 86400
+    cutoff = (now.timestamp() if now is not None else time.time()) - max_age
+
+    deleted = 0
+    try:
+        entries = list(os.scandir(reports_dir))
+    except FileNotFoundError:
+        return 0
+    for entry in entries:
+        if not entry.name.endswith('.csv') or not REPORT_ID_RE.match(entry.name[:-4]):
+            continue
+        try:
+            if entry.stat().st_mtime < cutoff:
+                os.remove(entry.path)
+                deleted += 1
+        except FileNotFoundError:
+            continue
+    return deleted
+
+
+def _iter_rows(lines):
+    """
+    Строки загруженного файла (CSV или TXT, код ключа в первой колонке).
+    Возвращает (номер строки, исходный текст, код или None, причина отказа).
+    """
+    for line_no, raw in enumerate(lines, start=1):
+        try:
+            text = raw.decode('utf-8-sig' if line_no == 1 else 'utf-8') if isinstance(raw, bytes) else raw
+        except UnicodeDecodeError:
+            yield line_no, raw.decode('utf-8', errors='replace').strip(), None, 'Неверная кодировка (ожидается UTF-8)'
+            continue
+
+        text = text.strip()
+        if not text:
+            continue
+
+        cells = next(csv.reader([text]), [''])
+        key_code = normalize_key_code(cells[0] if cells else '')
+        if line_no == 1 and key_code.lower() in HEADER_NAMES:
+            continue
+        if not key_code:
+            yield line_no, text, None, 'Пустой код'
+        elif len(key_code) > KEY_CODE_MAX_LENGTH:
+            yield line_no, text, None, f'Код длиннее {KEY_CODE_MAX_LENGTH} символов'
+        elif not is_valid_key_code(key_code):
+            yield line_no, text, None, 'Неверный формат или контрольная группа кода'
+        else:
+            yield line_no, text, key_code, None
+
+
+def import_key_codes(lines, key_type, duration_days, created_by=None, notes=None):
+    """
+    Импорт кодов ключей из файла.
+    Коды, прошедшие проверку формата, загружаются во временную таблицу через COPY,
+    повторы внутри файла и уже существующие коды отсекаются одним UPDATE с соединением,
+    ключи вставляются одним INSERT ... SELECT, записи истории CREATED создаются в том же запросе.
+    Сигнал post_save не вызывается. Отклоненные строки (номер, текст, причина) пишутся в CSV-отчет,
+    его идентификатор возвращается в ImportResult.report_id (None, если отказов нет).
+    """
+    report_id = uuid.uuid4().hex
+    report_path = get_report_path(report_id)
+    os.makedirs(os.path.dirname(report_path), exist_ok=True)
+
+    rejected = 0
+    with open(report_path, 'w', newline='', encoding='utf-8') as report_file, \
+            tempfile.SpooledTemporaryFile(max_size=SPOOL_MAX_SIZE, mode='w+', newline='', encoding='utf-8') as copy_file:
+        report = csv.writer(report_file)
+        report.writerow(['line', 'text', 'reason'])
+
+        # Проверка формата в Python, подходящие коды - в буфер для COPY
+        copy_writer = csv.writer(copy_file)
+        for line_no, text, key_code, reason in _iter_rows(lines):
+            if key_code is None:
+                report.writerow([line_no, text, reason])
+                rejected += 1
+            else:
+                copy_writer.writerow([line_no, key_code])
+        copy_file.seek(0)
+
+        key_type_display = dict(Key.KeyType.choices).get(key_type, key_type)
+        details = f"Импортирован ключ типа {key_type_display} с длительностью {duration_days} дней"
+        created_by_id = created_by.pk if created_by else None
+
+        with transaction.atomic(), connection.cursor() as cursor:
+            cursor.execute(
+                'CREATE TEMP TABLE keys_import_staging ('
+                ' line_no integer PRIMARY KEY, key_code varchar(%s) NOT NULL, reason varchar(20)'
+                ') ON COMMIT DROP',
+                [KEY_CODE_MAX_LENGTH]
+            )
+            cursor.copy_expert('COPY keys_import_staging (line_no, key_code) FROM STDIN WITH (FORMAT csv)', copy_file)
+            cursor.execute('CREATE INDEX ON keys_import_staging (key_code)')
+            cursor.execute('ANALYZE keys_import_staging')
+
+            # Повторы внутри файла: остается первая строка с кодом
+            cursor.execute(
+                'UPDATE keys_import_staging s SET reason = %s'
+                ' FROM (SELECT line_no, row_number() OVER (PARTITION BY key_code ORDER BY line_no) AS n'
+                '       FROM keys_import_staging) r'
+                ' WHERE r.line_no = s.line_no AND r.n > 1',
+                ['duplicate']
+            )
+
+            # Уже существующие ключи
+            cursor.execute(
+                f'UPDATE keys_import_staging s SET reason = %s FROM {Key._meta.db_table} k'
+                ' WHERE k.key_code = s.key_code AND s.reason IS NULL',
+                ['exists']
+            )
+
+            # Ключи, история и отметка об импорте - одним запросом.
+            # ON CONFLICT пропускает коды, созданные параллельно после предыдущего шага
+            cursor.execute(
+                f'WITH inserted AS ('
+                f'  INSERT INTO {Key._meta.db_table}'
+                f'    (id, key, key_code, key_type, status, created_by_id, created_at, duration_days, notes)'
+                f'  SELECT gen_random_uuid(), gen_random_uuid()::text, key_code, %s, %s, %s, now(), %s, %s'
+                f'  FROM keys_import_staging WHERE reason IS NULL ORDER BY line_no'
+                f'  ON CONFLICT (key_code) DO NOTHING'
+                f'  RETURNING id, key_code'
+                f'), history AS ('
+                f'  INSERT INTO {KeyHistory._meta.db_table} (id, key_id, action, user_id, timestamp, details)'
+                f'  SELECT gen_random_uuid(), id, %s, %s, now(), %s FROM inserted'
+                f')'
+                f' UPDATE keys_import_staging s SET reason = %s FROM inserted i WHERE i.key_code = s.key_code'
+                f' AND s.reason IS NULL',
+                [
+                    key_type, Key.KeyStatus.ACTIVE, created_by_id, duration_days, notes,
+                    KeyHistory.ActionType.CREATED, created_by_id, details,
+                    'imported',
+                ]
+            )
+            created = cursor.rowcount
+            record_inventory_deltas(status_change_deltas(key_type, None, Key.KeyStatus.ACTIVE, created))
+
+            # Отклоненные в базе строки - в отчет
+            cursor.execute(
+                "SELECT line_no, key_code, COALESCE(reason, 'exists') FROM keys_import_staging"
+                " WHERE reason IS DISTINCT FROM 'imported' ORDER BY line_no"
+            )
+            while True:
+                rows = cursor.fetchmany(5000)
+                if not rows:
+                    break
+                report.writerows([line_no, key_code, REJECT_REASONS[reason]] for line_no, key_code, reason in rows)
+                rejected += len(rows)
+
+            # Коды могли попасть в кеш поиска ключей как несуществующие
+            cursor.execute("SELECT key_code FROM keys_import_staging WHERE reason = 'imported'")
+            while True:
+                rows = cursor.fetchmany(5000)
+                if not rows:
+                    break
+                key_lookup.invalidate(key_codes=[row[0] for row in rows])
+
+    if not rejected:
+        os.remove(report_path)
+        report_id = None
+
+    return ImportResult(created, rejected, report_id)
@@ -0,0 +1,111 @@
+import random
+import logging
+from collections import Counter
+from django.conf import settings
+from django.db import connections, transaction
+from django.db.models import Sum
+from .models import Key, KeyInventoryCounter
+
+logger = logging.getLogger('keys')
+
+
+def get_inventory_settings():
+    """Настройки счетчиков ключей с значениями по умолчанию"""
+    inventory_settings = getattr(settings, 'KEY_INVENTORY', {})
+    return {
+        'shards': inventory_settings.get('shards', 8),
+    }
+
+
+def record_inventory_deltas(deltas, using='default'):
+    """
+    Применение изменений счетчиков {(тип, статус): изменение} в текущей транзакции.
+    Вызывается тем же кодом, что меняет статусы ключей, поэтому счетчики фиксируются
+    и откатываются вместе с ключами. Все изменения пишутся одним INSERT ... ON CONFLICT
+    в случайный слот; после фиксации изменения рассылаются подписчикам WebSocket.
+    """
+    deltas = {pair: delta for pair, delta in deltas.items() if delta}
+    if not deltas:
+        return
+
+    table = KeyInventoryCounter._meta.db_table
+    slot = random.randrange(get_inventory_settings()['shards'])
+    # Постоянный порядок строк - параллельные транзакции блокируют слоты в одном порядке
+    pairs = sorted(deltas)
+    values = ', '.join(['(%s, %s, %s, %s)'] * len(pairs))
+    params = []
+    for key_type, status in pairs:
+        params.extend([key_type, status, slot, deltas[(key_type, status)]])
+
+    with connections[using].cursor() as cursor:
+        cursor.execute(
+            f'INSERT INTO {table} (key_type, status, slot, count) VALUES {values}'
+            f' ON CONFLICT (key_type, status, slot) DO UPDATE SET count = {table}.count + EXCLUDED.count',
+            params
+        )
+
+    from .notifications import send_inventory_update
+    send_inventory_update(deltas, using=using)
+
+
+def status_change_deltas(key_type, previous_status, status, count=1):
+    """Изменения счетчиков при переводе count ключей одного типа из previous_status в status"""
+    deltas = Counter()
+    if previous_status is not None:
+        deltas[(key_type, previous_status)] -= count
+    if status is not None:
+        deltas[(key_type, status)] += count
+    return deltas
+
+
+def inventory_counts(using='default'):
+    """
+    Количество ключей по типам и статусам из счетчиков: {тип: {статус: количество}}.
+    Читается сумма по слотам - не больше (типов x статусов x слотов) строк, независимо от числа ключей.
+    """
+    counts = {key_type: {status: 0 for status in Key.KeyStatus.values} for key_type in Key.KeyType.values}
+    rows = (
+        KeyInventoryCounter.objects.using(using).order_by()
+        .values_list('key_type', 'status').annotate(total=Sum('count'))
+    )
+    for key_type, status, total in rows:
+        counts.setdefault(key_type, {})[status] = total
+    return counts
+
+
+def reconcile_inventory(using='default'):
+    """
+    Пересчет счетчиков по таблице ключей и исправление расхождений без блокировки таблиц.
+    Количество ключей и сумма счетчиков читаются одним запросом, то есть из одного снимка
+    MVCC: счетчики меняются в той же транзакции, что и ключи, поэтому в снимке их разность -
+    точное расхождение, параллельные изменения в нее не попадают. GROUP BY по таблице ключей
+    не держит блокировок и не задерживает запись. Расхождение применяется как обычное
+    изменение счетчиков (record_inventory_deltas): прибавление коммутирует с параллельными
+    изменениями, поэтому результат верен, даже если ключи менялись после подсчета.
+    Возвращает расхождения {(тип, статус): фактическое - по счетчикам}.
+    """
+    connection = connections[using]
+    qn = connection.ops.quote_name
+    keys_table = qn(Key._meta.db_table)
+    counters_table = qn(KeyInventoryCounter._meta.db_table)
+
+    with connection.cursor() as cursor:
+        cursor.execute(
+            f"""
+            SELECT key_type, status, SUM(delta) FROM (
+                SELECT key_type, status, COUNT(*) AS delta FROM {keys_table} GROUP BY key_type, status
+                UNION ALL
+                SELECT key_type, status, -SUM(count) FROM {counters_table} GROUP BY key_type, status
+            ) AS inventory
+            GROUP BY key_type, status
+            HAVING SUM(delta) <> 0
+            """
+        )
+        drift = {(key_type, status): int(delta) for key_type, status, delta in cursor.fetchall()}
+
+    if drift:
+        with transaction.atomic(using=using):
+            record_inventory_deltas(drift, using=using)
+        logger.warning(f"Key inventory counters drifted, corrected: {drift}")
+
+    return drift
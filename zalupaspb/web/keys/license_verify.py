@@ -0,0 +1,59 @@
+"""
+Офлайн-проверка лицензионных токенов.
+Модуль не зависит от Django и может использоваться клиентом (лоадером) как есть,
+нужен только пакет cryptography и публичный ключ с /api/keys/license/public-key/.
+
+Формат токена: base64url(payload).base64url(signature), подпись Ed25519 над payload (JSON).
+Поля payload: v - версия формата, sub - id пользователя, typ - тип ключа,
+ent - окончание права доступа (unix time или null для бессрочного), gen - поколение лицензий
+пользователя, iat - время выдачи, exp - время, до которого токен действителен.
+"""
+import json
+import time
+import base64
+from cryptography.exceptions import InvalidSignature
+from cryptography.hazmat.primitives.asymmetric.ed25519 import Ed25519PublicKey
+
+LICENSE_TOKEN_VERSION = 1
+
+
+class LicenseError(Exception):
+    """Токен поврежден, подделан или истек"""
+
+
+def b64encode(data):
+    return base64.urlsafe_b64encode(data).rstrip(b'=').decode('ascii')
+
+
+def b64decode(data):
+    return base64.urlsafe_b64decode(data + '=' * (-len(data) % 4))
+
+
+def load_public_key(public_key_b64):
+    """Публичный ключ из base64url-строки (32 байта Ed25519)"""
+    return Ed25519PublicKey.from_public_bytes(b64decode(public_key_b64))
+
+
+def decode_license_token(token, public_key, verify_exp=True, now=None):
+    """
+    Проверка подписи и срока действия токена.
+    public_key - Ed25519PublicKey или base64url-строка. Возвращает payload или бросает LicenseError.
+    """
+    if isinstance(public_key, str):
+        public_key = load_public_key(public_key)
+
+    try:
+        payload_part, signature_part = token.split('.')
+        payload_bytes = b64decode(payload_part)
+        public_key.verify(b64decode(signature_part), payload_bytes)
+        payload = json.loads(payload_bytes)
+    except InvalidSignature:
+        raise LicenseError('Неверная подпись лицензии')
+    except (ValueError, TypeError, AttributeError):
+        raise LicenseError('Поврежденный токен лицензии')
+
+    if payload.get('v') != LICENSE_TOKEN_VERSION:
+        raise LicenseError('Неподдерживаемая версия лицензии')
+    if verify_exp and payload['exp'] <= (now if now is not None else time.time()):
+        raise LicenseError('Срок действия лицензии истек')
+    return payload
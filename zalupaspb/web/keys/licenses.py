@@ -0,0 +1,86 @@
+import json
+import hashlib
+import base64
+from datetime import timedelta
+from functools import lru_cache
+from django.conf import settings
+from django.core.exceptions import ImproperlyConfigured
+from django.utils import timezone
+from django.utils.dateparse import parse_datetime
+from cryptography.hazmat.primitives import serialization
+from cryptography.hazmat.primitives.asymmetric.ed25519 import Ed25519PrivateKey
+from .entitlements import get_entitlement
+from .license_verify import LICENSE_TOKEN_VERSION, LicenseError, b64encode, decode_license_token
+
+
+@lru_cache(maxsize=1)
+def get_signing_key():
+    """
+    Закрытый ключ Ed25519 для подписи лицензий.
+    Берется из LICENSE_PRIVATE_KEY (base64, 32 байта). Без него ключ выводится из SECRET_KEY
+    только при DEBUG = True, в продакшене ключ нужно задать явно (manage.py generate_license_key).
+    """
+    private_key = getattr(settings, 'LICENSE_PRIVATE_KEY', None)
+    if private_key:
+        seed = base64.urlsafe_b64decode(private_key + '=' * (-len(private_key) % 4))
+    elif not settings.DEBUG:
+        raise ImproperlyConfigured(
+            'LICENSE_PRIVATE_KEY не задан; сгенерируйте ключ командой manage.py generate_license_key'
+        )
+    else:
+        seed = hashlib.sha256(f'license-signing:{settings.SECRET_KEY}'.encode('utf-8')).digest()
+    return Ed25519PrivateKey.from_private_bytes(seed)
+
+
+def get_public_key_b64():
+    """Публичный ключ для офлайн-проверки лицензий клиентами"""
+    public_bytes = get_signing_key().public_key().public_bytes(
+        encoding=serialization.Encoding.Raw,
+        format=serialization.PublicFormat.Raw,
+    )
+    return b64encode(public_bytes)
+
+
+def issue_license(user, now=None):
+    """
+    Выдача подписанного токена лицензии по действующим ключам пользователя.
+    Токен живет LICENSE_TOKEN_TTL секунд, но не дольше права доступа.
+    Возвращает (token, payload) или (None, None), если действующего ключа нет.
+    """
+    now = now or timezone.now()
+    entitlement = get_entitlement(user.pk, now=now)
+    if entitlement['key_type'] is None:
+        return None, None
+
+    expires_at = parse_datetime(entitlement['expires_at']) if entitlement['expires_at'] else None
+    exp = now + timedelta(seconds=getattr(settings, 'LICENSE_TOKEN_TTL', 3600))
+    if expires_at and expires_at < exp:
+        exp = expires_at
+
+    payload = {
+        'v': LICENSE_TOKEN_VERSION,
+        'sub': str(user.pk),
+        'typ': entitlement['key_type'],
+        'ent': int(expires_at.timestamp()) if expires_at else None,
+        'gen': user.license_generation,
+        'iat': int(now.timestamp()),
+        'exp': int(exp.timestamp()),
+    }
+    payload_bytes = json.dumps(payload, separators=(',', ':'), sort_keys=True).encode('utf-8')
+    signature = get_signing_key().sign(payload_bytes)
+    return f'{b64encode(payload_bytes)}.{b64encode(signature)}', payload
+
+
+def check_refresh_token(user, token):
+    """
+    Проверка предыдущего токена при обновлении лицензии.
+    Срок действия не проверяется - клиент обновляет токен как раз по его истечении,
+    но токен должен принадлежать пользователю и иметь текущее поколение:
+    после отзыва ключа (Key.revoke) поколение увеличивается и старые лицензии не обновляются.
+    """
+    payload = decode_license_token(token, get_signing_key().public_key(), verify_exp=False)
+    if payload['sub'] != str(user.pk):
+        raise LicenseError('Лицензия выдана другому пользователю')
+    if payload['gen'] != user.license_generation:
+        raise LicenseError('Лицензия отозвана')
+    return payload
@@ -0,0 +1,100 @@
+from collections import namedtuple
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+from django.utils import timezone
+from .models import Key
+
+
+class KeyLookup(namedtuple('KeyLookup', ['id', 'key_code', 'status', 'key_type', 'expires_at', 'activated_by_id'])):
+    """Компактная запись о ключе в кеше"""
+    __slots__ = ()
+    
+    @property
+    def current_status(self):
+        """Статус с учетом истечения срока, как Key.current_status"""
+        if self.status in [Key.KeyStatus.ACTIVE, Key.KeyStatus.USED]:
+            if self.expires_at and timezone.now() > self.expires_at:
+                return Key.KeyStatus.EXPIRED
+        return self.status
+    
+    @property
+    def remaining_days(self):
+        """Оставшееся количество дней, как Key.remaining_days"""
+        if self.key_type == Key.KeyType.LIFETIME:
+            return float('inf')
+        if not self.expires_at:
+            return 0
+        return max(0, (self.expires_at - timezone.now()).days)
+
+
+# Значение в кеше для несуществующего кода/id (negative caching)
+MISSING = 'missing'
+
+
+class KeyLookupCache:
+    """
+    Кеш поиска ключей по key_code и id в Redis.
+    Хранит кортеж (id, key_code, status, key_type, expires_at, activated_by_id), для неизвестных
+    кодов - отметку MISSING с коротким TTL. Записи удаляются после фиксации транзакции,
+    изменившей ключ (сигнал post_save, redeem, массовое создание).
+    """
+
+    def __init__(self, ttl=300, negative_ttl=30):
+        self.ttl = ttl
+        self.negative_ttl = negative_ttl
+        self.hits = 0
+        self.misses = 0
+
+    @staticmethod
+    def _code_key(key_code):
+        return f'keylookup:code:{key_code}'
+
+    @staticmethod
+    def _id_key(key_id):
+        return f'keylookup:id:{key_id}'
+
+    def get(self, key_code=None, key_id=None):
+        """Поиск ключа по коду или id. Возвращает KeyLookup или None"""
+        if key_code is None and key_id is None:
+            raise ValueError('Необходимо указать key_code или key_id')
+
+        cache_key = self._code_key(key_code) if key_code is not None else self._id_key(key_id)
+        cached = cache.get(cache_key)
+        if cached is not None:
+            self.hits += 1
+            return None if cached == MISSING else KeyLookup(*cached)
+
+        self.misses += 1
+        lookup = {'key_code': key_code} if key_code is not None else {'id': key_id}
+        row = Key.objects.filter(**lookup).values_list(*KeyLookup._fields).first()
+        if row is None:
+            cache.set(cache_key, MISSING, self.negative_ttl)
+            return None
+
+        entry = KeyLookup(*row)
+        cache.set_many({self._code_key(entry.key_code): row, self._id_key(entry.id): row}, self.ttl)
+        return entry
+
+    def invalidate(self, key_ids=(), key_codes=(), using=None):
+        """Удаление записей после фиксации текущей транзакции"""
+        cache_keys = [self._id_key(key_id) for key_id in key_ids if key_id]
+        cache_keys += [self._code_key(key_code) for key_code in key_codes if key_code]
+        if cache_keys:
+            transaction.on_commit(lambda: cache.delete_many(cache_keys), using=using)
+
+    def invalidate_key(self, key, using=None):
+        """Удаление записей для экземпляра ключа"""
+        self.invalidate([key.id], [key.key_code], using=using)
+
+    def stats(self):
+        """Счетчики попаданий и промахов"""
+        total = self.hits + self.misses
+        return {
+            'hits': self.hits,
+            'misses': self.misses,
+            'hit_ratio': round(self.hits / total, 3) if total else None,
+        }
+
+
+key_lookup = KeyLookupCache(**getattr(settings, 'KEY_LOOKUP_CACHE', {}))
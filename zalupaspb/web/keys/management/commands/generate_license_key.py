@@ -0,0 +1,22 @@
+import base64
+from django.core.management.base import BaseCommand
+from cryptography.hazmat.primitives import serialization
+from cryptography.hazmat.primitives.asymmetric.ed25519 import Ed25519PrivateKey
+
+
+class Command(BaseCommand):
+    help = 'Генерирует ключ Ed25519 для подписи лицензий (значение LICENSE_PRIVATE_KEY)'
+    
+    def handle(self, *args, **options):
+        private_key = Ed25519PrivateKey.generate()
+        private_bytes = private_key.private_bytes(
+            encoding=serialization.Encoding.Raw,
+            format=serialization.PrivateFormat.Raw,
+            encryption_algorithm=serialization.NoEncryption(),
+        )
+        public_bytes = private_key.public_key().public_bytes(
+            encoding=serialization.Encoding.Raw,
+            format=serialization.PublicFormat.Raw,
+        )
+        self.stdout.write(f"LICENSE_PRIVATE_KEY={base64.urlsafe_b64encode(private_bytes).decode('ascii')}")
+        self.stdout.write(f"Публичный ключ: {base64.urlsafe_b64encode(public_bytes).rstrip(b'=').decode('ascii')}")
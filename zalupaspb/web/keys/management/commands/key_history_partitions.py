@@ -0,0 +1,69 @@
+from django.core.management.base import BaseCommand, CommandError
+from django.utils import timezone
+from logs.partitions import period_start
+from keys.history import (
+    setup_partitioning, is_partitioned, list_partitions,
+    maintain_partitions, archive_partitions_before, months_before
+)
+
+
+class Command(BaseCommand):
+    help = (
+        'Партиционирование истории ключей по месяцам: настройка, создание будущих партиций и архивация старых. '
+        'Служба очистки только создает партиции, архивацию запускайте этой командой по расписанию (например, раз в сутки)'
+    )
+    
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--setup',
+            action='store_true',
+            help='Преобразовать keys_keyhistory в партиционированную таблицу (однократно)'
+        )
+        parser.add_argument(
+            '--keep-legacy',
+            action='store_true',
+            help='При --setup не копировать данные: вся существующая история становится одной партицией legacy'
+        )
+        parser.add_argument(
+            '--archive-older-than',
+            type=int,
+            metavar='MONTHS',
+            help='Перенести в архив партиции старше указанного количества месяцев'
+        )
+        parser.add_argument(
+            '--list',
+            action='store_true',
+            help='Показать список партиций'
+        )
+    
+    def handle(self, *args, **options):
+        if options['setup']:
+            try:
+                if setup_partitioning(keep_legacy=options['keep_legacy']):
+                    self.stdout.write(self.style.SUCCESS('Таблица истории ключей преобразована в партиционированную'))
+                else:
+                    self.stdout.write('Таблица истории ключей уже партиционирована')
+            except RuntimeError as e:
+                raise CommandError(str(e))
+        
+        if not is_partitioned():
+            raise CommandError('Таблица истории ключей не партиционирована, выполните команду с --setup')
+        
+        try:
+            if options['archive_older_than'] is not None:
+                cutoff = months_before(period_start(timezone.now(), 'month'), options['archive_older_than'])
+                archived, rows = archive_partitions_before(cutoff)
+                self.stdout.write(f"Перенесено в архив партиций: {archived}, строк: {rows}")
+            else:
+                result = maintain_partitions()
+                self.stdout.write(
+                    f"Создано партиций: {len(result['created'])}, "
+                    f"перенесено в архив партиций: {result['archived']}, строк: {result['rows']}"
+                )
+        except RuntimeError as e:
+            raise CommandError(str(e))
+        
+        if options['list']:
+            for name, upper in list_partitions():
+                bound = upper.strftime('%Y-%m-%d') if upper else 'DEFAULT'
+                self.stdout.write(f"{name}: до {bound}")
@@ -0,0 +1,35 @@
+import time
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from keys.inventory import reconcile_inventory
+
+
+class Command(BaseCommand):
+    help = 'Пересчитывает счетчики ключей по типам и статусам и исправляет расхождения'
+    
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--loop',
+            action='store_true',
+            help='Пересчитывать периодически, а не один раз'
+        )
+        parser.add_argument(
+            '--interval',
+            type=int,
+            default=getattr(settings, 'KEY_INVENTORY', {}).get('reconcile_interval', 3600),
+            help='Пауза между пересчетами в секундах (для --loop)'
+        )
+    
+    def handle(self, *args, **options):
+        while True:
+            drift = reconcile_inventory()
+            
+            if drift:
+                for (key_type, status), delta in sorted(drift.items()):
+                    self.stdout.write(f"{key_type}/{status}: исправлено на {delta:+d}")
+            else:
+                self.stdout.write('Счетчики ключей совпадают с таблицей ключей')
+            
+            if not options['loop']:
+                break
+            time.sleep(options['interval'])
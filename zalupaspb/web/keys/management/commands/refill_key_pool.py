@@ -0,0 +1,31 @@
+import time
+from django.core.management.base import BaseCommand
+from keys.pool import key_pool
+
+
+class Command(BaseCommand):
+    help = 'Пополняет пул заранее сгенерированных кодов ключей до верхнего порога'
+    
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--loop',
+            action='store_true',
+            help='Проверять остаток пула периодически, а не один раз'
+        )
+        parser.add_argument(
+            '--interval',
+            type=int,
+            default=10,
+            help='Пауза между проверками в секундах (для --loop)'
+        )
+    
+    def handle(self, *args, **options):
+        while True:
+            added = key_pool.refill()
+            
+            for key_type, count in key_pool.depth().items():
+                self.stdout.write(f"{key_type}: {count} кодов в пуле (добавлено {added.get(key_type, 0)})")
+            
+            if not options['loop']:
+                break
+            time.sleep(options['interval'])
@@ -0,0 +1,42 @@
+import time
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from keys.sweeper import sweep_expired
+
+
+class Command(BaseCommand):
+    help = 'Переводит истекшие ключи и инвайты в статус EXPIRED и удаляет просроченные коды привязки'
+    
+    def add_arguments(self, parser):
+        sweeper_settings = getattr(settings, 'EXPIRY_SWEEPER', {})
+        parser.add_argument(
+            '--batch-size',
+            type=int,
+            default=sweeper_settings.get('batch_size', 1000),
+            help='Количество строк в одном UPDATE/DELETE'
+        )
+        parser.add_argument(
+            '--loop',
+            action='store_true',
+            help='Запускать очистку периодически, а не один раз'
+        )
+        parser.add_argument(
+            '--interval',
+            type=int,
+            default=sweeper_settings.get('interval', 60),
+            help='Пауза между проходами в секундах (для --loop)'
+        )
+    
+    def handle(self, *args, **options):
+        while True:
+            metrics = sweep_expired(batch_size=options['batch_size'])
+            
+            for name, stage in metrics.items():
+                if stage['error']:
+                    self.stderr.write(f"{name}: ошибка за {stage['seconds']} с - {stage['error']}")
+                else:
+                    self.stdout.write(f"{name}: {stage['rows']} строк за {stage['seconds']} с")
+            
+            if not options['loop']:
+                break
+            time.sleep(options['interval'])
@@ -0,0 +1,73 @@
+import os
+import re
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from django.core.management.base import BaseCommand, CommandError
+from keys.models import Loader
+from keys.storage import loader_storage, sha256_file
+
+# Имя файла в хранилище по содержимому: <sha256><расширение>
+DIGEST_NAME_RE = re.compile(r'^([0-9a-f]{64})(\.[^.]*)?$')
+
+
+class Command(BaseCommand):
+    help = 'Проверяет контрольные суммы файлов лоадеров (файлы читаются параллельно в нескольких процессах)'
+    
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--workers',
+            type=int,
+            default=os.cpu_count(),
+            help='Количество процессов для вычисления SHA-256 (по умолчанию - по числу CPU)'
+        )
+        parser.add_argument(
+            '--fill-missing',
+            action='store_true',
+            help='Записать вычисленную сумму лоадерам, у которых она не заполнена'
+        )
+    
+    def handle(self, *args, **options):
+        loaders = list(Loader.objects.exclude(file='').values_list('id', 'name', 'version', 'file', 'checksum'))
+        if not loaders:
+            self.stdout.write('Нет лоадеров с файлами')
+            return
+        
+        # Одинаковые загрузки хранятся одним файлом - каждый файл читается один раз
+        paths = {file_name: loader_storage.path(file_name) for _, _, _, file_name, _ in loaders}
+        digests, errors = {}, {}
+        with ProcessPoolExecutor(max_workers=options['workers']) as executor:
+            futures = {executor.submit(sha256_file, path): file_name for file_name, path in paths.items()}
+            for future in as_completed(futures):
+                file_name = futures[future]
+                try:
+                    digests[file_name] = future.result()
+                except OSError as e:
+                    errors[file_name] = e.strerror or str(e)
+        
+        failed = 0
+        for loader_id, name, version, file_name, checksum in loaders:
+            title = f"{name} v{version} ({file_name})"
+            if file_name in errors:
+                self.stdout.write(self.style.ERROR(f"{title}: файл недоступен - {errors[file_name]}"))
+                failed += 1
+                continue
+            
+            digest = digests[file_name]
+            match = DIGEST_NAME_RE.match(os.path.basename(file_name))
+            if match and match.group(1) != digest:
+                self.stdout.write(self.style.ERROR(f"{title}: содержимое не совпадает с именем файла"))
+                failed += 1
+            elif not checksum:
+                if options['fill_missing']:
+                    Loader.objects.filter(pk=loader_id).update(checksum=digest)
+                    self.stdout.write(f"{title}: контрольная сумма записана")
+                else:
+                    self.stdout.write(self.style.WARNING(f"{title}: контрольная сумма не заполнена"))
+            elif checksum.lower() != digest:
+                self.stdout.write(self.style.ERROR(f"{title}: контрольная сумма не совпадает"))
+                failed += 1
+            else:
+                self.stdout.write(f"{title}: OK")
+        
+        if failed:
+            raise CommandError(f'Проверка не пройдена для {failed} из {len(loaders)} лоадеров')
+        self.stdout.write(self.style.SUCCESS(f'Проверено лоадеров: {len(loaders)}, файлов: {len(paths)}'))
@@ -1,15 +1,237 @@
-from django.db import models
+from django.db import models, transaction, connections, IntegrityError
 from django.utils.translation import gettext_lazy as _
 from django.utils import timezone
 from django.conf import settings
+from django.contrib.auth import get_user_model
+from zalupaspb.tracking import FieldTrackerMixin
+from .codes import generate_key_code
+from .storage import loader_storage, content_sha256
+from collections import Counter
 import uuid
-import string
-import random
 
 
-class Key(models.Model):
+class KeyQuerySet(models.QuerySet):
+    """Набор запросов для ключей с массовыми операциями"""
+    
+    def with_effective_status(self, now=None):
+        """
+        Добавляет аннотацию effective_status - статус с учетом истечения срока,
+        вычисленный в SQL без записи в базу.
+        """
+        now = now or timezone.now()
+        return self.annotate(
+            effective_status=models.Case(
+                models.When(
+                    status__in=[Key.KeyStatus.ACTIVE, Key.KeyStatus.USED],
+                    expires_at__lt=now,
+                    then=models.Value(Key.KeyStatus.EXPIRED),
+                ),
+                default=models.F('status'),
+                output_field=models.CharField(),
+            )
+        )
+    
+    def redeem(self, user, key_code=None, key_id=None, now=None):
+        """
+        Атомарная активация ключа по коду или id.
+        Статус проверяется и меняется одним условным UPDATE ... RETURNING,
+        запись истории добавляется в той же транзакции. Из двух параллельных
+        активаций одного ключа успешна только одна.
+        Возвращает активированный ключ или None, если ключ не найден или не активен.
+        """
+        if key_code is None and key_id is None:
+            raise ValueError('Необходимо указать key_code или key_id')
+        
+        now = now or timezone.now()
+        fields = Key._meta.concrete_fields
+        columns = ', '.join(connections[self.db].ops.quote_name(field.column) for field in fields)
+        lookup_column = 'key_code' if key_code is not None else 'id'
+        
+        with transaction.atomic(using=self.db):
+            with connections[self.db].cursor() as cursor:
+                cursor.execute(
+                    f"""
+                    UPDATE {Key._meta.db_table}
+                    SET status = %s,
+                        activated_by_id = %s,
+                        activated_at = %s,
+                        expires_at = CASE
+                            WHEN key_type = %s THEN NULL
+                            ELSE COALESCE(expires_at, %s + duration_days * INTERVAL '1 day')
+                        END
+                    WHERE {lookup_column} = %s
+                      AND status = %s
+                      AND (expires_at IS NULL OR expires_at > %s)
+                    RETURNING {columns}
+                    """,
+                    [
+                        Key.KeyStatus.USED, user.pk, now,
+                        Key.KeyType.LIFETIME, now,
+                        key_code if key_code is not None else key_id,
+                        Key.KeyStatus.ACTIVE, now,
+                    ]
+                )
+                row = cursor.fetchone()
+            
+            if row is None:
+                return None
+            
+            key = Key.from_db(self.db, [field.attname for field in fields], row)
+            from .inventory import record_inventory_deltas, status_change_deltas
+            record_inventory_deltas(
+                status_change_deltas(key.key_type, Key.KeyStatus.ACTIVE, Key.KeyStatus.USED), using=self.db
+            )
+            KeyHistory.objects.using(self.db).create(
+                key=key,
+                action=KeyHistory.ActionType.ACTIVATED,
+                user=user,
+                details=f"Ключ активирован пользователем {user}"
+            )
+            
+            # Уведомление и сброс кеша права доступа - только после фиксации транзакции
+            from .notifications import send_key_status_update
+            from .entitlements import invalidate_entitlement
+            from .lookup import key_lookup
+            send_key_status_update(key.id, key.status, 'status_changed', key.key_type, using=self.db)
+            invalidate_entitlement(user.pk, using=self.db)
+            key_lookup.invalidate_key(key, using=self.db)
+        
+        return key
+    
+    def expire_overdue(self, batch_size=1000, now=None):
+        """
+        Переводит просроченные ключи в статус EXPIRED пачками.
+        Для каждой пачки одним UPDATE меняется статус и одной вставкой
+        создаются записи истории. Возвращает количество истекших ключей.
+        """
+        from .inventory import record_inventory_deltas, status_change_deltas
+        now = now or timezone.now()
+        live_statuses = [Key.KeyStatus.ACTIVE, Key.KeyStatus.USED]
+        total = 0
+        
+        while True:
+            with transaction.atomic(using=self.db):
+                rows = list(
+                    self.filter(status__in=live_statuses, expires_at__lt=now)
+                    .order_by()
+                    .select_for_update(skip_locked=True)
+                    .values_list('id', 'key_type', 'status')[:batch_size]
+                )
+                if not rows:
+                    break
+                
+                ids = [key_id for key_id, _, _ in rows]
+                self.model.objects.using(self.db).filter(id__in=ids).update(status=Key.KeyStatus.EXPIRED)
+                deltas = Counter()
+                for _, key_type, status in rows:
+                    deltas.update(status_change_deltas(key_type, status, Key.KeyStatus.EXPIRED))
+                record_inventory_deltas(deltas, using=self.db)
+                KeyHistory.objects.using(self.db).bulk_create([
+                    KeyHistory(
+                        key_id=key_id,
+                        action=KeyHistory.ActionType.EXPIRED,
+                        details="Срок действия ключа истек"
+                    )
+                    for key_id in ids
+                ])
+            total += len(ids)
+        
+        return total
+    
+    def bulk_set_status(self, status, user=None, chunk_size=1000):
+        """
+        Массовый перевод ключей выборки в статус REVOKED или EXPIRED.
+        Затрагиваются только активные и использованные ключи. Выборка обходится пачками
+        по id; для каждой пачки один UPDATE ... RETURNING меняет статус, записи истории
+        создаются одной вставкой по вернувшимся id, уведомления ставятся в outbox вместе
+        и уходят объединенными сообщениями key_status_batch. Сигнал post_save не вызывается.
+        Возвращает количество измененных ключей.
+        """
+        if status not in self.model.BULK_STATUS_ACTIONS:
+            raise ValueError(f'Массовый перевод в статус {status} не поддерживается')
+        
+        live_statuses = [Key.KeyStatus.ACTIVE, Key.KeyStatus.USED]
+        queryset = self.filter(status__in=live_statuses).order_by('id')
+        total = 0
+        last_id = None
+        
+        while True:
+            chunk = queryset if last_id is None else queryset.filter(id__gt=last_id)
+            ids = list(chunk.values_list('id', flat=True)[:chunk_size])
+            if not ids:
+                break
+            last_id = ids[-1]
+            total += self._set_status_chunk(ids, status, user, live_statuses)
+        
+        return total
+    
+    def _set_status_chunk(self, ids, status, user, live_statuses):
+        """Перевод одной пачки ключей в статус (см. bulk_set_status)"""
+        action, details = self.model.BULK_STATUS_ACTIONS[status]
+        
+        with transaction.atomic(using=self.db):
+            with connections[self.db].cursor() as cursor:
+                # Прежний статус нужен для счетчиков - строки блокируются и читаются в том же запросе
+                cursor.execute(
+                    f"""
+                    WITH previous AS (
+                        SELECT id, status FROM {Key._meta.db_table}
+                        WHERE id = ANY(%s) AND status = ANY(%s)
+                        FOR UPDATE
+                    )
+                    UPDATE {Key._meta.db_table} k
+                    SET status = %s
+                    FROM previous
+                    WHERE k.id = previous.id
+                    RETURNING k.id, k.key_code, k.key_type, k.activated_by_id, previous.status
+                    """,
+                    [ids, live_statuses, status]
+                )
+                changed = cursor.fetchall()
+            
+            if not changed:
+                return 0
+            
+            from .inventory import record_inventory_deltas, status_change_deltas
+            deltas = Counter()
+            for _, _, key_type, _, previous_status in changed:
+                deltas.update(status_change_deltas(key_type, previous_status, status))
+            record_inventory_deltas(deltas, using=self.db)
+            rows = [row[:4] for row in changed]
+            
+            KeyHistory.objects.using(self.db).bulk_create([
+                KeyHistory(key_id=key_id, action=action, user=user, details=details)
+                for key_id, _, _, _ in rows
+            ])
+            
+            owner_ids = {owner_id for _, _, _, owner_id in rows if owner_id}
+            if status == Key.KeyStatus.REVOKED and owner_ids:
+                # Лицензии владельцев отозванных ключей перестают обновляться (как в Key.revoke)
+                get_user_model().objects.using(self.db).filter(pk__in=owner_ids).update(
+                    license_generation=models.F('license_generation') + 1
+                )
+            
+            # Уведомления и сброс кешей - после фиксации пачки
+            from .notifications import send_key_status_updates
+            from .entitlements import invalidate_entitlement
+            from .lookup import key_lookup
+            send_key_status_updates(
+                [(key_id, key_type) for key_id, _, key_type, _ in rows], status, 'status_changed', using=self.db
+            )
+            invalidate_entitlement(*owner_ids, using=self.db)
+            key_lookup.invalidate(
+                [key_id for key_id, _, _, _ in rows], [key_code for _, key_code, _, _ in rows], using=self.db
+            )
+        
+        return len(rows)
+
+
+class Key(FieldTrackerMixin, models.Model):
     """Модель ключа доступа к сервисам"""
     
+    # Поля, изменения которых отслеживаются сигналами без повторного чтения из базы
+    tracked_fields = ('status', 'activated_by', 'key_code', 'key_type')
+    
     class KeyType(models.TextChoices):
         STANDARD = 'standard', _('Стандартный')
         PREMIUM = 'premium', _('Премиум')
@@ -21,6 +243,12 @@ class Key(models.Model):
         EXPIRED = 'expired', _('Истёк')
         REVOKED = 'revoked', _('Отозван')
     
+    # Статусы, доступные для массового перевода (KeyQuerySet.bulk_set_status): действие и текст истории
+    BULK_STATUS_ACTIONS = {
+        KeyStatus.REVOKED: ('revoked', "Ключ отозван"),
+        KeyStatus.EXPIRED: ('expired', "Срок действия ключа истек"),
+    }
+    
     # Основная информация
     id = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False)
     key = models.CharField(max_length=36, unique=True, verbose_name=_('Ключ'))
@@ -64,10 +292,22 @@ class Key(models.Model):
     # Дополнительная информация
     notes = models.TextField(blank=True, null=True, verbose_name=_('Примечания'))
     
+    objects = KeyQuerySet.as_manager()
+    
     class Meta:
         verbose_name = _('Ключ')
         verbose_name_plural = _('Ключи')
         ordering = ['-created_at']
+        indexes = [
+            # Составной индекс для курсорной пагинации по (created_at, id)
+            models.Index(fields=['-created_at', '-id'], name='keys_key_created_id_idx'),
+            # Частичный индекс для поиска просроченных ключей фоновой очисткой
+            models.Index(
+                fields=['expires_at'],
+                name='keys_key_live_expires_idx',
+                condition=models.Q(status__in=['active', 'used']),
+            ),
+        ]
     
     def __str__(self):
         key_name = self.key_code if self.key_code else self.key
@@ -80,7 +320,7 @@ class Key(models.Model):
             
         # Генерируем код ключа только если он не указан вручную
         if not self.key_code:
-            self.key_code = self.generate_key_code()
+            self.key_code = self.generate_key_code(self.key_type, self.duration_days)
         
         # Для пожизненных ключей не устанавливаем дату истечения
         if self.key_type == self.KeyType.LIFETIME:
@@ -89,23 +329,19 @@ class Key(models.Model):
         elif self.activated_at and not self.expires_at:
             self.expires_at = self.activated_at + timezone.timedelta(days=self.duration_days)
         
-        super().save(*args, **kwargs)
-    
-    def activate(self, user):
-        """Активация ключа пользователем"""
-        if self.status != self.KeyStatus.ACTIVE:
-            return False
-        
-        self.activated_by = user
-        self.activated_at = timezone.now()
-        self.status = self.KeyStatus.USED
-        self.save()
-        return True
+        # Сигнал post_save меняет счетчики ключей (keys.inventory) в той же транзакции
+        with transaction.atomic(using=kwargs.get('using')):
+            super().save(*args, **kwargs)
     
     def revoke(self):
-        """Отзыв ключа"""
-        self.status = self.KeyStatus.REVOKED
-        self.save()
+        """Отзыв ключа. Выданные владельцу лицензии перестают обновляться (см. keys.licenses)"""
+        with transaction.atomic():
+            self.status = self.KeyStatus.REVOKED
+            self.save()
+            if self.activated_by_id:
+                get_user_model().objects.filter(pk=self.activated_by_id).update(
+                    license_generation=models.F('license_generation') + 1
+                )
         return True
     
     def check_expiry(self):
@@ -116,17 +352,23 @@ class Key(models.Model):
                 self.save()
         return self.status
     
+    @property
+    def current_status(self):
+        """Статус с учетом истечения срока (без записи в базу)"""
+        if self.status in [self.KeyStatus.ACTIVE, self.KeyStatus.USED]:
+            if self.expires_at and timezone.now() > self.expires_at:
+                return self.KeyStatus.EXPIRED
+        return self.status
+    
     @property
     def is_active(self):
         """Проверка активности ключа"""
-        self.check_expiry()
-        return self.status == self.KeyStatus.ACTIVE
+        return self.current_status == self.KeyStatus.ACTIVE
     
     @property
     def is_valid(self):
         """Проверка валидности ключа (активен или использован и не истек)"""
-        self.check_expiry()
-        return self.status in [self.KeyStatus.ACTIVE, self.KeyStatus.USED]
+        return self.current_status in [self.KeyStatus.ACTIVE, self.KeyStatus.USED]
     
     @property
     def remaining_days(self):
@@ -147,8 +389,7 @@ class Key(models.Model):
     @property
     def is_expired(self):
         """Проверка, истек ли срок действия ключа"""
-        self.check_expiry()
-        return self.status == self.KeyStatus.EXPIRED
+        return self.current_status == self.KeyStatus.EXPIRED
     
     @classmethod
     def generate_key(cls):
@@ -159,17 +400,76 @@ class Key(models.Model):
                 return key
                 
     @classmethod
-    def generate_key_code(cls):
-        """Генерация удобного кода ключа для пользователя"""
-        chars = string.ascii_uppercase + string.digits
+    def generate_key_code(cls, key_type=None, duration_days=None):
+        """Генерация удобного кода ключа с контрольной группой (см. keys.codes)"""
         while True:
-            # Создаем легко читаемый код (пример: ABCD-1234-XYZ9)
-            code = ''.join(random.choices(chars, k=4)) + '-' + \
-                   ''.join(random.choices(chars, k=4)) + '-' + \
-                   ''.join(random.choices(chars, k=4))
-            
+            code = generate_key_code(key_type, duration_days)
             if not cls.objects.filter(key_code=code).exists():
                 return code
+    
+    @classmethod
+    def bulk_generate(cls, count, key_type=KeyType.STANDARD, duration_days=30, created_by=None,
+                      notes=None, batch_size=5000):
+        """
+        Массовая генерация ключей.
+        Кандидаты создаются пачками, коллизии отсекаются одним запросом key_code__in
+        на пачку, ключи и записи истории вставляются через bulk_create.
+        Сигнал post_save при этом не вызывается.
+        """
+        key_type_display = dict(cls.KeyType.choices).get(key_type, key_type)
+        details = f"Создан ключ типа {key_type_display} с длительностью {duration_days} дней"
+        
+        created = []
+        while len(created) < count:
+            size = min(batch_size, count - len(created))
+            
+            # Генерируем кандидатов, повторы внутри пачки отсекает set
+            candidates = set()
+            while len(candidates) < size:
+                candidates.add(generate_key_code(key_type, duration_days))
+            
+            taken = set(cls.objects.filter(key_code__in=candidates).values_list('key_code', flat=True))
+            codes = [code for code in candidates if code not in taken]
+            
+            batch = [
+                cls(
+                    key=str(uuid.uuid4()),
+                    key_code=code,
+                    key_type=key_type,
+                    duration_days=duration_days,
+                    created_by=created_by,
+                    notes=notes,
+                )
+                for code in codes
+            ]
+            
+            try:
+                with transaction.atomic():
+                    cls.objects.bulk_create(batch, batch_size=batch_size)
+                    from .inventory import record_inventory_deltas, status_change_deltas
+                    record_inventory_deltas(status_change_deltas(key_type, None, cls.KeyStatus.ACTIVE, len(batch)))
+                    KeyHistory.objects.bulk_create(
+                        [
+                            KeyHistory(
+                                key=key,
+                                action=KeyHistory.ActionType.CREATED,
+                                user=created_by,
+                                details=details,
+                            )
+                            for key in batch
+                        ],
+                        batch_size=batch_size,
+                    )
+            except IntegrityError:
+                # Код успели занять параллельно - повторяем пачку с новыми кандидатами
+                continue
+            
+            # Коды могли попасть в кеш как несуществующие
+            from .lookup import key_lookup
+            key_lookup.invalidate(key_codes=codes)
+            created.extend(batch)
+        
+        return created
 
 
 class KeyHistory(models.Model):
@@ -198,11 +498,59 @@ class KeyHistory(models.Model):
         verbose_name = _('История ключа')
         verbose_name_plural = _('История ключей')
         ordering = ['-timestamp']
+        indexes = [
+            # История ключа от новых записей к старым (keys.history.get_key_history)
+            models.Index(fields=['key', '-timestamp'], name='keys_history_key_ts_idx'),
+        ]
     
     def __str__(self):
         return f"{self.key} - {self.get_action_display()}"
 
 
+class KeyPoolEntry(models.Model):
+    """Заранее сгенерированная пара ключ/код, еще не выданная (см. keys.pool)"""
+    
+    id = models.BigAutoField(primary_key=True)
+    key = models.CharField(max_length=36, unique=True, verbose_name=_('Ключ'))
+    key_code = models.CharField(max_length=100, unique=True, verbose_name=_('Код ключа'))
+    key_type = models.CharField(max_length=20, choices=Key.KeyType.choices, verbose_name=_('Тип ключа'))
+    created_at = models.DateTimeField(auto_now_add=True, verbose_name=_('Дата создания'))
+    
+    class Meta:
+        verbose_name = _('Код в пуле')
+        verbose_name_plural = _('Пул кодов ключей')
+        indexes = [
+            # Выдача из пула по типу в порядке создания
+            models.Index(fields=['key_type', 'id'], name='keys_pool_type_id_idx'),
+        ]
+    
+    def __str__(self):
+        return f"{self.key_code} ({self.get_key_type_display()})"
+
+
+class KeyInventoryCounter(models.Model):
+    """
+    Счетчик ключей по типу и статусу (см. keys.inventory).
+    Каждая пара (тип, статус) разбита на несколько строк-слотов, чтобы параллельные
+    изменения не ждали блокировки одной строки; значение счетчика - сумма по слотам.
+    """
+    
+    key_type = models.CharField(max_length=20, choices=Key.KeyType.choices, verbose_name=_('Тип ключа'))
+    status = models.CharField(max_length=20, choices=Key.KeyStatus.choices, verbose_name=_('Статус'))
+    slot = models.PositiveSmallIntegerField(default=0, verbose_name=_('Слот'))
+    count = models.BigIntegerField(default=0, verbose_name=_('Количество'))
+    
+    class Meta:
+        verbose_name = _('Счетчик ключей')
+        verbose_name_plural = _('Счетчики ключей')
+        constraints = [
+            models.UniqueConstraint(fields=['key_type', 'status', 'slot'], name='keys_inventory_counter_uniq'),
+        ]
+    
+    def __str__(self):
+        return f"{self.key_type}/{self.status}[{self.slot}]: {self.count}"
+
+
 class Loader(models.Model):
     """Модель для управления версиями лоадера"""
     VERSION_TYPES = (
@@ -216,7 +564,8 @@ class Loader(models.Model):
     version = models.CharField(max_length=20)
     version_type = models.CharField(max_length=20, choices=VERSION_TYPES, default='stable')
     description = models.TextField(blank=True, null=True)
-    file = models.FileField(upload_to='loaders/')
+    # Файлы хранятся по SHA-256 содержимого, одинаковые загрузки занимают место один раз
+    file = models.FileField(upload_to='loaders/', storage=loader_storage)
     upload_date = models.DateTimeField(auto_now_add=True)
     uploaded_by = models.ForeignKey(
         settings.AUTH_USER_MODEL,
@@ -227,7 +576,7 @@ class Loader(models.Model):
     )
     is_active = models.BooleanField(default=True)
     download_count = models.IntegerField(default=0)
-    checksum = models.CharField(max_length=100, blank=True, null=True)  # Для проверки целостности файла
+    checksum = models.CharField(max_length=100, blank=True, null=True)  # SHA-256 файла, заполняется при загрузке
     
     class Meta:
         ordering = ['-upload_date']
@@ -237,10 +586,16 @@ class Loader(models.Model):
     def __str__(self):
         return f"{self.name} v{self.version} ({self.get_version_type_display()})"
     
+    def save(self, *args, **kwargs):
+        # Контрольная сумма нового файла: для загрузки она уже посчитана обработчиком загрузки
+        if self.file and not self.file._committed:
+            self.checksum = content_sha256(self.file.file)
+        super().save(*args, **kwargs)
+    
     def increment_download(self):
-        """Увеличивает счетчик загрузок"""
-        self.download_count += 1
-        self.save(update_fields=['download_count'])
+        """Увеличивает счетчик загрузок одним UPDATE, без потери параллельных увеличений"""
+        Loader.objects.filter(pk=self.pk).update(download_count=models.F('download_count') + 1)
+        self.refresh_from_db(fields=['download_count'])
     
     def make_inactive(self):
         """Деактивирует лоадер"""
@@ -0,0 +1,78 @@
+import uuid
+from django.db import transaction
+from django.utils import timezone
+from .outbox import outbox
+
+
+# Группа всех обновлений статуса ключей
+KEY_STATUS_GROUP = 'key_status_updates'
+
+# Группа изменений счетчиков ключей по типам и статусам (keys.inventory)
+KEY_INVENTORY_GROUP = 'key_status.inventory'
+
+
+def key_group(key_id):
+    """Группа обновлений одного ключа"""
+    return f'key_status.key.{key_id}'
+
+
+def key_type_group(key_type):
+    """Группа обновлений ключей одного типа"""
+    return f'key_status.type.{key_type}'
+
+
+def _key_status_event(key_id, status, action, key_type):
+    """Событие об изменении статуса ключа и группы, в которые оно рассылается"""
+    message = {
+        'type': 'key_status_update',
+        'event_id': uuid.uuid4().hex,
+        'key_id': str(key_id),
+        'status': status,
+        'action': action,
+        'timestamp': timezone.now().isoformat(),
+    }
+    groups = [KEY_STATUS_GROUP, key_group(key_id)]
+    if key_type:
+        groups.append(key_type_group(key_type))
+    return groups, message
+
+
+def send_key_status_update(key_id, status, action, key_type=None, using=None):
+    """
+    Отправка уведомления об изменении статуса ключа через WebSocket.
+    Событие попадает в outbox только после фиксации транзакции и отправляется фоновым потоком,
+    поэтому сохранение ключа не ждет Redis, а при откате транзакции уведомление не уходит.
+    Событие рассылается в общую группу, группу ключа и группу его типа - его получают
+    только сокеты, подписанные на что-то из этого (см. KeyStatusConsumer). В группу ключа
+    outbox отправляет событие, только если на ключ кто-то подписан (keys.subscriptions).
+    По event_id сокет, состоящий в нескольких из этих групп, отбрасывает повторы.
+    """
+    groups, message = _key_status_event(key_id, status, action, key_type)
+    transaction.on_commit(lambda: outbox.put(groups, message), using=using)
+
+
+def send_key_status_updates(keys, status, action, using=None):
+    """
+    Уведомления об изменении статуса списка ключей [(key_id, key_type), ...].
+    События ставятся в outbox одной записью и уходят в группы объединенными сообщениями key_status_batch.
+    """
+    events = [_key_status_event(key_id, status, action, key_type) for key_id, key_type in keys]
+    if events:
+        transaction.on_commit(lambda: outbox.put_many(events), using=using)
+
+
+def send_inventory_update(deltas, using=None):
+    """
+    Рассылка изменений счетчиков ключей {(тип, статус): изменение} после фиксации транзакции.
+    Событие получают сокеты, подписанные на все обновления или на счетчики.
+    """
+    message = {
+        'type': 'key_inventory_update',
+        'event_id': uuid.uuid4().hex,
+        'deltas': [
+            {'key_type': key_type, 'status': status, 'delta': delta}
+            for (key_type, status), delta in sorted(deltas.items())
+        ],
+        'timestamp': timezone.now().isoformat(),
+    }
+    transaction.on_commit(lambda: outbox.put([KEY_STATUS_GROUP, KEY_INVENTORY_GROUP], message), using=using)
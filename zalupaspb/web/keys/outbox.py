@@ -0,0 +1,286 @@
+import os
+import time
+import atexit
+import queue
+import asyncio
+import logging
+import threading
+from django.conf import settings
+
+logger = logging.getLogger('keys')
+
+# Типы событий, которые объединяются в одно сообщение на группу, и тип объединенного сообщения
+BATCH_TYPES = {
+    'key_status_update': 'key_status_batch',
+    'key_inventory_update': 'key_inventory_batch',
+    'user_status_update': 'user_status_batch',
+}
+
+
+class NotificationOutbox:
+    """
+    Исходящая очередь WebSocket-уведомлений.
+    Код, сохраняющий данные, только кладет событие в ограниченную очередь процесса,
+    а фоновый поток отправляет события пачками в channel layer. Поэтому запрос
+    не ждет Redis, а недоступность Redis приводит к повторам, а не к таймаутам сохранения.
+    События одного типа, накопленные для группы за flush_interval, отправляются одним
+    сообщением *_batch (не больше max_batch_events событий), поэтому массовая операция
+    дает несколько сообщений на группу, а не по сообщению на объект. В группы отдельных
+    ключей события отправляются, только если на ключ подписан хотя бы один сокет (keys.subscriptions).
+    При завершении процесса (atexit) оставшиеся в очереди события отправляются
+    не дольше drain_timeout секунд; не отправленные за это время учитываются как потерянные.
+    """
+
+    def __init__(self, batch_size=1000, flush_interval=0.1, max_queue_size=10000, max_retries=5, retry_delay=0.5,
+                 max_batch_events=500, drain_timeout=5.0):
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.max_batch_events = max_batch_events
+        self.max_retries = max_retries
+        self.retry_delay = retry_delay
+        self.drain_timeout = drain_timeout
+        self.queue = queue.Queue(maxsize=max_queue_size)
+
+        # Счетчики: отправленные, отброшенные при переполнении, повторы, потерянные после всех повторов
+        self.sent_count = 0
+        self.dropped_count = 0
+        self.retry_count = 0
+        self.failed_count = 0
+        # Группы отдельных ключей, в которые событие не отправлялось: на них никто не подписан
+        self.skipped_group_count = 0
+        # Вызовы group_send (с повторами): всего, за последний flush и наибольшее число за один flush
+        self.group_send_count = 0
+        self.flush_count = 0
+        self.last_flush_group_sends = 0
+        self.max_flush_group_sends = 0
+        # События, отправленные и потерянные при завершении процесса
+        self.drained_count = 0
+        self.lost_count = 0
+
+        self._thread = None
+        self._pid = None
+        self._start_lock = threading.Lock()
+        self._stop_event = threading.Event()
+        # Количество событий пачки, которую фоновый поток отправляет сейчас
+        self._in_flight = 0
+        atexit.register(self.close)
+
+    def _ensure_worker(self):
+        """Запуск фонового потока (повторно - после fork воркера gunicorn)"""
+        if self._thread is not None and self._thread.is_alive() and self._pid == os.getpid():
+            return
+
+        with self._start_lock:
+            if self._thread is not None and self._thread.is_alive() and self._pid == os.getpid():
+                return
+            self._pid = os.getpid()
+            self._thread = threading.Thread(target=self._run, name='NotificationOutbox', daemon=True)
+            self._thread.start()
+
+    def put(self, groups, message):
+        """Постановка события для группы или списка групп в очередь без ожидания"""
+        self.put_many([(groups, message)])
+
+    def put_many(self, events):
+        """Постановка списка событий [(группы, сообщение), ...] одной записью очереди"""
+        events = [((groups,) if isinstance(groups, str) else tuple(groups), message) for groups, message in events]
+        if self._stop_event.is_set() and self._pid == os.getpid():
+            # Процесс завершается, очередь уже отправлена
+            self.lost_count += len(events)
+            return
+        try:
+            self.queue.put_nowait(events)
+        except queue.Full:
+            self.dropped_count += len(events)
+            logger.warning(f"Notification outbox is full, dropped {len(events)} {events[0][1].get('type')} events")
+            return
+
+        self._ensure_worker()
+
+    def _run(self):
+        """Цикл фонового потока. Event loop живет все время работы потока, чтобы пул соединений channel layer переиспользовался"""
+        loop = asyncio.new_event_loop()
+        asyncio.set_event_loop(loop)
+        try:
+            while not self._stop_event.is_set():
+                batch = self._collect_batch()
+                if not batch:
+                    continue
+                self._in_flight = len(batch)
+                try:
+                    loop.run_until_complete(self._publish(self._coalesce(batch)))
+                except Exception as e:
+                    # Ошибка одной пачки (реестр подписок, channel layer) не должна останавливать поток
+                    self.failed_count += len(batch)
+                    logger.exception(f"Error publishing {len(batch)} WebSocket notifications: {e}")
+                    continue
+                finally:
+                    self._in_flight = 0
+                if self._stop_event.is_set():
+                    # Пачка, досланная после сигнала остановки
+                    self.drained_count += len(batch)
+        finally:
+            loop.close()
+
+    def _collect_batch(self):
+        """
+        Ждет первое событие, затем добирает пачку до batch_size событий или до истечения flush_interval.
+        None в очереди - сигнал остановки из close().
+        """
+        first = self.queue.get()
+        if first is None:
+            return []
+        batch = list(first)
+        deadline = time.monotonic() + self.flush_interval
+        while len(batch) < self.batch_size:
+            timeout = deadline - time.monotonic()
+            if timeout <= 0:
+                break
+            try:
+                events = self.queue.get(timeout=timeout)
+            except queue.Empty:
+                break
+            if events is None:
+                break
+            batch.extend(events)
+        return batch
+
+    def close(self, timeout=None):
+        """
+        Отправка оставшихся событий при завершении процесса (регистрируется в atexit).
+        Фоновый поток заканчивает текущую пачку, остаток очереди отправляется в вызывающем
+        потоке; все вместе - не дольше timeout (по умолчанию drain_timeout) секунд.
+        """
+        if self._pid != os.getpid():
+            # В этом процессе outbox не использовался (или процесс получен fork без своего потока)
+            return
+        deadline = time.monotonic() + (self.drain_timeout if timeout is None else timeout)
+
+        self._stop_event.set()
+        try:
+            self.queue.put_nowait(None)
+        except queue.Full:
+            pass
+        if self._thread is not None and self._thread.is_alive():
+            self._thread.join(timeout=max(deadline - time.monotonic(), 0))
+        if self._thread is not None and self._thread.is_alive():
+            # Пачка фонового потока не успела уйти и пропадет вместе с процессом
+            self.lost_count += self._in_flight
+
+        pending = []
+        while True:
+            try:
+                events = self.queue.get_nowait()
+            except queue.Empty:
+                break
+            if events is not None:
+                pending.extend(events)
+        if not pending:
+            return
+
+        failed_before = self.failed_count
+        loop = asyncio.new_event_loop()
+        try:
+            loop.run_until_complete(
+                asyncio.wait_for(self._publish(self._coalesce(pending)), max(deadline - time.monotonic(), 0.001))
+            )
+            sent = self.failed_count == failed_before
+        except asyncio.TimeoutError:
+            sent = False
+        except Exception as e:
+            logger.error(f"Error draining {len(pending)} WebSocket notifications on shutdown: {e}")
+            sent = False
+        finally:
+            loop.close()
+
+        if sent:
+            self.drained_count += len(pending)
+        else:
+            self.lost_count += len(pending)
+            logger.warning(f"Notification outbox lost {len(pending)} events on shutdown (drain_timeout exceeded or Redis unavailable)")
+
+    def _coalesce(self, batch):
+        """
+        Пачка из очереди в список (группа, сообщение) для group_send.
+        Несколько событий одного типа из BATCH_TYPES для группы объединяются в сообщения
+        {'type': '<тип>_batch', 'events': [...]}, одиночные события отправляются как есть.
+        """
+        from .subscriptions import key_subscriptions
+
+        by_group = {}
+        for groups, message in batch:
+            for group in groups:
+                by_group.setdefault((group, message.get('type')), []).append(message)
+
+        # Один запрос к реестру подписок на пачку вместо group_send в группу каждого ключа
+        active, skipped = key_subscriptions.filter({group for group, _ in by_group})
+        active = set(active)
+        self.skipped_group_count += skipped
+
+        messages = []
+        for (group, message_type), events in by_group.items():
+            if group not in active:
+                continue
+            batch_type = BATCH_TYPES.get(message_type)
+            if batch_type is None or len(events) == 1:
+                messages.extend((group, event) for event in events)
+                continue
+            for start in range(0, len(events), self.max_batch_events):
+                messages.append((group, {'type': batch_type, 'events': events[start:start + self.max_batch_events]}))
+        return messages
+
+    async def _publish(self, batch):
+        """Отправка пачки с повторами неотправленных событий и экспоненциальной задержкой"""
+        from channels.layers import get_channel_layer
+
+        channel_layer = get_channel_layer()
+        pending = batch
+        group_sends = 0
+        for attempt in range(self.max_retries + 1):
+            group_sends += len(pending)
+            results = await asyncio.gather(
+                *(channel_layer.group_send(group, message) for group, message in pending),
+                return_exceptions=True
+            )
+            failed = [item for item, result in zip(pending, results) if isinstance(result, Exception)]
+            self.sent_count += len(pending) - len(failed)
+            if failed and attempt < self.max_retries:
+                self.retry_count += len(failed)
+                await asyncio.sleep(self.retry_delay * 2 ** attempt)
+            elif failed:
+                error = next(result for result in results if isinstance(result, Exception))
+                logger.error(f"Error sending {len(failed)} WebSocket notifications: {error}")
+            pending = failed
+            if not pending:
+                break
+
+        self.failed_count += len(pending)
+        self._count_flush(group_sends)
+
+    def _count_flush(self, group_sends):
+        """Учет вызовов group_send одного flush"""
+        self.flush_count += 1
+        self.group_send_count += group_sends
+        self.last_flush_group_sends = group_sends
+        self.max_flush_group_sends = max(self.max_flush_group_sends, group_sends)
+
+    def stats(self):
+        """Метрики очереди: глубина и счетчики"""
+        return {
+            'depth': self.queue.qsize(),
+            'sent': self.sent_count,
+            'dropped': self.dropped_count,
+            'retries': self.retry_count,
+            'failed': self.failed_count,
+            'skipped_groups': self.skipped_group_count,
+            'drained': self.drained_count,
+            'lost': self.lost_count,
+            'flushes': self.flush_count,
+            'group_sends': self.group_send_count,
+            'group_sends_last_flush': self.last_flush_group_sends,
+            'group_sends_max_flush': self.max_flush_group_sends,
+            'group_sends_per_flush': round(self.group_send_count / self.flush_count, 1) if self.flush_count else None,
+        }
+
+
+outbox = NotificationOutbox(**getattr(settings, 'NOTIFICATION_OUTBOX', {}))
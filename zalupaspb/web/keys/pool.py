@@ -0,0 +1,134 @@
+import uuid
+import logging
+from django.conf import settings
+from django.db import connection, transaction, IntegrityError
+from django.db.models import Count
+from .codes import generate_key_code
+from .models import Key, KeyPoolEntry
+
+logger = logging.getLogger('keys')
+
+
+class KeyPool:
+    """
+    Пул заранее сгенерированных уникальных пар (key, key_code) по типам ключей.
+    Выдача - один DELETE ... RETURNING по строке, выбранной через FOR UPDATE SKIP LOCKED,
+    поэтому интерактивное создание ключа не зависит от циклов генерации и проверки коллизий,
+    а параллельные запросы не ждут друг друга. Пул пополняется фоновым процессом
+    (manage.py refill_key_pool и этап key_pool в sweep_expired): когда остаток типа опускается
+    ниже low_watermark, он дополняется до high_watermark.
+    """
+
+    def __init__(self, low_watermark=200, high_watermark=1000, batch_size=500):
+        self.low_watermark = low_watermark
+        self.high_watermark = high_watermark
+        self.batch_size = batch_size
+        self.hits = 0
+        self.misses = 0
+
+    def pop(self, key_type):
+        """Выдача пары (key, key_code) из пула; None, если пул для типа пуст"""
+        table = KeyPoolEntry._meta.db_table
+        with connection.cursor() as cursor:
+            cursor.execute(
+                f'DELETE FROM {table} WHERE id = ('
+                f'  SELECT id FROM {table} WHERE key_type = %s ORDER BY id LIMIT 1 FOR UPDATE SKIP LOCKED'
+                f') RETURNING key, key_code',
+                [key_type]
+            )
+            row = cursor.fetchone()
+
+        if row is None:
+            self.misses += 1
+            logger.warning(f"Key pool for type {key_type} is empty, generating key inline")
+            return None
+
+        self.hits += 1
+        return row
+
+    def create_key(self, key_type, **fields):
+        """Создание ключа с кодом из пула (при пустом пуле код генерируется на месте)"""
+        pooled = None
+        try:
+            with transaction.atomic():
+                key = Key(key_type=key_type, **fields)
+                pooled = self.pop(key_type)
+                if pooled is not None:
+                    key.key, key.key_code = pooled
+                key.save()
+        except IntegrityError:
+            if pooled is None:
+                raise
+            # Код из пула уже занят (например, импортирован вручную) - убираем его из пула
+            KeyPoolEntry.objects.filter(key_code=pooled[1]).delete()
+            key = Key(key_type=key_type, **fields)
+            key.save()
+        return key
+
+    def depth(self):
+        """Количество кодов в пуле по типам"""
+        counts = dict(
+            KeyPoolEntry.objects.order_by().values_list('key_type').annotate(count=Count('id'))
+        )
+        return {key_type: counts.get(key_type, 0) for key_type in Key.KeyType.values}
+
+    def refill(self):
+        """
+        Пополнение типов, остаток которых ниже low_watermark, до high_watermark.
+        Кандидаты проверяются на коллизии одним запросом key_code__in на пачку,
+        вставка - INSERT ... ON CONFLICT DO NOTHING. Возвращает количество добавленных кодов по типам.
+        """
+        added = {}
+        for key_type, count in self.depth().items():
+            if count >= self.low_watermark:
+                continue
+
+            added[key_type] = 0
+            missing = self.high_watermark - count
+            while added[key_type] < missing:
+                size = min(self.batch_size, missing - added[key_type])
+                candidates = {generate_key_code(key_type) for _ in range(size)}
+                taken = set(Key.objects.filter(key_code__in=candidates).values_list('key_code', flat=True))
+
+                entries = [
+                    (str(uuid.uuid4()), code, key_type)
+                    for code in candidates if code not in taken
+                ]
+                added[key_type] += self._insert(entries)
+
+        if added:
+            logger.info(f"Key pool refilled: {added}")
+        return added
+
+    def _insert(self, entries):
+        """
+        Вставка пачки (key, key_code, key_type) в пул.
+        Коды, уже лежащие в пуле, пропускаются по уникальному индексу; возвращает
+        количество реально вставленных строк (RETURNING), а не размер пачки.
+        """
+        if not entries:
+            return 0
+        table = KeyPoolEntry._meta.db_table
+        values = ', '.join(['(%s, %s, %s, now())'] * len(entries))
+        with connection.cursor() as cursor:
+            cursor.execute(
+                f'INSERT INTO {table} (key, key_code, key_type, created_at) VALUES {values} '
+                f'ON CONFLICT DO NOTHING RETURNING id',
+                [value for entry in entries for value in entry]
+            )
+            return len(cursor.fetchall())
+
+    def stats(self):
+        """Остаток пула по типам и счетчики выдачи текущего процесса"""
+        total = self.hits + self.misses
+        return {
+            'depth': self.depth(),
+            'low_watermark': self.low_watermark,
+            'high_watermark': self.high_watermark,
+            'hits': self.hits,
+            'misses': self.misses,
+            'hit_ratio': round(self.hits / total, 3) if total else None,
+        }
+
+
+key_pool = KeyPool(**getattr(settings, 'KEY_POOL', {}))
@@ -1,5 +1,6 @@
 from rest_framework import serializers
 from .models import Key, KeyHistory
+from .codes import is_valid_key_code, normalize_key_code
 
 
 class KeySerializer(serializers.ModelSerializer):
@@ -7,6 +8,7 @@ class KeySerializer(serializers.ModelSerializer):
     created_by_username = serializers.SerializerMethodField()
     activated_by_username = serializers.SerializerMethodField()
     key_type_display = serializers.SerializerMethodField()
+    status = serializers.SerializerMethodField()
     status_display = serializers.SerializerMethodField()
     remaining_days = serializers.SerializerMethodField()
     
@@ -35,9 +37,13 @@ class KeySerializer(serializers.ModelSerializer):
         """Получение отображаемого значения типа ключа"""
         return obj.get_key_type_display()
     
+    def get_status(self, obj):
+        """Статус ключа с учетом истечения срока (аннотация with_effective_status)"""
+        return getattr(obj, 'effective_status', None) or obj.current_status
+    
     def get_status_display(self, obj):
         """Получение отображаемого значения статуса ключа"""
-        return obj.get_status_display()
+        return Key.KeyStatus(self.get_status(obj)).label
     
     def get_remaining_days(self, obj):
         """Получение оставшегося срока действия ключа"""
@@ -51,6 +57,50 @@ class KeyCreateSerializer(serializers.Serializer):
     notes = serializers.CharField(allow_blank=True, required=False)
 
 
+class KeyRedeemSerializer(serializers.Serializer):
+    """Сериализатор для активации ключа по коду"""
+    key_code = serializers.CharField(max_length=100)
+    
+    def validate_key_code(self, value):
+        """Отсечение опечаток и подделанных кодов по контрольной группе, без запроса к базе"""
+        value = normalize_key_code(value)
+        if not is_valid_key_code(value):
+            raise serializers.ValidationError('Неверный код ключа')
+        return value
+
+
+class KeyRedeemForUserSerializer(KeyRedeemSerializer):
+    """Сериализатор для активации ключа ботом от имени пользователя"""
+    user_id = serializers.UUIDField()
+    discord_id = serializers.CharField(max_length=50, required=False)
+
+
+class LicenseRequestSerializer(serializers.Serializer):
+    """Сериализатор для выдачи лицензии (token - предыдущая лицензия при обновлении)"""
+    token = serializers.CharField(required=False, allow_blank=True)
+
+
+class KeyBulkCreateSerializer(serializers.Serializer):
+    """Сериализатор для массового создания ключей"""
+    count = serializers.IntegerField(min_value=1, max_value=100000)
+    key_type = serializers.ChoiceField(choices=Key.KeyType.choices, default=Key.KeyType.STANDARD)
+    duration_days = serializers.IntegerField(default=30, min_value=1, max_value=3650)
+    notes = serializers.CharField(allow_blank=True, required=False)
+
+
+class KeyBulkStatusSerializer(serializers.Serializer):
+    """Сериализатор для массовой смены статуса ключей"""
+    status = serializers.ChoiceField(choices=[(status, status) for status in Key.BULK_STATUS_ACTIONS])
+    key_ids = serializers.ListField(child=serializers.UUIDField(), required=False, max_length=100000)
+    all_matching = serializers.BooleanField(default=False)
+    
+    def validate(self, attrs):
+        """Нужен список id или явное подтверждение выборки по фильтрам"""
+        if not attrs.get('key_ids') and not attrs['all_matching']:
+            raise serializers.ValidationError('Укажите key_ids или all_matching: true для ключей, подходящих под фильтры')
+        return attrs
+
+
 class KeyHistorySerializer(serializers.ModelSerializer):
     """Сериализатор для истории ключа"""
     user_username = serializers.SerializerMethodField()
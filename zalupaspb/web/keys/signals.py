@@ -1,18 +1,25 @@
-from django.db.models.signals import post_save, pre_save
+from django.db.models.signals import post_save, post_delete
 from django.dispatch import receiver
-from channels.layers import get_channel_layer
-from asgiref.sync import async_to_sync
-from django.utils import timezone
-import json
 import logging
-from .models import Key, KeyHistory
+from .models import Key, KeyHistory, Loader
+from .notifications import send_key_status_update
+from .entitlements import invalidate_entitlement
+from .lookup import key_lookup
+from .inventory import record_inventory_deltas, status_change_deltas
 
 logger = logging.getLogger('keys')
-channel_layer = get_channel_layer()
 
 @receiver(post_save, sender=Key)
-def key_post_save(sender, instance, created, **kwargs):
+def key_post_save(sender, instance, created, using, **kwargs):
     """Сигнал после сохранения ключа"""
+    # Счетчики ключей по типу и статусу - в той же транзакции, что и сохранение (см. Key.save)
+    if created:
+        record_inventory_deltas(status_change_deltas(instance.key_type, None, instance.status), using=using)
+    elif instance.has_changed('status') or instance.has_changed('key_type'):
+        deltas = status_change_deltas(instance.previous('key_type') or instance.key_type, instance.previous('status'), None)
+        deltas.update(status_change_deltas(instance.key_type, None, instance.status))
+        record_inventory_deltas(deltas, using=using)
+    
     if created:
         # Логируем создание ключа
         logger.info(f"Key {instance.key_code} created by {instance.created_by}")
@@ -26,60 +33,53 @@ def key_post_save(sender, instance, created, **kwargs):
         )
         
         # Отправляем уведомление через WebSocket
-        try:
-            async_to_sync(channel_layer.group_send)(
-                'key_status_updates',
-                {
-                    'type': 'key_status_update',
-                    'key_id': str(instance.id),
-                    'status': instance.status,
-                    'action': 'created',
-                    'timestamp': timezone.now().isoformat(),
-                }
+        send_key_status_update(instance.id, instance.status, 'created', instance.key_type)
+    elif instance.has_changed('status'):
+        # Логируем изменение статуса
+        logger.info(f"Key {instance.key_code} status changed from {instance.previous('status')} to {instance.status}")
+        
+        # Создаем соответствующую запись в истории
+        action = None
+        if instance.status == Key.KeyStatus.USED:
+            action = KeyHistory.ActionType.ACTIVATED
+            details = f"Ключ активирован пользователем {instance.activated_by}"
+        elif instance.status == Key.KeyStatus.REVOKED:
+            action = KeyHistory.ActionType.REVOKED
+            details = "Ключ отозван"
+        elif instance.status == Key.KeyStatus.EXPIRED:
+            action = KeyHistory.ActionType.EXPIRED
+            details = "Срок действия ключа истек"
+        
+        if action:
+            KeyHistory.objects.create(
+                key=instance,
+                action=action,
+                user=instance.activated_by if instance.status == Key.KeyStatus.USED else None,
+                details=details
             )
-        except Exception as e:
-            logger.error(f"Error sending WebSocket notification: {e}")
-    else:
-        # Проверяем изменение статуса
-        try:
-            old_instance = Key.objects.get(pk=instance.pk)
-            if old_instance.status != instance.status:
-                # Логируем изменение статуса
-                logger.info(f"Key {instance.key_code} status changed from {old_instance.status} to {instance.status}")
-                
-                # Создаем соответствующую запись в истории
-                action = None
-                if instance.status == Key.KeyStatus.USED:
-                    action = KeyHistory.ActionType.ACTIVATED
-                    details = f"Ключ активирован пользователем {instance.activated_by}"
-                elif instance.status == Key.KeyStatus.REVOKED:
-                    action = KeyHistory.ActionType.REVOKED
-                    details = "Ключ отозван"
-                elif instance.status == Key.KeyStatus.EXPIRED:
-                    action = KeyHistory.ActionType.EXPIRED
-                    details = "Срок действия ключа истек"
-                
-                if action:
-                    KeyHistory.objects.create(
-                        key=instance,
-                        action=action,
-                        user=instance.activated_by if instance.status == Key.KeyStatus.USED else None,
-                        details=details
-                    )
-                
-                # Отправляем уведомление через WebSocket
-                try:
-                    async_to_sync(channel_layer.group_send)(
-                        'key_status_updates',
-                        {
-                            'type': 'key_status_update',
-                            'key_id': str(instance.id),
-                            'status': instance.status,
-                            'action': 'status_changed',
-                            'timestamp': timezone.now().isoformat(),
-                        }
-                    )
-                except Exception as e:
-                    logger.error(f"Error sending WebSocket notification: {e}")
-        except Key.DoesNotExist:
-            pass 
\ No newline at end of file
+        
+        # Отправляем уведомление через WebSocket
+        send_key_status_update(instance.id, instance.status, 'status_changed', instance.key_type)
+    
+    # Статус, срок или владелец ключа могли измениться - сбрасываем кеш права доступа
+    # (при смене владельца - и у предыдущего)
+    invalidate_entitlement(instance.activated_by_id, instance.previous('activated_by'))
+    
+    # Кеш поиска по коду и id (при смене кода - и по старому коду)
+    key_lookup.invalidate([instance.id], [instance.key_code, instance.previous('key_code')])
+
+
+@receiver(post_delete, sender=Key)
+def key_post_delete(sender, instance, using, **kwargs):
+    """Сигнал после удаления ключа"""
+    record_inventory_deltas(status_change_deltas(instance.key_type, instance.status, None), using=using)
+    invalidate_entitlement(instance.activated_by_id)
+    key_lookup.invalidate_key(instance)
+
+
+@receiver(post_save, sender=Loader)
+@receiver(post_delete, sender=Loader)
+def loader_changed(sender, instance, using, **kwargs):
+    """Сброс кеша активного лоадера"""
+    from .downloads import loader_cache
+    loader_cache.invalidate(using=using)
@@ -0,0 +1,93 @@
+import os
+import hashlib
+import tempfile
+from django.core.files import File
+from django.core.files.move import file_move_safe
+from django.core.files.storage import FileSystemStorage
+
+# Размер порции при вычислении контрольной суммы файла с диска
+HASH_CHUNK_SIZE = 1024 * 1024
+
+
+def sha256_file(path):
+    """SHA-256 файла на диске (функция уровня модуля - выполняется в процессах ProcessPoolExecutor)"""
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        while True:
+            chunk = f.read(HASH_CHUNK_SIZE)
+            if not chunk:
+                break
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def content_sha256(content):
+    """
+    SHA-256 содержимого файла.
+    Для загруженных файлов сумма уже посчитана по ходу загрузки (keys.uploads),
+    для остальных - читается один раз и запоминается в атрибуте sha256.
+    """
+    digest = getattr(content, 'sha256', None)
+    if digest is None:
+        hasher = hashlib.sha256()
+        if hasattr(content, 'seek'):
+            content.seek(0)
+        for chunk in content.chunks():
+            hasher.update(chunk)
+        if hasattr(content, 'seek'):
+            content.seek(0)
+        digest = content.sha256 = hasher.hexdigest()
+    return digest
+
+
+class ContentAddressedStorage(FileSystemStorage):
+    """
+    Хранилище, в котором имя файла - его SHA-256: <каталог upload_to>/<2 символа>/<sha256><расширение>.
+    Повторная загрузка того же содержимого не записывает файл второй раз, а возвращает имя
+    существующего. Файл пишется во временный файл рядом и переносится атомарным os.replace,
+    поэтому параллельные загрузки одного содержимого не мешают друг другу.
+    """
+
+    def save(self, name, content, max_length=None):
+        if name is None:
+            name = content.name
+        if not hasattr(content, 'chunks'):
+            content = File(content, name)
+        digest = content_sha256(content)
+        directory, filename = os.path.split(name)
+        extension = os.path.splitext(filename)[1].lower()
+        return super().save(os.path.join(directory, digest[:2], digest + extension), content, max_length=max_length)
+
+    def get_available_name(self, name, max_length=None):
+        # Одинаковое имя означает одинаковое содержимое - суффиксы не нужны
+        return name
+
+    def _save(self, name, content):
+        full_path = self.path(name)
+        if os.path.exists(full_path):
+            return name
+
+        directory = os.path.dirname(full_path)
+        os.makedirs(directory, exist_ok=True)
+        fd, tmp_path = tempfile.mkstemp(dir=directory, prefix='.upload-')
+        try:
+            if hasattr(content, 'temporary_file_path'):
+                # Большие загрузки уже лежат во временном файле - переносим без копирования
+                os.close(fd)
+                file_move_safe(content.temporary_file_path(), tmp_path, allow_overwrite=True)
+            else:
+                with os.fdopen(fd, 'wb') as f:
+                    for chunk in content.chunks():
+                        f.write(chunk)
+                    f.flush()
+                    os.fsync(f.fileno())
+            os.chmod(tmp_path, self.file_permissions_mode or 0o644)
+            os.replace(tmp_path, full_path)
+        except BaseException:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+            raise
+        return name
+
+
+loader_storage = ContentAddressedStorage()
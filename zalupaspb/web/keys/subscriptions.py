@@ -0,0 +1,82 @@
+import logging
+import redis
+from django.conf import settings
+
+logger = logging.getLogger('keys')
+
+_client = None
+
+
+def get_redis():
+    """Клиент Redis для реестра подписок (общий пул соединений процесса)"""
+    global _client
+    if _client is None:
+        _client = redis.Redis.from_url(
+            settings.KEY_SUBSCRIPTIONS_REDIS_URL,
+            socket_timeout=0.5,
+            socket_connect_timeout=0.5,
+        )
+    return _client
+
+
+class GroupSubscriptions:
+    """
+    Реестр групп с префиксом, на которые подписан хотя бы один сокет.
+    Для каждой группы в Redis hash хранится количество подписанных сокетов: потребитель
+    увеличивает его при входе в группу и уменьшает при выходе и отключении, а outbox
+    отправляет события только в группы с подписчиками. Так массовая операция над тысячами
+    ключей не дает group_send в группу каждого ключа, когда на ключи никто не подписан.
+    Счетчик сокета, чей процесс упал без disconnect, остается в реестре - это дает лишнюю
+    отправку, но не потерю события. При недоступности Redis отправка идет во все группы.
+    """
+
+    def __init__(self, prefix, redis_key):
+        self.prefix = prefix
+        self.redis_key = redis_key
+
+    def _names(self, groups):
+        return [group[len(self.prefix):] for group in groups if group.startswith(self.prefix)]
+
+    def add(self, groups):
+        """Учет подписки сокета на группы"""
+        self._change(self._names(groups), 1)
+
+    def remove(self, groups):
+        """Учет отписки сокета от групп; группы без подписчиков удаляются из реестра"""
+        self._change(self._names(groups), -1)
+
+    def _change(self, names, delta):
+        if not names:
+            return
+        try:
+            client = get_redis()
+            pipe = client.pipeline(transaction=False)
+            for name in names:
+                pipe.hincrby(self.redis_key, name, delta)
+            counts = pipe.execute()
+            empty = [name for name, count in zip(names, counts) if count <= 0]
+            if empty:
+                client.hdel(self.redis_key, *empty)
+        except redis.RedisError as e:
+            logger.warning(f"Не удалось обновить реестр подписок {self.redis_key}: {e}")
+
+    def filter(self, groups):
+        """
+        Группы без тех групп с префиксом, на которые никто не подписан (один HMGET на вызов).
+        Возвращает (группы для отправки, количество пропущенных групп).
+        """
+        groups = list(groups)
+        names = self._names(groups)
+        if not names:
+            return groups, 0
+        try:
+            counts = get_redis().hmget(self.redis_key, names)
+        except redis.RedisError:
+            return groups, 0
+
+        unsubscribed = {self.prefix + name for name, count in zip(names, counts) if not count or int(count) <= 0}
+        return [group for group in groups if group not in unsubscribed], len(unsubscribed)
+
+
+# Группы отдельных ключей (keys.notifications.key_group)
+key_subscriptions = GroupSubscriptions('key_status.key.', 'key_status:subscribed_keys')
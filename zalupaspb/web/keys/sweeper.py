@@ -0,0 +1,64 @@
+import time
+import logging
+from django.utils import timezone
+
+logger = logging.getLogger('keys')
+
+
+def _log_partition_rows(result):
+    """Количество затронутых объектов при обслуживании партиций логов"""
+    return len(result['created']) + result['dropped'] + result['deleted']
+
+
+def _key_history_partition_rows(result):
+    """Количество созданных партиций истории ключей"""
+    return len(result['created'])
+
+
+def sweep_expired(batch_size=1000):
+    """
+    Один проход очистки: истекшие ключи и инвайты переводятся в EXPIRED,
+    просроченные коды привязки и старые отчеты импорта ключей удаляются, для логов создаются будущие партиции
+    и удаляются партиции старше срока хранения, создаются будущие партиции истории ключей, пул кодов ключей пополняется.
+    Ошибка этапа пишется в лог и в метрику error этого этапа и не останавливает остальные этапы.
+    Возвращает метрики прохода: количество затронутых строк, время и ошибку (None) по каждому этапу.
+    """
+    from .models import Key
+    from invites.models import Invite
+    from users.models import BindingCode
+    from logs.partitions import maintain_partitions
+    from .history import maintain_partitions as maintain_history_partitions
+    from .pool import key_pool
+    from .importer import purge_reports
+    
+    now = timezone.now()
+    stages = [
+        ('keys', lambda: Key.objects.expire_overdue(batch_size=batch_size, now=now)),
+        ('invites', lambda: Invite.objects.expire_overdue(batch_size=batch_size, now=now)),
+        ('binding_codes', lambda: BindingCode.objects.purge_stale(batch_size=batch_size, now=now)),
+        ('key_import_reports', lambda: purge_reports(now=now)),
+        ('log_partitions', lambda: _log_partition_rows(maintain_partitions(now=now))),
+        ('key_history_partitions', lambda: _key_history_partition_rows(maintain_history_partitions(now=now, archive=False))),
+        ('key_pool', lambda: sum(key_pool.refill().values())),
+    ]
+    
+    metrics = {}
+    for name, stage in stages:
+        started = time.monotonic()
+        rows, error = 0, None
+        try:
+            rows = stage()
+        except Exception as e:
+            error = f'{type(e).__name__}: {e}'
+            logger.exception(f"Expiry sweep stage {name} failed")
+        metrics[name] = {
+            'rows': rows,
+            'seconds': round(time.monotonic() - started, 3),
+            'error': error,
+        }
+    
+    total_rows = sum(stage['rows'] for stage in metrics.values())
+    if total_rows:
+        logger.info(f"Expiry sweep: {metrics}")
+    
+    return metrics
@@ -0,0 +1,36 @@
+import hashlib
+from django.core.files.uploadhandler import MemoryFileUploadHandler, TemporaryFileUploadHandler
+
+
+class HashingUploadMixin:
+    """
+    Вычисление SHA-256 загружаемого файла по ходу приема порций, без повторного чтения.
+    Сумма сохраняется в атрибуте sha256 загруженного файла и используется
+    хранилищем лоадеров (keys.storage) и Loader.save.
+    """
+
+    def new_file(self, *args, **kwargs):
+        # До вызова родителя: MemoryFileUploadHandler.new_file завершается исключением StopFutureHandlers
+        self.sha256 = hashlib.sha256()
+        super().new_file(*args, **kwargs)
+
+    def receive_data_chunk(self, raw_data, start):
+        result = super().receive_data_chunk(raw_data, start)
+        # None - порцию принял этот обработчик, иначе она передается следующему
+        if result is None:
+            self.sha256.update(raw_data)
+        return result
+
+    def file_complete(self, file_size):
+        file = super().file_complete(file_size)
+        if file is not None:
+            file.sha256 = self.sha256.hexdigest()
+        return file
+
+
+class HashingMemoryFileUploadHandler(HashingUploadMixin, MemoryFileUploadHandler):
+    """Загрузка небольших файлов в память с вычислением SHA-256"""
+
+
+class HashingTemporaryFileUploadHandler(HashingUploadMixin, TemporaryFileUploadHandler):
+    """Загрузка больших файлов во временный файл с вычислением SHA-256"""
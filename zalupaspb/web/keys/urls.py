@@ -1,12 +1,25 @@
 from django.urls import path
 from .views import (
-    KeyListView, KeyDetailView, KeyCreateView, KeyActivateView, KeyRevokeView
+    KeyListView, KeyDetailView, KeyCreateView, KeyBulkCreateView, KeyActivateView, KeyRedeemView,
+    KeyRevokeView, KeyEntitlementView, LicenseView, LicensePublicKeyView, KeyExportView,
+    KeyPoolView, KeyBulkStatusView, KeyHistoryView, KeyStatsView, KeyRedeemForUserView
 )
 
 urlpatterns = [
     path('', KeyListView.as_view(), name='key_list'),
     path('<uuid:pk>/', KeyDetailView.as_view(), name='key_detail'),
+    path('<uuid:pk>/history/', KeyHistoryView.as_view(), name='key_history'),
+    path('export/', KeyExportView.as_view(), name='key_export'),
     path('create/', KeyCreateView.as_view(), name='key_create'),
+    path('bulk/', KeyBulkCreateView.as_view(), name='key_bulk_create'),
+    path('pool/', KeyPoolView.as_view(), name='key_pool'),
+    path('stats/', KeyStatsView.as_view(), name='key_stats'),
+    path('bulk-status/', KeyBulkStatusView.as_view(), name='key_bulk_status'),
+    path('redeem/', KeyRedeemView.as_view(), name='key_redeem'),
+    path('redeem/for-user/', KeyRedeemForUserView.as_view(), name='key_redeem_for_user'),
+    path('entitlement/', KeyEntitlementView.as_view(), name='key_entitlement'),
+    path('license/', LicenseView.as_view(), name='key_license'),
+    path('license/public-key/', LicensePublicKeyView.as_view(), name='key_license_public_key'),
     path('<uuid:pk>/activate/', KeyActivateView.as_view(), name='key_activate'),
     path('<uuid:pk>/revoke/', KeyRevokeView.as_view(), name='key_revoke'),
 ] 
\ No newline at end of file
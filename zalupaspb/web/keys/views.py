@@ -2,12 +2,39 @@ from rest_framework import generics, status, permissions
 from rest_framework.response import Response
 from rest_framework.views import APIView
 from django.shortcuts import get_object_or_404
+from django.http import Http404
+from django.urls import reverse
+from django.core.exceptions import ValidationError
+from rest_framework.exceptions import NotFound, PermissionDenied
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from rest_framework.authentication import SessionAuthentication
+from rest_framework_simplejwt.authentication import JWTAuthentication, JWTStatelessUserAuthentication
+from rest_framework_simplejwt.models import TokenUser
 from .models import Key, KeyHistory
-from .serializers import KeySerializer, KeyCreateSerializer, KeyHistorySerializer
+from .entitlements import KEY_TYPE_RANK, get_entitlement, has_entitlement
+from .lookup import key_lookup
+from .pool import key_pool
+from .history import get_key_history
+from .inventory import inventory_counts
+from zalupaspb.pagination import KeysetPagination
+from zalupaspb.ratelimit import get_rate_limiter, request_identities
+from zalupaspb.export import StreamingExportMixin
+from .licenses import issue_license, check_refresh_token, get_public_key_b64
+from .license_verify import LicenseError
+from .serializers import (
+    KeySerializer, KeyCreateSerializer, KeyBulkCreateSerializer, KeyRedeemSerializer, KeyRedeemForUserSerializer,
+    KeyHistorySerializer,
+    LicenseRequestSerializer, KeyBulkStatusSerializer
+)
 from django.utils import timezone
 import logging
 
 logger = logging.getLogger('keys')
+User = get_user_model()
+
+# Ограничение подбора кодов при активации ключей (общее для всех способов активации)
+redeem_limiter = get_rate_limiter('key_redeem')
 
 
 class IsAdminOrModerator(permissions.BasePermission):
@@ -21,15 +48,16 @@ class KeyListView(generics.ListAPIView):
     """Список ключей"""
     serializer_class = KeySerializer
     permission_classes = [IsAdminOrModerator]
+    keyset_ordering = ('created_at', 'id')  # курсорная пагинация по ?cursor=
     
     def get_queryset(self):
         """Получение списка ключей с фильтрацией"""
-        queryset = Key.objects.all()
+        queryset = Key.objects.with_effective_status().select_related('created_by', 'activated_by')
         
-        # Фильтрация по статусу
+        # Фильтрация по статусу (с учетом истечения срока)
         status = self.request.query_params.get('status')
         if status:
-            queryset = queryset.filter(status=status)
+            queryset = queryset.filter(effective_status=status)
         
         # Фильтрация по типу
         key_type = self.request.query_params.get('type')
@@ -49,28 +77,90 @@ class KeyListView(generics.ListAPIView):
         return queryset
 
 
+class KeyExportView(StreamingExportMixin, KeyListView):
+    """Потоковая выгрузка ключей (фильтры как у списка ключей)"""
+    export_filename = 'keys'
+    export_fields = (
+        ('id', 'id'),
+        ('key', 'key'),
+        ('key_code', 'key_code'),
+        ('key_type', 'key_type'),
+        ('status', 'effective_status'),
+        ('created_by', 'created_by_id'),
+        ('created_by_username', 'created_by__username'),
+        ('created_at', 'created_at'),
+        ('activated_by', 'activated_by_id'),
+        ('activated_by_username', 'activated_by__username'),
+        ('activated_at', 'activated_at'),
+        ('duration_days', 'duration_days'),
+        ('expires_at', 'expires_at'),
+        ('notes', 'notes'),
+    )
+
+
+class KeyHistoryPagination(KeysetPagination):
+    """
+    Курсорная пагинация истории ключа (только вперед, от новых записей к старым).
+    Страницы читаются через keys.history.get_key_history, поэтому после основной таблицы
+    продолжаются записями из архива.
+    """
+    keyset_ordering = ('timestamp', 'id')
+    
+    def paginate_history(self, key_id, request, base_url=None):
+        self.request = request
+        self.base_url = base_url or request.build_absolute_uri()
+        self.use_cursor = True
+        
+        position, _ = self.decode_cursor(request.query_params.get(self.cursor_query_param))
+        if position is not None:
+            try:
+                position = (position[0], KeyHistory._meta.get_field('id').to_python(position[1]))
+            except ValidationError:
+                raise NotFound(self.invalid_cursor_message)
+        
+        results, self.has_next = get_key_history(key_id, before=position, limit=self.get_page_size(request))
+        self.has_previous = False
+        self.first_item = results[0] if results else None
+        self.last_item = results[-1] if results else None
+        return results
+
+
+class KeyHistoryView(APIView):
+    """История ключа с курсорной пагинацией (включая архивированные записи)"""
+    permission_classes = [IsAdminOrModerator]
+    
+    def get(self, request, pk):
+        get_object_or_404(Key.objects.only('id'), pk=pk)
+        paginator = KeyHistoryPagination()
+        history = paginator.paginate_history(pk, request)
+        return paginator.get_paginated_response(KeyHistorySerializer(history, many=True).data)
+
+
 class KeyDetailView(generics.RetrieveAPIView):
     """Детальная информация о ключе"""
-    queryset = Key.objects.all()
+    queryset = Key.objects.with_effective_status().select_related('created_by', 'activated_by')
     serializer_class = KeySerializer
     permission_classes = [IsAdminOrModerator]
     
     def get(self, request, *args, **kwargs):
         """Получение информации о ключе с историей"""
         key = self.get_object()
-        key.check_expiry()  # Проверяем срок действия
         
         # Сериализуем ключ
         key_data = KeySerializer(key).data
         
-        # Получаем историю ключа
-        history = key.history.all()
+        # Первая страница истории ключа, продолжение - по ссылке history_next
+        paginator = KeyHistoryPagination()
+        history = paginator.paginate_history(
+            key.pk, request, base_url=request.build_absolute_uri(reverse('key_history', args=[key.pk]))
+        )
         history_data = KeyHistorySerializer(history, many=True).data
         
         # Объединяем данные
         response_data = {
             'key': key_data,
-            'history': history_data
+            'history': history_data,
+            'history_next': paginator.get_next_link()
         }
         
         return Response(response_data)
@@ -94,14 +184,13 @@ class KeyCreateView(APIView):
         }
         
         if serializer.is_valid():
-            # Создаем ключ
-            key = Key(
+            # Создаем ключ с кодом из заранее сгенерированного пула
+            key = key_pool.create_key(
                 key_type=serializer.validated_data.get('key_type', Key.KeyType.STANDARD),
                 duration_days=serializer.validated_data.get('duration_days', 30),
                 created_by=request.user,
                 notes=serializer.validated_data.get('notes', '')
             )
-            key.save()
             
             logger.info(f"User {request.user.username} created key {key.key}", extra=extra)
             
@@ -111,13 +200,143 @@ class KeyCreateView(APIView):
         return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
 
 
-class KeyActivateView(APIView):
+class KeyBulkStatusView(APIView):
+    """Массовая смена статуса ключей (отзыв, истечение)"""
+    permission_classes = [IsAdminOrModerator]
+    
+    def post(self, request, *args, **kwargs):
+        """
+        Перевод ключей из key_ids или всех ключей, подходящих под фильтры списка
+        (параметры запроса как у GET /api/keys/), в статус revoked или expired
+        """
+        serializer = KeyBulkStatusSerializer(data=request.data)
+        
+        # Получаем IP пользователя
+        ip_address = getattr(request, 'client_ip', request.META.get('REMOTE_ADDR', ''))
+        
+        # Подготавливаем дополнительную информацию для лога
+        extra = {
+            'user_id': request.user.id,
+            'ip_address': ip_address
+        }
+        
+        if not serializer.is_valid():
+            return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
+        
+        key_ids = serializer.validated_data.get('key_ids')
+        if key_ids:
+            queryset = Key.objects.filter(id__in=key_ids)
+        else:
+            # Те же фильтры, что и у списка ключей
+            list_view = KeyListView()
+            list_view.request = request
+            queryset = list_view.get_queryset()
+        
+        new_status = serializer.validated_data['status']
+        updated = queryset.bulk_set_status(new_status, user=request.user)
+        
+        logger.info(f"User {request.user.username} set status {new_status} for {updated} keys", extra=extra)
+        return Response({'status': new_status, 'updated': updated})
+
+
+class KeyPoolView(APIView):
+    """Состояние пула заранее сгенерированных кодов ключей"""
+    permission_classes = [IsAdminOrModerator]
+    
+    def get(self, request, *args, **kwargs):
+        """Остаток пула по типам, пороги пополнения и счетчики выдачи процесса"""
+        return Response(key_pool.stats())
+
+
+class KeyStatsView(APIView):
+    """Количество ключей по типам и статусам"""
+    permission_classes = [IsAdminOrModerator]
+    
+    def get(self, request, *args, **kwargs):
+        """Счетчики из keys.inventory - без подсчета по таблице ключей"""
+        counts = inventory_counts()
+        totals = {key_type: sum(statuses.values()) for key_type, statuses in counts.items()}
+        return Response({
+            'counts': counts,
+            'totals': totals,
+            'total': sum(totals.values()),
+        })
+
+
+class KeyBulkCreateView(APIView):
+    """Массовое создание ключей"""
+    permission_classes = [IsAdminOrModerator]
+    
+    def post(self, request, *args, **kwargs):
+        """Создание пачки ключей одного типа"""
+        serializer = KeyBulkCreateSerializer(data=request.data)
+        
+        # Получаем IP пользователя
+        ip_address = getattr(request, 'client_ip', request.META.get('REMOTE_ADDR', ''))
+        
+        # Подготавливаем дополнительную информацию для лога
+        extra = {
+            'user_id': request.user.id,
+            'ip_address': ip_address
+        }
+        
+        if serializer.is_valid():
+            keys = Key.bulk_generate(
+                count=serializer.validated_data['count'],
+                key_type=serializer.validated_data.get('key_type', Key.KeyType.STANDARD),
+                duration_days=serializer.validated_data.get('duration_days', 30),
+                created_by=request.user,
+                notes=serializer.validated_data.get('notes', '')
+            )
+            
+            logger.info(f"User {request.user.username} bulk created {len(keys)} keys", extra=extra)
+            
+            return Response({
+                'created': len(keys),
+                'key_codes': [key.key_code for key in keys]
+            }, status=status.HTTP_201_CREATED)
+        
+        logger.warning(f"Ошибка при массовом создании ключей пользователем {request.user.username}: {serializer.errors}", extra=extra)
+        return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
+
+
+class RedeemRateLimitMixin:
+    """
+    Ограничение подбора кодов до любых запросов к базе.
+    Пользователь JWT определяется по claim user_id без загрузки из базы (TokenUser), поэтому
+    ограничитель проверяется по IP и id пользователя из токена; из базы пользователь
+    загружается в load_user только после проверки. Сессия браузера по-прежнему загружает пользователя сама.
+    """
+    authentication_classes = [JWTStatelessUserAuthentication, SessionAuthentication]
+    
+    def load_user(self, request):
+        """Замена TokenUser пользователем из базы (с проверкой is_active, как в JWTAuthentication)"""
+        if isinstance(request.user, TokenUser):
+            request.user = JWTAuthentication().get_user(request.auth)
+        return request.user
+
+
+class KeyActivateView(RedeemRateLimitMixin, APIView):
     """Активация ключа"""
     permission_classes = [permissions.IsAuthenticated]
     
     def post(self, request, pk, *args, **kwargs):
         """Активация ключа пользователем"""
-        key = get_object_or_404(Key, pk=pk)
+        # Ограничение подбора проверяется до любых запросов к базе
+        identities = request_identities(request)
+        retry_after = redeem_limiter.check(identities)
+        if retry_after:
+            return Response(
+                {'error': 'Слишком много неудачных попыток, попробуйте позже'},
+                status=status.HTTP_429_TOO_MANY_REQUESTS,
+                headers={'Retry-After': str(retry_after)}
+            )
+        self.load_user(request)
+        
+        key = key_lookup.get(key_id=pk)
+        if key is None:
+            redeem_limiter.register_failure(identities)
+            raise Http404
         
         # Получаем IP пользователя
         ip_address = getattr(request, 'client_ip', request.META.get('REMOTE_ADDR', ''))
@@ -128,8 +347,9 @@ class KeyActivateView(APIView):
             'ip_address': ip_address
         }
         
-        # Проверяем, активен ли ключ
-        if not key.is_active:
+        # Проверяем, активен ли ключ (по кешу, без запроса к базе)
+        if key.current_status != Key.KeyStatus.ACTIVE:
+            redeem_limiter.register_failure(identities)
             logger.warning(f"Попытка активации неактивного ключа {key.key_code} пользователем {request.user.username}", extra=extra)
             return Response(
                 {'error': 'Ключ не активен или уже использован'},
@@ -137,9 +357,10 @@ class KeyActivateView(APIView):
             )
         
         # Активируем ключ
-        if key.activate(request.user):
-            logger.info(f"User {request.user.username} activated key {key.key}", extra=extra)
-            return Response(KeySerializer(key).data)
+        activated = Key.objects.redeem(request.user, key_id=pk)
+        if activated is not None:
+            logger.info(f"User {request.user.username} activated key {activated.key}", extra=extra)
+            return Response(KeySerializer(activated).data)
         
         logger.error(f"Ошибка при активации ключа {key.key_code} пользователем {request.user.username}", extra=extra)
         return Response(
@@ -148,6 +369,199 @@ class KeyActivateView(APIView):
         )
 
 
+class KeyRedeemView(RedeemRateLimitMixin, APIView):
+    """Активация ключа по коду"""
+    permission_classes = [permissions.IsAuthenticated]
+    serializer_class = KeyRedeemSerializer
+    
+    def get_identities(self, request):
+        """Идентификаторы для ограничения подбора: IP и пользователь из токена"""
+        return request_identities(request)
+    
+    def get_redeem_user(self, request, data):
+        """Пользователь, для которого активируется ключ: автор запроса"""
+        return self.load_user(request)
+    
+    def post(self, request, *args, **kwargs):
+        """Атомарная активация ключа по key_code"""
+        # Ограничение подбора проверяется до любых запросов к базе
+        identities = self.get_identities(request)
+        retry_after = redeem_limiter.check(identities)
+        if retry_after:
+            return Response(
+                {'error': 'Слишком много неудачных попыток, попробуйте позже'},
+                status=status.HTTP_429_TOO_MANY_REQUESTS,
+                headers={'Retry-After': str(retry_after)}
+            )
+        
+        serializer = self.serializer_class(data=request.data)
+        
+        # Получаем IP пользователя
+        ip_address = getattr(request, 'client_ip', request.META.get('REMOTE_ADDR', ''))
+        
+        if not serializer.is_valid():
+            # Опечатки и подделанные коды отсекаются без запроса к базе, но считаются неудачной попыткой
+            redeem_limiter.register_failure(identities)
+            return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
+        
+        user = self.get_redeem_user(request, serializer.validated_data)
+        
+        # Подготавливаем дополнительную информацию для лога
+        extra = {
+            'user_id': user.id,
+            'ip_address': ip_address
+        }
+        
+        key_code = serializer.validated_data['key_code']
+        
+        # Повторные проверки неизвестных и уже использованных кодов отсекаются кешем без запроса к базе
+        key = key_lookup.get(key_code=key_code)
+        if key is not None and key.current_status == Key.KeyStatus.ACTIVE:
+            redeemed = Key.objects.redeem(user, key_code=key_code)
+            if redeemed is not None:
+                logger.info(f"User {user.username} redeemed key {redeemed.key_code}", extra=extra)
+                return Response(KeySerializer(redeemed).data)
+            # Ключ активировали параллельно - берем актуальный статус
+            key = Key.objects.filter(key_code=key_code).first()
+        
+        redeem_limiter.register_failure(identities)
+        if key is None:
+            logger.warning(f"Попытка активации несуществующего ключа {key_code} пользователем {user.username}", extra=extra)
+            return Response(
+                {'error': 'Ключ не найден'},
+                status=status.HTTP_404_NOT_FOUND
+            )
+        
+        logger.warning(f"Попытка активации неактивного ключа {key_code} пользователем {user.username}", extra=extra)
+        return Response(
+            {'error': 'Ключ не активен или уже использован', 'status': key.current_status},
+            status=status.HTTP_409_CONFLICT
+        )
+
+
+class IsBotServiceAccount(permissions.BasePermission):
+    """Разрешение для служебного аккаунта Discord-бота (BOT_SERVICE_USER_ID), без запроса к базе"""
+    
+    def has_permission(self, request, view):
+        service_user_id = getattr(settings, 'BOT_SERVICE_USER_ID', '')
+        return bool(
+            service_user_id and request.user.is_authenticated
+            and str(request.user.pk) == service_user_id
+        )
+
+
+class KeyRedeemForUserView(KeyRedeemView):
+    """
+    Активация ключа по коду от имени пользователя (для Discord-бота).
+    Бот обращается к API со своим токеном, поэтому ключ активируется не для автора
+    запроса, а для пользователя из user_id. Доступно только служебному аккаунту бота.
+    """
+    permission_classes = [IsBotServiceAccount]
+    serializer_class = KeyRedeemForUserSerializer
+    
+    def get_identities(self, request):
+        """
+        Все запросы бота приходят с одного IP и одного токена, поэтому ограничение
+        считается по конечному пользователю (discord_id и user_id из запроса), а IP
+        и служебный аккаунт бота в нем не участвуют: ошибки одних пользователей Discord
+        не блокируют активацию для остальных.
+        """
+        identities = []
+        for name in ('discord_id', 'user_id'):
+            value = request.data.get(name)
+            if isinstance(value, (str, int)) and str(value).strip():
+                identities.append((name.replace('_id', ''), str(value).strip()[:64]))
+        return identities or [('bot', 'invalid_request')]
+    
+    def get_redeem_user(self, request, data):
+        """Пользователь сайта из user_id; заблокированным и неактивным пользователям ключ не активируется"""
+        user = User.objects.filter(pk=data['user_id'], is_active=True).first()
+        if user is None:
+            raise NotFound('Пользователь не найден')
+        if data.get('discord_id') and user.discord_id != data['discord_id']:
+            raise PermissionDenied('Discord аккаунт не привязан к этому пользователю')
+        if user.is_banned:
+            raise PermissionDenied('Пользователь заблокирован')
+        return user
+
+
+class KeyEntitlementView(APIView):
+    """
+    Проверка права доступа пользователя (для лоадера).
+    Ответ берется из кеша Redis, пользователь определяется по JWT без запроса к базе,
+    поэтому при попадании в кеш запрос не обращается к базе данных.
+    """
+    authentication_classes = [JWTStatelessUserAuthentication]
+    permission_classes = [permissions.IsAuthenticated]
+    
+    def get(self, request, *args, **kwargs):
+        """Текущее право доступа и проверка типа ключа из параметра key_type"""
+        key_type = request.query_params.get('key_type')
+        if key_type and key_type not in KEY_TYPE_RANK:
+            return Response(
+                {'error': 'Неизвестный тип ключа'},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+        
+        entitlement = get_entitlement(request.user.id)
+        return Response({
+            'entitled': has_entitlement(entitlement, key_type),
+            'key_type': entitlement['key_type'],
+            'expires_at': entitlement['expires_at'],
+        })
+
+
+class LicenseView(APIView):
+    """
+    Выдача подписанной лицензии для офлайн-проверки лоадером.
+    Клиент обращается сюда только при истечении токена, передавая старый токен в token.
+    """
+    permission_classes = [permissions.IsAuthenticated]
+    
+    def post(self, request, *args, **kwargs):
+        """Выдача или обновление лицензии"""
+        serializer = LicenseRequestSerializer(data=request.data)
+        if not serializer.is_valid():
+            return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
+        
+        extra = {
+            'user_id': request.user.id,
+            'ip_address': getattr(request, 'client_ip', request.META.get('REMOTE_ADDR', ''))
+        }
+        
+        previous_token = serializer.validated_data.get('token')
+        if previous_token:
+            try:
+                check_refresh_token(request.user, previous_token)
+            except LicenseError as e:
+                logger.warning(f"License refresh rejected for {request.user.username}: {e}", extra=extra)
+                return Response({'error': str(e)}, status=status.HTTP_403_FORBIDDEN)
+        
+        token, payload = issue_license(request.user)
+        if token is None:
+            return Response(
+                {'error': 'Нет действующего ключа'},
+                status=status.HTTP_403_FORBIDDEN
+            )
+        
+        return Response({
+            'token': token,
+            'key_type': payload['typ'],
+            'expires_at': payload['exp'],
+        })
+
+
+class LicensePublicKeyView(APIView):
+    """Публичный ключ Ed25519 для проверки лицензий"""
+    permission_classes = [permissions.AllowAny]
+    
+    def get(self, request, *args, **kwargs):
+        return Response({
+            'algorithm': 'Ed25519',
+            'public_key': get_public_key_b64(),
+        })
+
+
 class KeyRevokeView(APIView):
     """Отзыв ключа"""
     permission_classes = [IsAdminOrModerator]
@@ -7,6 +7,7 @@ from django.http import HttpResponseRedirect
 from django.urls import path
 from datetime import timedelta
 from .models import Log
+from .partitions import drop_partitions_before, truncate_logs
 
 
 @admin.register(Log)
@@ -57,27 +58,41 @@ class LogAdmin(admin.ModelAdmin):
             return HttpResponseRedirect("../")
         
         if days:
-            cutoff_date = timezone.now() - timedelta(days=days)
-            count, _ = Log.objects.filter(timestamp__lt=cutoff_date).delete()
-            self.message_user(request, f"Удалено {count} логов старше {days} дней", level=messages.SUCCESS)
+            self._clear_logs_before(request, days)
         else:
-            count, _ = Log.objects.all().delete()
-            self.message_user(request, f"Удалено {count} логов", level=messages.SUCCESS)
+            self._clear_all(request)
         
         return HttpResponseRedirect("../")
     
+    def _clear_logs_before(self, request, days):
+        """Удаление логов старше days дней: партиции удаляются целиком, остаток - DELETE"""
+        cutoff_date = timezone.now() - timedelta(days=days)
+        dropped, count = drop_partitions_before(cutoff_date)
+        if dropped:
+            self.message_user(
+                request,
+                f"Удалено {dropped} партиций и {count} логов старше {days} дней",
+                level=messages.SUCCESS
+            )
+        else:
+            self.message_user(request, f"Удалено {count} логов старше {days} дней", level=messages.SUCCESS)
+    
+    def _clear_all(self, request):
+        """Удаление всех логов (TRUNCATE для партиционированной таблицы)"""
+        count = truncate_logs()
+        if count is None:
+            self.message_user(request, "Все логи удалены", level=messages.SUCCESS)
+        else:
+            self.message_user(request, f"Удалено {count} логов", level=messages.SUCCESS)
+    
     def clear_logs_older_than_7_days(self, modeladmin, request, queryset):
         """Действие для очистки логов старше 7 дней"""
-        cutoff_date = timezone.now() - timedelta(days=7)
-        count, _ = Log.objects.filter(timestamp__lt=cutoff_date).delete()
-        self.message_user(request, f"Удалено {count} логов старше 7 дней", level=messages.SUCCESS)
+        self._clear_logs_before(request, 7)
     clear_logs_older_than_7_days.short_description = "Удалить логи старше 7 дней"
     
     def clear_logs_older_than_30_days(self, modeladmin, request, queryset):
         """Действие для очистки логов старше 30 дней"""
-        cutoff_date = timezone.now() - timedelta(days=30)
-        count, _ = Log.objects.filter(timestamp__lt=cutoff_date).delete()
-        self.message_user(request, f"Удалено {count} логов старше 30 дней", level=messages.SUCCESS)
+        self._clear_logs_before(request, 30)
     clear_logs_older_than_30_days.short_description = "Удалить логи старше 30 дней"
     
     def clear_all_logs(self, modeladmin, request, queryset):
@@ -86,8 +101,7 @@ class LogAdmin(admin.ModelAdmin):
             self.message_user(request, "Только администраторы могут очищать все логи", level=messages.ERROR)
             return
         
-        count, _ = Log.objects.all().delete()
-        self.message_user(request, f"Удалено {count} логов", level=messages.SUCCESS)
+        self._clear_all(request)
     clear_all_logs.short_description = "Удалить все логи"
     
     def changelist_view(self, request, extra_context=None):
@@ -1,88 +1,213 @@
 import logging
 import json
+import os
+import sys
+import time
+import queue
+import threading
 import requests
+from datetime import datetime, timezone
 from django.conf import settings
 from django.apps import apps
 
 
+# Служебные атрибуты LogRecord, которые не попадают в extra_data
+RECORD_SYSTEM_ATTRS = {
+    'msg', 'args', 'exc_info', 'exc_text', 'message', 'levelname', 'pathname', 'filename',
+    'module', 'lineno', 'funcName', 'created', 'msecs', 'relativeCreated', 'levelno', 'name'
+}
+
+
 class DatabaseLogHandler(logging.Handler):
-    """Обработчик логов для сохранения в базу данных"""
+    """
+    Обработчик логов для сохранения в базу данных.
+    emit() только кладет запись в ограниченную очередь, в базу записи пишет
+    фоновый поток пачками через bulk_create - по размеру пачки или по таймеру.
+    При переполнении очереди записи отбрасываются и учитываются в счетчиках.
+    """
+    
+    def __init__(self, batch_size=100, flush_interval=1.0, max_queue_size=10000, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.queue = queue.Queue(maxsize=max_queue_size)
+        
+        # Счетчики: отброшенные при переполнении, случаи переполнения, ошибки записи, записанные
+        self.dropped_count = 0
+        self.overflow_count = 0
+        self.failed_count = 0
+        self.written_count = 0
+        
+        self._overflowing = False
+        self._stop_event = threading.Event()
+        self._thread = None
+        self._pid = None
+        self._start_lock = threading.Lock()
+    
+    def _ensure_worker(self):
+        """Запуск фонового потока (повторно - после fork воркера gunicorn)"""
+        if self._thread is not None and self._thread.is_alive() and self._pid == os.getpid():
+            return
+        
+        with self._start_lock:
+            if self._thread is not None and self._thread.is_alive() and self._pid == os.getpid():
+                return
+            self._pid = os.getpid()
+            self._stop_event.clear()
+            self._thread = threading.Thread(target=self._run, name='DatabaseLogHandler', daemon=True)
+            self._thread.start()
     
     def emit(self, record):
-        """Сохранение лога в базу данных"""
+        """Постановка записи лога в очередь на сохранение"""
+        try:
+            item = {
+                'message': self.format(record),
+                'name': record.name,
+                'levelno': record.levelno,
+                'created': record.created,
+                'attrs': {key: value for key, value in record.__dict__.items() if key not in RECORD_SYSTEM_ATTRS},
+            }
+        except Exception:
+            self.handleError(record)
+            return
+        
+        try:
+            self.queue.put_nowait(item)
+            self._overflowing = False
+        except queue.Full:
+            self.dropped_count += 1
+            if not self._overflowing:
+                self._overflowing = True
+                self.overflow_count += 1
+            return
+        
+        self._ensure_worker()
+    
+    def _run(self):
+        """Цикл фонового потока: набирает пачку и сохраняет ее"""
+        from django.db import connection
+        
+        try:
+            while not self._stop_event.is_set():
+                batch = self._collect_batch()
+                if batch:
+                    self._write(batch)
+        finally:
+            connection.close()
+    
+    def _collect_batch(self):
+        """Набирает пачку до batch_size записей или до истечения flush_interval"""
+        batch = []
+        deadline = time.monotonic() + self.flush_interval
+        while len(batch) < self.batch_size:
+            timeout = deadline - time.monotonic()
+            if timeout <= 0:
+                break
+            try:
+                batch.append(self.queue.get(timeout=timeout))
+            except queue.Empty:
+                break
+        return batch
+    
+    def _drain(self):
+        """Сохраняет все записи, оставшиеся в очереди"""
+        while True:
+            batch = []
+            while len(batch) < self.batch_size:
+                try:
+                    batch.append(self.queue.get_nowait())
+                except queue.Empty:
+                    break
+            if not batch:
+                return
+            self._write(batch)
+    
+    def _write(self, batch):
+        """Сохранение пачки записей одним bulk_create"""
         try:
-            # Отладочный вывод для проверки параметров
-            print(f"LOG HANDLER DEBUG: Record attributes: user_id={getattr(record, 'user_id', None)}, ip_address={getattr(record, 'ip_address', None)}")
-            print(f"LOG HANDLER DEBUG: Record __dict__: {record.__dict__}")
-            
             # Отложенный импорт Log для избежания циклической зависимости
             Log = apps.get_model('logs', 'Log')
-            
-            # Форматируем сообщение
-            message = self.format(record)
-            
-            # Определяем категорию по имени логгера
-            category = 'system'  # Log.LogCategory.SYSTEM по умолчанию
-            if record.name.startswith('users'):
-                category = 'user'  # Log.LogCategory.USER
-            elif record.name.startswith('keys'):
-                category = 'key'  # Log.LogCategory.KEY
-            elif record.name.startswith('invites'):
-                category = 'invite'  # Log.LogCategory.INVITE
-            elif record.name.startswith('discord'):
-                category = 'discord'  # Log.LogCategory.DISCORD
-            elif record.name.startswith('security'):
-                category = 'security'  # Log.LogCategory.SECURITY
-            
-            # Определяем уровень лога
-            level = 'info'  # Log.LogLevel.INFO по умолчанию
-            if record.levelno >= logging.CRITICAL:
-                level = 'critical'  # Log.LogLevel.CRITICAL
-            elif record.levelno >= logging.ERROR:
-                level = 'error'  # Log.LogLevel.ERROR
-            elif record.levelno >= logging.WARNING:
-                level = 'warning'  # Log.LogLevel.WARNING
-            elif record.levelno <= logging.DEBUG:
-                level = 'debug'  # Log.LogLevel.DEBUG
-            
-            # Получаем дополнительные данные из записи лога
-            extra_data = {}
-            for key, value in record.__dict__.items():
-                if key not in ['msg', 'args', 'exc_info', 'exc_text', 'message', 'levelname', 'pathname', 'filename',
-                              'module', 'lineno', 'funcName', 'created', 'msecs', 'relativeCreated', 'levelno', 'name']:
-                    try:
-                        # Пытаемся конвертировать значение в JSON-сериализуемый формат
-                        json.dumps({key: value})
-                        extra_data[key] = value
-                    except (TypeError, OverflowError):
-                        # Если не удалось, преобразуем в строку
-                        extra_data[key] = str(value)
-            
-            # Проверяем пользователя и IP в extra_data
-            user_id = getattr(record, 'user_id', None)
-            ip_address = getattr(record, 'ip_address', None)
-            
-            # Если не нашли в атрибутах, проверяем в extra_data
-            if not user_id and 'user_id' in extra_data:
-                user_id = extra_data['user_id']
-            
-            if not ip_address and 'ip_address' in extra_data:
-                ip_address = extra_data['ip_address']
-            
-            print(f"LOG HANDLER SAVING: user_id={user_id}, ip_address={ip_address}")
-            
-            # Создаем запись в базе данных
-            Log.objects.create(
-                level=level,
-                category=category,
-                message=message,
-                user_id=user_id,
-                ip_address=ip_address,
-                extra_data=extra_data if extra_data else None
-            )
+            Log.objects.bulk_create([self._build_log(Log, item) for item in batch])
+            self.written_count += len(batch)
         except Exception as e:
-            # В случае ошибки записываем в стандартный журнал
-            print(f"Error saving log to database: {e}")
+            self.failed_count += len(batch)
+            # В случае ошибки записываем в стандартный поток ошибок
+            sys.stderr.write(f"Error saving {len(batch)} logs to database: {e}\n")
+    
+    @staticmethod
+    def _build_log(Log, item):
+        """Преобразование записи из очереди в объект Log"""
+        name = item['name']
+        levelno = item['levelno']
+        
+        # Определяем категорию по имени логгера
+        category = Log.LogCategory.SYSTEM
+        if name.startswith('users'):
+            category = Log.LogCategory.USER
+        elif name.startswith('keys'):
+            category = Log.LogCategory.KEY
+        elif name.startswith('invites'):
+            category = Log.LogCategory.INVITE
+        elif name.startswith('discord'):
+            category = Log.LogCategory.DISCORD
+        elif name.startswith('security'):
+            category = Log.LogCategory.SECURITY
+        
+        # Определяем уровень лога
+        level = Log.LogLevel.INFO
+        if levelno >= logging.CRITICAL:
+            level = Log.LogLevel.CRITICAL
+        elif levelno >= logging.ERROR:
+            level = Log.LogLevel.ERROR
+        elif levelno >= logging.WARNING:
+            level = Log.LogLevel.WARNING
+        elif levelno <= logging.DEBUG:
+            level = Log.LogLevel.DEBUG
+        
+        # Получаем дополнительные данные из записи лога
+        extra_data = {}
+        for key, value in item['attrs'].items():
+            try:
+                # Пытаемся конвертировать значение в JSON-сериализуемый формат
+                json.dumps({key: value})
+                extra_data[key] = value
+            except (TypeError, OverflowError, ValueError):
+                # Если не удалось, преобразуем в строку
+                extra_data[key] = str(value)
+        
+        return Log(
+            level=level,
+            category=category,
+            message=item['message'],
+            timestamp=datetime.fromtimestamp(item['created'], tz=timezone.utc),
+            user_id=item['attrs'].get('user_id'),
+            ip_address=item['attrs'].get('ip_address'),
+            extra_data=extra_data if extra_data else None
+        )
+    
+    def stats(self):
+        """Метрики обработчика"""
+        return {
+            'queued': self.queue.qsize(),
+            'written': self.written_count,
+            'dropped': self.dropped_count,
+            'overflows': self.overflow_count,
+            'failed': self.failed_count,
+        }
+    
+    def flush(self):
+        """Немедленное сохранение записей из очереди"""
+        self._drain()
+    
+    def close(self):
+        """Остановка фонового потока с сохранением оставшихся записей"""
+        self._stop_event.set()
+        if self._thread is not None and self._thread.is_alive() and self._pid == os.getpid():
+            self._thread.join(timeout=self.flush_interval + 5)
+        try:
+            self._drain()
+        finally:
+            super().close()
 
 
 class DiscordWebhookHandler(logging.Handler):
@@ -0,0 +1,69 @@
+from datetime import timedelta
+from django.core.management.base import BaseCommand, CommandError
+from django.utils import timezone
+from logs.partitions import (
+    setup_partitioning, is_partitioned, list_partitions,
+    maintain_partitions, drop_partitions_before
+)
+
+
+class Command(BaseCommand):
+    help = 'Партиционирование таблицы логов по времени: настройка, создание будущих партиций и удаление старых'
+    
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--setup',
+            action='store_true',
+            help='Преобразовать logs_log в партиционированную таблицу (однократно)'
+        )
+        parser.add_argument(
+            '--interval',
+            choices=['day', 'month'],
+            help='Размер партиции при --setup (по умолчанию из LOG_PARTITIONING)'
+        )
+        parser.add_argument(
+            '--drop-older-than',
+            type=int,
+            metavar='DAYS',
+            help='Удалить партиции и логи старше указанного количества дней'
+        )
+        parser.add_argument(
+            '--detach',
+            action='store_true',
+            help='Вместе с --drop-older-than: отсоединять партиции вместо удаления (для архивации)'
+        )
+        parser.add_argument(
+            '--list',
+            action='store_true',
+            help='Показать список партиций'
+        )
+    
+    def handle(self, *args, **options):
+        if options['setup']:
+            try:
+                if setup_partitioning(interval=options['interval']):
+                    self.stdout.write(self.style.SUCCESS('Таблица логов преобразована в партиционированную'))
+                else:
+                    self.stdout.write('Таблица логов уже партиционирована')
+            except RuntimeError as e:
+                raise CommandError(str(e))
+        
+        if not is_partitioned():
+            raise CommandError('Таблица логов не партиционирована, выполните команду с --setup')
+        
+        if options['drop_older_than'] is not None:
+            cutoff = timezone.now() - timedelta(days=options['drop_older_than'])
+            dropped, deleted = drop_partitions_before(cutoff, detach_only=options['detach'])
+            action = 'Отсоединено' if options['detach'] else 'Удалено'
+            self.stdout.write(f"{action} партиций: {dropped}, удалено строк: {deleted}")
+        else:
+            result = maintain_partitions()
+            self.stdout.write(
+                f"Создано партиций: {len(result['created'])}, "
+                f"удалено партиций: {result['dropped']}, удалено строк: {result['deleted']}"
+            )
+        
+        if options['list']:
+            for name, upper in list_partitions():
+                bound = upper.strftime('%Y-%m-%d %H:%M') if upper else 'DEFAULT'
+                self.stdout.write(f"{name}: до {bound}")
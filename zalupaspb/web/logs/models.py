@@ -1,6 +1,7 @@
 from django.db import models
 from django.utils.translation import gettext_lazy as _
 from django.conf import settings
+from django.utils import timezone
 import uuid
 
 
@@ -23,7 +24,8 @@ class Log(models.Model):
         SECURITY = 'security', _('Безопасность')
     
     id = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False)
-    timestamp = models.DateTimeField(auto_now_add=True, verbose_name=_('Дата и время'))
+    # Время события, а не записи в базу: обработчик пишет логи пачками с задержкой (logs.handlers)
+    timestamp = models.DateTimeField(default=timezone.now, verbose_name=_('Дата и время'))
     level = models.CharField(
         max_length=10,
         choices=LogLevel.choices,
@@ -58,6 +60,10 @@ class Log(models.Model):
         verbose_name = _('Лог')
         verbose_name_plural = _('Логи')
         ordering = ['-timestamp']
+        indexes = [
+            # Составной индекс для курсорной пагинации по (timestamp, id)
+            models.Index(fields=['-timestamp', '-id'], name='logs_log_timestamp_id_idx'),
+        ]
     
     def __str__(self):
         return f"{self.timestamp} [{self.get_level_display()}] {self.message[:50]}..." 
\ No newline at end of file
@@ -0,0 +1,322 @@
+import re
+import logging
+from datetime import datetime, timedelta, timezone as dt_timezone
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.db import connection, transaction
+from django.utils import timezone
+from django.utils.dateparse import parse_datetime
+from .models import Log
+
+logger = logging.getLogger('django')
+
+# Верхняя граница партиции в выводе pg_get_expr: FOR VALUES FROM (...) TO ('2026-10-18 00:00:00+00')
+UPPER_BOUND_RE = re.compile(r"TO \('([^']+)'\)")
+
+
+def get_partitioning_settings():
+    """Настройки партиционирования таблицы логов с значениями по умолчанию"""
+    partition_settings = getattr(settings, 'LOG_PARTITIONING', {})
+    return {
+        'interval': partition_settings.get('interval', 'day'),
+        'premake': partition_settings.get('premake', 7),
+        'retention_days': partition_settings.get('retention_days'),
+    }
+
+
+def _table():
+    return Log._meta.db_table
+
+
+def _legacy_table():
+    """Партиция с данными, существовавшими до преобразования таблицы (setup_partitioning)"""
+    return f"{_table()}_legacy"
+
+
+# Индексы модели Log, которые создаются на партиционированной таблице: (имя, столбцы)
+MODEL_INDEXES = [
+    ('logs_log_timestamp_id_idx', '"timestamp" DESC, "id" DESC'),
+]
+
+
+def ensure_indexes():
+    """
+    Создание индексов модели (Log.Meta.indexes) на партиционированной таблице.
+    Индекс на родительской таблице создается и на всех партициях; существующий такой же индекс
+    партиции legacy переименовывается и присоединяется, а не строится заново.
+    Возвращает список имен созданных индексов.
+    """
+    table = _table()
+    legacy = _legacy_table()
+    qn = connection.ops.quote_name
+    created = []
+
+    with connection.cursor() as cursor:
+        for name, columns in MODEL_INDEXES:
+            cursor.execute("SELECT tablename FROM pg_indexes WHERE indexname = %s", [name])
+            row = cursor.fetchone()
+            if row is not None and row[0] == table:
+                continue
+            if row is not None and row[0] == legacy:
+                # Индекс остался от непартиционированной таблицы - имя нужно родительскому индексу
+                cursor.execute(f"ALTER INDEX {qn(name)} RENAME TO {qn(legacy + name[len(table):])}")
+            cursor.execute(f"CREATE INDEX {qn(name)} ON {qn(table)} ({columns})")
+            created.append(name)
+
+    if created:
+        logger.info(f"Созданы индексы таблицы логов: {', '.join(created)}")
+    return created
+
+
+def period_start(dt, interval):
+    """Начало периода (дня или месяца) в UTC, в который попадает dt"""
+    dt = dt.astimezone(dt_timezone.utc)
+    if interval == 'month':
+        return datetime(dt.year, dt.month, 1, tzinfo=dt_timezone.utc)
+    return datetime(dt.year, dt.month, dt.day, tzinfo=dt_timezone.utc)
+
+
+def next_period(start, interval):
+    """Начало следующего периода"""
+    if interval == 'month':
+        if start.month == 12:
+            return start.replace(year=start.year + 1, month=1)
+        return start.replace(month=start.month + 1)
+    return start + timedelta(days=1)
+
+
+def partition_name(start, interval):
+    """Имя партиции: logs_log_p20261018 для дневных, logs_log_p202610 для месячных"""
+    suffix = start.strftime('%Y%m') if interval == 'month' else start.strftime('%Y%m%d')
+    return f"{_table()}_p{suffix}"
+
+
+def is_partitioned():
+    """Проверка, что таблица логов уже преобразована в партиционированную"""
+    if connection.vendor != 'postgresql':
+        return False
+    with connection.cursor() as cursor:
+        cursor.execute(
+            "SELECT 1 FROM pg_partitioned_table p JOIN pg_class c ON c.oid = p.partrelid WHERE c.relname = %s",
+            [_table()]
+        )
+        return cursor.fetchone() is not None
+
+
+def list_partitions():
+    """
+    Список партиций таблицы логов: [(имя, верхняя граница или None)].
+    Для партиции по умолчанию граница равна None.
+    """
+    with connection.cursor() as cursor:
+        cursor.execute(
+            """
+            SELECT child.relname, pg_get_expr(child.relpartbound, child.oid)
+            FROM pg_inherits
+            JOIN pg_class parent ON parent.oid = pg_inherits.inhparent
+            JOIN pg_class child ON child.oid = pg_inherits.inhrelid
+            WHERE parent.relname = %s
+            ORDER BY child.relname
+            """,
+            [_table()]
+        )
+        partitions = []
+        for name, bound in cursor.fetchall():
+            match = UPPER_BOUND_RE.search(bound or '')
+            partitions.append((name, parse_datetime(match.group(1)) if match else None))
+        return partitions
+
+
+def create_partition(start, interval):
+    """
+    Создание партиции для периода, начинающегося в start.
+    Строки, попавшие в партицию по умолчанию за этот период, переносятся в новую партицию,
+    иначе ATTACH PARTITION завершится ошибкой.
+    """
+    table = _table()
+    name = partition_name(start, interval)
+    end = next_period(start, interval)
+    qn = connection.ops.quote_name
+
+    with transaction.atomic(), connection.cursor() as cursor:
+        cursor.execute("SELECT to_regclass(%s)", [name])
+        if cursor.fetchone()[0] is not None:
+            return False
+
+        cursor.execute(f"CREATE TABLE {qn(name)} (LIKE {qn(table)} INCLUDING DEFAULTS INCLUDING CONSTRAINTS)")
+        cursor.execute(
+            f"""
+            WITH moved AS (
+                DELETE FROM {qn(table + '_default')}
+                WHERE "timestamp" >= %s AND "timestamp" < %s
+                RETURNING *
+            )
+            INSERT INTO {qn(name)} SELECT * FROM moved
+            """,
+            [start, end]
+        )
+        cursor.execute(
+            f"ALTER TABLE {qn(table)} ATTACH PARTITION {qn(name)} FOR VALUES FROM (%s) TO (%s)",
+            [start, end]
+        )
+
+    logger.info(f"Создана партиция логов {name} [{start:%Y-%m-%d} - {end:%Y-%m-%d})")
+    return True
+
+
+def ensure_partitions(premake=None, interval=None, now=None):
+    """
+    Создание партиций на текущий период и premake периодов вперед.
+    Возвращает список имен созданных партиций.
+    """
+    partition_settings = get_partitioning_settings()
+    interval = interval or partition_settings['interval']
+    premake = partition_settings['premake'] if premake is None else premake
+
+    start = period_start(now or timezone.now(), interval)
+    end = start
+    for _ in range(premake + 1):
+        end = next_period(end, interval)
+    
+    # Периоды до верхней границы уже существующих партиций (в т.ч. legacy) пропускаем
+    covered = [upper for _, upper in list_partitions() if upper is not None]
+    if covered:
+        start = max(start, period_start(max(covered), interval))
+    
+    created = []
+    while start < end:
+        if create_partition(start, interval):
+            created.append(partition_name(start, interval))
+        start = next_period(start, interval)
+    return created
+
+
+def setup_partitioning(interval=None, premake=None):
+    """
+    Однократное преобразование logs_log в таблицу, партиционированную по timestamp.
+    Существующая таблица становится партицией logs_log_legacy (от MINVALUE до конца текущего периода),
+    поэтому данные не копируются. Строки из нее по сроку хранения не удаляются: партиция удаляется
+    целиком, когда срок хранения проходит ее верхнюю границу (см. drop_partitions_before).
+    Первичный ключ партиционированной таблицы - (id, timestamp).
+    """
+    if connection.vendor != 'postgresql':
+        raise RuntimeError('Партиционирование логов поддерживается только для PostgreSQL')
+    if is_partitioned():
+        return False
+
+    interval = interval or get_partitioning_settings()['interval']
+    table = _table()
+    legacy = _legacy_table()
+    user_table = get_user_model()._meta.db_table
+    boundary = next_period(period_start(timezone.now(), interval), interval)
+    qn = connection.ops.quote_name
+
+    with transaction.atomic(), connection.cursor() as cursor:
+        cursor.execute(f"LOCK TABLE {qn(table)} IN ACCESS EXCLUSIVE MODE")
+        cursor.execute(f"ALTER TABLE {qn(table)} RENAME TO {qn(legacy)}")
+        cursor.execute(f"ALTER TABLE {qn(legacy)} RENAME CONSTRAINT {qn(table + '_pkey')} TO {qn(legacy + '_pkey')}")
+
+        cursor.execute(
+            f"""CREATE TABLE {qn(table)} (LIKE {qn(legacy)} INCLUDING DEFAULTS INCLUDING CONSTRAINTS)
+            PARTITION BY RANGE ("timestamp")"""
+        )
+        cursor.execute(f'ALTER TABLE {qn(table)} ADD CONSTRAINT {qn(table + "_pkey")} PRIMARY KEY (id, "timestamp")')
+        cursor.execute(f'CREATE INDEX {qn(table + "_timestamp_idx")} ON {qn(table)} ("timestamp")')
+        cursor.execute(f'CREATE INDEX {qn(table + "_user_id_idx")} ON {qn(table)} (user_id)')
+        cursor.execute(
+            f"""ALTER TABLE {qn(table)} ADD CONSTRAINT {qn(table + '_user_id_fk')}
+            FOREIGN KEY (user_id) REFERENCES {qn(user_table)} (id) DEFERRABLE INITIALLY DEFERRED"""
+        )
+
+        cursor.execute(
+            f"ALTER TABLE {qn(table)} ATTACH PARTITION {qn(legacy)} FOR VALUES FROM (MINVALUE) TO (%s)",
+            [boundary]
+        )
+        # Партиция по умолчанию принимает строки, для которых еще не создана партиция
+        cursor.execute(f"CREATE TABLE {qn(table + '_default')} PARTITION OF {qn(table)} DEFAULT")
+
+    logger.info(f"Таблица {table} преобразована в партиционированную, существующие данные в {legacy}")
+    ensure_indexes()
+    ensure_partitions(premake=premake, interval=interval, now=boundary)
+    return True
+
+
+def drop_partitions_before(cutoff, detach_only=False):
+    """
+    Удаление логов старше cutoff.
+    Партиции, целиком лежащие до cutoff, удаляются через DROP TABLE (или только отсоединяются
+    при detach_only), оставшиеся строки старше cutoff удаляются DELETE в пределах граничной партиции.
+    Партиция legacy (вся таблица до партиционирования) построчно не очищается - это был бы тот же
+    DELETE по большой таблице; она удаляется целиком, когда cutoff проходит ее верхнюю границу.
+    Для непартиционированной таблицы выполняется обычный DELETE.
+    Возвращает (количество удаленных или отсоединенных партиций, количество удаленных строк).
+    """
+    if not is_partitioned():
+        count, _ = Log.objects.filter(timestamp__lt=cutoff).delete()
+        return 0, count
+
+    table = _table()
+    qn = connection.ops.quote_name
+    dropped = []
+    legacy_kept = False
+
+    with transaction.atomic(), connection.cursor() as cursor:
+        for name, upper in list_partitions():
+            if upper is None:
+                continue
+            if upper > cutoff:
+                # Все строки старше cutoff лежат в партиции legacy, она дождется удаления целиком
+                legacy_kept = legacy_kept or name == _legacy_table()
+                continue
+            if detach_only:
+                cursor.execute(f"ALTER TABLE {qn(table)} DETACH PARTITION {qn(name)}")
+            else:
+                cursor.execute(f"DROP TABLE {qn(name)}")
+            dropped.append(name)
+
+        # Остаток граничной партиции и партиции по умолчанию - partition pruning ограничивает DELETE ими
+        deleted = 0
+        if not legacy_kept:
+            cursor.execute(f'DELETE FROM {qn(table)} WHERE "timestamp" < %s', [cutoff])
+            deleted = cursor.rowcount
+
+    if dropped:
+        action = 'Отсоединены' if detach_only else 'Удалены'
+        logger.info(f"{action} партиции логов старше {cutoff:%Y-%m-%d %H:%M}: {', '.join(dropped)}")
+    return len(dropped), deleted
+
+
+def truncate_logs():
+    """
+    Удаление всех логов.
+    TRUNCATE выполняется за O(1) и не оставляет мертвых строк, партиции при этом сохраняются.
+    """
+    if not is_partitioned():
+        count, _ = Log.objects.all().delete()
+        return count
+
+    with connection.cursor() as cursor:
+        cursor.execute(f"TRUNCATE {connection.ops.quote_name(_table())}")
+    return None
+
+
+def maintain_partitions(now=None):
+    """
+    Плановое обслуживание: создание будущих партиций и удаление партиций
+    старше retention_days (если задано). Для непартиционированной таблицы ничего не делает.
+    """
+    if not is_partitioned():
+        return {'created': [], 'dropped': 0, 'deleted': 0}
+
+    now = now or timezone.now()
+    partition_settings = get_partitioning_settings()
+    # Таблицы, преобразованные до появления индекса в MODEL_INDEXES, получают его здесь
+    ensure_indexes()
+    created = ensure_partitions(now=now)
+
+    dropped, deleted = 0, 0
+    if partition_settings['retention_days']:
+        cutoff = now - timedelta(days=partition_settings['retention_days'])
+        dropped, deleted = drop_partitions_before(cutoff)
+
+    return {'created': created, 'dropped': dropped, 'deleted': deleted}
@@ -1,7 +1,8 @@
 from django.urls import path
-from .views import LogListView, LogDetailView
+from .views import LogListView, LogDetailView, LogExportView
 
 urlpatterns = [
     path('', LogListView.as_view(), name='log_list'),
     path('<uuid:pk>/', LogDetailView.as_view(), name='log_detail'),
+    path('export/', LogExportView.as_view(), name='log_export'),
 ] 
\ No newline at end of file
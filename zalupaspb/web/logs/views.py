@@ -1,6 +1,7 @@
 from rest_framework import generics, permissions
 from .models import Log
 from .serializers import LogSerializer
+from zalupaspb.export import StreamingExportMixin
 
 
 class IsAdminOrModerator(permissions.BasePermission):
@@ -14,6 +15,7 @@ class LogListView(generics.ListAPIView):
     """Список логов с фильтрацией"""
     serializer_class = LogSerializer
     permission_classes = [IsAdminOrModerator]
+    keyset_ordering = ('timestamp', 'id')  # курсорная пагинация по ?cursor=
     
     def get_queryset(self):
         """Получение списка логов с фильтрацией"""
@@ -57,6 +59,22 @@ class LogListView(generics.ListAPIView):
         return queryset
 
 
+class LogExportView(StreamingExportMixin, LogListView):
+    """Потоковая выгрузка логов (фильтры как у списка логов)"""
+    export_filename = 'logs'
+    export_fields = (
+        ('id', 'id'),
+        ('timestamp', 'timestamp'),
+        ('level', 'level'),
+        ('category', 'category'),
+        ('message', 'message'),
+        ('user', 'user_id'),
+        ('username', 'user__username'),
+        ('ip_address', 'ip_address'),
+        ('extra_data', 'extra_data'),
+    )
+
+
 class LogDetailView(generics.RetrieveAPIView):
     """Детальная информация о логе"""
     queryset = Log.objects.all()
@@ -70,12 +70,17 @@ class UserAdmin(BaseUserAdmin):
         return format_html('<a href="{}">{}</a>', url, obj.invited_by.username)
     invited_by_link.short_description = _('Приглашен')
     
+    def get_queryset(self, request):
+        """Список пользователей с вычисленным в SQL количеством доступных инвайтов"""
+        return super().get_queryset(request).with_available_invites().select_related('invited_by')
+    
     def available_invites(self, obj):
         """Отображение доступных инвайтов"""
         if obj.role == 'admin':
             return '∞'
-        return obj.get_invites_available()
+        return obj.available_invites_count
     available_invites.short_description = _('Доступно инвайтов')
+    available_invites.admin_order_field = 'available_invites_count'
     
     def ban_users(self, request, queryset):
         """Блокировка выбранных пользователей"""
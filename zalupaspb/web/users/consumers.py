@@ -3,6 +3,7 @@ from channels.generic.websocket import AsyncWebsocketConsumer
 from channels.db import database_sync_to_async
 from django.utils import timezone
 from .models import User
+from .notifications import USER_STATUS_GROUP
 
 
 class UserStatusConsumer(AsyncWebsocketConsumer):
@@ -25,7 +26,7 @@ class UserStatusConsumer(AsyncWebsocketConsumer):
         
         # Подключаем пользователя к группе обновлений статуса
         await self.channel_layer.group_add(
-            'user_status_updates',
+            USER_STATUS_GROUP,
             self.channel_name
         )
         
@@ -35,7 +36,7 @@ class UserStatusConsumer(AsyncWebsocketConsumer):
         """Обработка отключения от WebSocket"""
         # Отключаем пользователя от группы обновлений статуса
         await self.channel_layer.group_discard(
-            'user_status_updates',
+            USER_STATUS_GROUP,
             self.channel_name
         )
     
@@ -53,6 +54,20 @@ class UserStatusConsumer(AsyncWebsocketConsumer):
             'timestamp': event['timestamp'],
         }))
     
+    async def user_status_batch(self, event):
+        """Отправка объединенных обновлений статуса пользователей одним сообщением"""
+        await self.send(text_data=json.dumps({
+            'type': 'user_status_batch',
+            'events': [
+                {
+                    'user_id': item['user_id'],
+                    'status': item['status'],
+                    'timestamp': item['timestamp'],
+                }
+                for item in event['events']
+            ],
+        }))
+    
     @database_sync_to_async
     def get_user_role(self, user):
         """Получение роли пользователя из базы данных"""
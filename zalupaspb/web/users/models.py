@@ -1,14 +1,44 @@
 from django.db import models
-from django.contrib.auth.models import AbstractUser
+from django.contrib.auth.models import AbstractUser, UserManager as BaseUserManager
+from django.db.models.functions import Greatest
 from django.utils.translation import gettext_lazy as _
 from django.utils import timezone
 from django.conf import settings
+from zalupaspb.tracking import FieldTrackerMixin
 import uuid
 
 
-class User(AbstractUser):
+class UserQuerySet(models.QuerySet):
+    """Набор запросов для пользователей"""
+    
+    def with_available_invites(self, now=None):
+        """
+        Добавляет аннотацию available_invites_count - количество доступных инвайтов,
+        вычисленное в SQL с учетом ежемесячного сброса счетчика, без записи в базу.
+        Для администраторов значение NULL (без ограничений).
+        """
+        now = now or timezone.now()
+        month_ago = now - timezone.timedelta(days=30)
+        return self.annotate(
+            available_invites_count=models.Case(
+                models.When(role=User.Role.ADMIN, then=models.Value(None)),
+                models.When(last_invite_reset__lt=month_ago, then=Greatest(models.F('monthly_invites_limit'), 0)),
+                default=Greatest(models.F('monthly_invites_limit') - models.F('invites_used_this_month'), 0),
+                output_field=models.IntegerField(null=True),
+            )
+        )
+
+
+class UserManager(BaseUserManager.from_queryset(UserQuerySet)):
+    """Менеджер пользователей с поддержкой UserQuerySet"""
+
+
+class User(FieldTrackerMixin, AbstractUser):
     """Модель пользователя с расширенными полями для интеграции с Discord"""
     
+    # Поля, изменения которых отслеживаются сигналами без повторного чтения из базы
+    tracked_fields = ('role', 'is_banned')
+    
     class Role(models.TextChoices):
         ADMIN = 'admin', _('Администратор')
         MODERATOR = 'moderator', _('Модератор')
@@ -47,19 +77,43 @@ class User(AbstractUser):
     invites_used_this_month = models.IntegerField(default=0, verbose_name=_('Использовано инвайтов в этом месяце'))
     last_invite_reset = models.DateTimeField(default=timezone.now, verbose_name=_('Последний сброс инвайтов'))
     
+    # Поколение лицензий: увеличивается при отзыве ключа, старые лицензии после этого не обновляются
+    license_generation = models.PositiveIntegerField(default=0, verbose_name=_('Поколение лицензий'))
+    
     # Дополнительная информация
     last_login_ip = models.GenericIPAddressField(blank=True, null=True, verbose_name=_('IP последнего входа'))
     notes = models.TextField(blank=True, null=True, verbose_name=_('Примечания'))
     
+    objects = UserManager()
+    
     class Meta:
         verbose_name = _('Пользователь')
         verbose_name_plural = _('Пользователи')
+        indexes = [
+            # Составной индекс для курсорной пагинации по (date_joined, id)
+            models.Index(fields=['-date_joined', '-id'], name='users_user_joined_id_idx'),
+        ]
     
     def __str__(self):
         return self.username
     
+    @property
+    def invites_available(self):
+        """Количество доступных инвайтов с учетом сброса счетчика (без записи в базу)"""
+        if self.role == self.Role.ADMIN:
+            return float('inf')  # Бесконечно для админов
+        
+        month_ago = timezone.now() - timezone.timedelta(days=30)
+        if self.last_invite_reset < month_ago:
+            return max(0, self.monthly_invites_limit)
+        
+        return max(0, self.monthly_invites_limit - self.invites_used_this_month)
+    
     def get_invites_available(self):
-        """Возвращает количество доступных инвайтов"""
+        """
+        Возвращает количество доступных инвайтов.
+        При необходимости сбрасывает месячный счетчик, поэтому вызывается только на запись.
+        """
         if self.role == self.Role.ADMIN:
             return float('inf')  # Бесконечно для админов
         
@@ -103,6 +157,25 @@ class User(AbstractUser):
             # Не вызываем save здесь, чтобы избежать рекурсии
 
 
+class BindingCodeQuerySet(models.QuerySet):
+    """Набор запросов для кодов привязки"""
+    
+    def purge_stale(self, batch_size=1000, now=None):
+        """Удаляет истекшие коды привязки пачками. Возвращает количество удаленных"""
+        now = now or timezone.now()
+        total = 0
+        
+        while True:
+            ids = list(self.filter(expires_at__lt=now).order_by().values_list('id', flat=True)[:batch_size])
+            if not ids:
+                break
+            
+            deleted, _ = self.model.objects.filter(id__in=ids).delete()
+            total += deleted
+        
+        return total
+
+
 class BindingCode(models.Model):
     """Временный код для привязки Discord аккаунта к аккаунту на сайте"""
     user = models.ForeignKey(User, on_delete=models.CASCADE, related_name='binding_codes', verbose_name=_('Пользователь'))
@@ -111,9 +184,14 @@ class BindingCode(models.Model):
     expires_at = models.DateTimeField(verbose_name=_('Истекает'))
     is_used = models.BooleanField(default=False, verbose_name=_('Использован'))
     
+    objects = BindingCodeQuerySet.as_manager()
+    
     class Meta:
         verbose_name = _('Код привязки')
         verbose_name_plural = _('Коды привязки')
+        indexes = [
+            models.Index(fields=['expires_at'], name='users_bindingcode_expires_idx'),
+        ]
     
     def __str__(self):
         return f"{self.code} ({self.user.username})"
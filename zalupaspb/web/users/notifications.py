@@ -0,0 +1,21 @@
+from django.db import transaction
+from django.utils import timezone
+from keys.outbox import outbox
+
+
+# Группа обновлений статуса пользователей (UserStatusConsumer)
+USER_STATUS_GROUP = 'user_status_updates'
+
+
+def send_user_status_update(user_id, status, using=None):
+    """
+    Отправка уведомления об изменении статуса пользователя через WebSocket
+    (после фиксации транзакции, через общий outbox - см. keys.notifications).
+    """
+    message = {
+        'type': 'user_status_update',
+        'user_id': str(user_id),
+        'status': status,
+        'timestamp': timezone.now().isoformat(),
+    }
+    transaction.on_commit(lambda: outbox.put(USER_STATUS_GROUP, message), using=using)
@@ -30,8 +30,12 @@ class UserSerializer(serializers.ModelSerializer):
         return obj.get_role_display()
     
     def get_available_invites(self, obj):
-        """Получение количества доступных инвайтов"""
-        return obj.get_invites_available()
+        """Получение количества доступных инвайтов (аннотация with_available_invites)"""
+        if hasattr(obj, 'available_invites_count'):
+            if obj.available_invites_count is None:
+                return float('inf')  # Бесконечно для админов
+            return obj.available_invites_count
+        return obj.invites_available
     
     def get_invited_by_username(self, obj):
         """Получение имени пригласившего пользователя"""
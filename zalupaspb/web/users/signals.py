@@ -1,6 +1,7 @@
 from django.db.models.signals import post_save, pre_save
 from django.dispatch import receiver
 from .models import User
+from .notifications import send_user_status_update
 from django.conf import settings
 import logging
 
@@ -9,23 +10,18 @@ logger = logging.getLogger('users')
 @receiver(pre_save, sender=User)
 def user_pre_save(sender, instance, **kwargs):
     """Сигнал до сохранения пользователя"""
-    if instance.pk:
-        try:
-            old_instance = User.objects.get(pk=instance.pk)
-            # Если роль пользователя изменилась, обновляем лимиты инвайтов вручную
-            if old_instance.role != instance.role:
-                if instance.role in settings.INVITE_LIMITS:
-                    instance.monthly_invites_limit = settings.INVITE_LIMITS[instance.role]
-                
-                # Логируем изменение роли
-                logger.info(f"User {instance.username} role changed from {old_instance.role} to {instance.role}")
-                
-                # Здесь будет вызов асинхронной задачи для обновления ролей в Discord
-                # После создания Celery tasks
-                # from .tasks import sync_discord_roles
-                # sync_discord_roles.delay(instance.id)
-        except User.DoesNotExist:
-            pass
+    # Если роль пользователя изменилась, обновляем лимиты инвайтов вручную
+    if not instance._state.adding and instance.has_changed('role'):
+        if instance.role in settings.INVITE_LIMITS:
+            instance.monthly_invites_limit = settings.INVITE_LIMITS[instance.role]
+        
+        # Логируем изменение роли
+        logger.info(f"User {instance.username} role changed from {instance.previous('role')} to {instance.role}")
+        
+        # Здесь будет вызов асинхронной задачи для обновления ролей в Discord
+        # После создания Celery tasks
+        # from .tasks import sync_discord_roles
+        # sync_discord_roles.delay(instance.id)
 
 @receiver(post_save, sender=User)
 def user_post_save(sender, instance, created, **kwargs):
@@ -38,9 +34,16 @@ def user_post_save(sender, instance, created, **kwargs):
             User.objects.filter(pk=instance.pk).update(monthly_invites_limit=monthly_limit)
         
         logger.info(f"User {instance.username} created with role {instance.role}")
+    elif instance.has_changed('is_banned'):
+        # Блокировка влияет на право доступа - сбрасываем кеш
+        from keys.entitlements import invalidate_entitlement
+        invalidate_entitlement(instance.pk)
+        
+        # Отправляем уведомление через WebSocket
+        send_user_status_update(instance.pk, 'banned' if instance.is_banned else 'active')
     
     # Если пользователь был забанен, здесь можно добавить дополнительную логику
-    if instance.is_banned:
+    if instance.is_banned and instance.has_changed('is_banned'):
         logger.warning(f"User {instance.username} was banned. Reason: {instance.ban_reason}")
         # Здесь будет вызов асинхронной задачи для обновления ролей в Discord
         # После создания Celery tasks 
\ No newline at end of file
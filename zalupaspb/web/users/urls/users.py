@@ -1,7 +1,7 @@
 from django.urls import path
 from ..views.users import (
     UserListView, UserDetailView, UserUpdateView, UserDeleteView, 
-    UserBanView, UserUnbanView, UserRoleUpdateView,
+    UserBanView, UserUnbanView, UserRoleUpdateView, UserExportView,
     DiscordBindingCodeView, DiscordBindView
 )
 
@@ -9,6 +9,7 @@ urlpatterns = [
     # Управление пользователями
     path('', UserListView.as_view(), name='user_list'),
     path('<uuid:pk>/', UserDetailView.as_view(), name='user_detail'),
+    path('export/', UserExportView.as_view(), name='user_export'),
     path('<uuid:pk>/update/', UserUpdateView.as_view(), name='user_update'),
     path('<uuid:pk>/delete/', UserDeleteView.as_view(), name='user_delete'),
     path('<uuid:pk>/ban/', UserBanView.as_view(), name='user_ban'),
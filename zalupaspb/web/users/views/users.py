@@ -9,6 +9,7 @@ from ..serializers import (
     DiscordBindingCodeSerializer, DiscordBindSerializer
 )
 from ..models import BindingCode
+from zalupaspb.export import StreamingExportMixin
 import logging
 
 logger = logging.getLogger('users')
@@ -42,10 +43,11 @@ class UserListView(generics.ListAPIView):
     """Список пользователей"""
     serializer_class = UserSerializer
     permission_classes = [IsAdminOrModerator]
+    keyset_ordering = ('date_joined', 'id')  # курсорная пагинация по ?cursor=
     
     def get_queryset(self):
         """Получение списка пользователей с фильтрацией"""
-        queryset = User.objects.all()
+        queryset = User.objects.with_available_invites().select_related('invited_by')
         
         # Фильтрация по роли
         role = self.request.query_params.get('role')
@@ -76,9 +78,33 @@ class UserListView(generics.ListAPIView):
         return queryset
 
 
+class UserExportView(StreamingExportMixin, UserListView):
+    """Потоковая выгрузка пользователей (фильтры как у списка пользователей)"""
+    export_filename = 'users'
+    export_fields = (
+        ('id', 'id'),
+        ('username', 'username'),
+        ('email', 'email'),
+        ('first_name', 'first_name'),
+        ('last_name', 'last_name'),
+        ('role', 'role'),
+        ('discord_id', 'discord_id'),
+        ('discord_username', 'discord_username'),
+        ('is_banned', 'is_banned'),
+        ('ban_reason', 'ban_reason'),
+        ('date_joined', 'date_joined'),
+        ('last_login', 'last_login'),
+        ('monthly_invites_limit', 'monthly_invites_limit'),
+        ('invites_used_this_month', 'invites_used_this_month'),
+        ('available_invites', 'available_invites_count'),
+        ('invited_by', 'invited_by_id'),
+        ('invited_by_username', 'invited_by__username'),
+    )
+
+
 class UserDetailView(generics.RetrieveAPIView):
     """Детальная информация о пользователе"""
-    queryset = User.objects.all()
+    queryset = User.objects.with_available_invites().select_related('invited_by')
     serializer_class = UserSerializer
     permission_classes = [IsAdminOrModeratorOrOwner]
 
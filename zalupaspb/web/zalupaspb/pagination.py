@@ -0,0 +1,127 @@
+import json
+import base64
+from django.core.exceptions import ValidationError
+from django.db.models import Q
+from django.utils.dateparse import parse_datetime
+from rest_framework.exceptions import NotFound
+from rest_framework.pagination import PageNumberPagination
+from rest_framework.response import Response
+from rest_framework.utils.urls import replace_query_param
+
+
+class KeysetPagination(PageNumberPagination):
+    """
+    Постраничный вывод с поддержкой курсоров (keyset pagination).
+    По умолчанию работает как PageNumberPagination. Если в запросе передан параметр cursor
+    (для первой страницы - пустой, ?cursor=), страница выбирается условием по паре
+    (поле времени, id) вместо OFFSET и без COUNT(*), поэтому время ответа не зависит от номера страницы.
+    Поля задаются атрибутом представления keyset_ordering, например ('created_at', 'id'),
+    сортировка всегда по убыванию и должна поддерживаться составным индексом.
+    """
+    cursor_query_param = 'cursor'
+    invalid_cursor_message = 'Неверный курсор'
+
+    def paginate_queryset(self, queryset, request, view=None):
+        self.keyset_ordering = getattr(view, 'keyset_ordering', None)
+        self.use_cursor = self.keyset_ordering is not None and self.cursor_query_param in request.query_params
+        if not self.use_cursor:
+            return super().paginate_queryset(queryset, request, view)
+
+        self.request = request
+        self.base_url = request.build_absolute_uri()
+        page_size = self.get_page_size(request)
+        if not page_size:
+            return None
+
+        time_field, id_field = self.keyset_ordering
+        position, reverse = self.decode_cursor(request.query_params.get(self.cursor_query_param))
+        if position is not None:
+            try:
+                position = (position[0], queryset.model._meta.get_field(id_field).to_python(position[1]))
+            except ValidationError:
+                raise NotFound(self.invalid_cursor_message)
+
+        if position is None:
+            queryset = queryset.order_by(f'-{time_field}', f'-{id_field}')
+        elif not reverse:
+            # Следующая страница: строки строго "меньше" позиции в порядке (time, id) по убыванию.
+            # Условие time <= value позволяет PostgreSQL использовать диапазон составного индекса
+            value, pk = position
+            queryset = queryset.filter(
+                Q(**{f'{time_field}__lt': value}) | Q(**{time_field: value, f'{id_field}__lt': pk}),
+                **{f'{time_field}__lte': value}
+            ).order_by(f'-{time_field}', f'-{id_field}')
+        else:
+            # Предыдущая страница: выбираем в обратном порядке и разворачиваем результат
+            value, pk = position
+            queryset = queryset.filter(
+                Q(**{f'{time_field}__gt': value}) | Q(**{time_field: value, f'{id_field}__gt': pk}),
+                **{f'{time_field}__gte': value}
+            ).order_by(time_field, id_field)
+
+        # Берем на одну строку больше, чтобы узнать, есть ли следующая страница
+        results = list(queryset[:page_size + 1])
+        has_more = len(results) > page_size
+        results = results[:page_size]
+        if reverse:
+            results.reverse()
+
+        if reverse:
+            self.has_next = position is not None
+            self.has_previous = has_more
+        else:
+            self.has_next = has_more
+            self.has_previous = position is not None
+
+        self.first_item = results[0] if results else None
+        self.last_item = results[-1] if results else None
+        return results
+
+    def decode_cursor(self, cursor):
+        """Разбор курсора: ((значение времени, id) или None, признак обратного направления)"""
+        if not cursor:
+            return None, False
+        try:
+            data = json.loads(base64.urlsafe_b64decode(cursor.encode('ascii')).decode('utf-8'))
+            value = parse_datetime(data['t'])
+            if value is None:
+                raise ValueError(data['t'])
+            return (value, data['id']), bool(data.get('r'))
+        except (TypeError, ValueError, KeyError, UnicodeError):
+            raise NotFound(self.invalid_cursor_message)
+
+    def encode_cursor(self, item, reverse):
+        """Непрозрачный курсор на позицию item"""
+        time_field, id_field = self.keyset_ordering
+        data = {'t': getattr(item, time_field).isoformat(), 'id': str(getattr(item, id_field))}
+        if reverse:
+            data['r'] = 1
+        cursor = base64.urlsafe_b64encode(json.dumps(data, separators=(',', ':')).encode('utf-8')).decode('ascii')
+        return replace_query_param(self.base_url, self.cursor_query_param, cursor)
+
+    def get_next_link(self):
+        if not self.use_cursor:
+            return super().get_next_link()
+        if not self.has_next or self.last_item is None:
+            return None
+        return self.encode_cursor(self.last_item, reverse=False)
+
+    def get_previous_link(self):
+        if not self.use_cursor:
+            return super().get_previous_link()
+        if not self.has_previous:
+            return None
+        if self.first_item is None:
+            # Пустая страница после последней записи - возвращаемся к началу
+            return replace_query_param(self.base_url, self.cursor_query_param, '')
+        return self.encode_cursor(self.first_item, reverse=True)
+
+    def get_paginated_response(self, data):
+        if not self.use_cursor:
+            return super().get_paginated_response(data)
+        return Response({
+            'next': self.get_next_link(),
+            'previous': self.get_previous_link(),
+            'results': data,
+        })
+
@@ -0,0 +1,148 @@
+import time
+import logging
+import redis
+from django.conf import settings
+
+logger = logging.getLogger('security')
+
+_client = None
+
+
+def get_redis():
+    """Клиент Redis для счетчиков ограничения частоты (общий пул соединений процесса)"""
+    global _client
+    if _client is None:
+        _client = redis.Redis.from_url(
+            settings.RATE_LIMIT_REDIS_URL,
+            socket_timeout=0.5,
+            socket_connect_timeout=0.5,
+        )
+    return _client
+
+
+def request_identities(request):
+    """
+    Идентификаторы клиента для ограничения: IP (из IPMiddleware) и пользователь, если он вошел.
+    Для запроса DRF пользователь определяется аутентификацией view: чтобы проверка не обращалась
+    к базе, view использует JWTStatelessUserAuthentication (pk - claim user_id токена).
+    """
+    identities = [('ip', getattr(request, 'client_ip', request.META.get('REMOTE_ADDR', '')))]
+    user = getattr(request, 'user', None)
+    if user is not None and user.is_authenticated:
+        identities.append(('user', str(user.pk)))
+    return identities
+
+
+class RateLimiter:
+    """
+    Ограничение неудачных попыток (подбор кодов) со скользящим окном в Redis.
+    Окно считается по двум соседним фиксированным окнам с весом предыдущего,
+    поэтому на проверку нужен один запрос. При превышении лимита идентификатор
+    блокируется на lockout секунд, каждая следующая блокировка в течение суток длиннее в 2 раза
+    (не больше max_lockout). Отклоненные запросы не пишутся в лог по одному: на окно
+    для идентификатора пишется одна запись SECURITY с количеством отклоненных попыток.
+    При недоступности Redis запросы пропускаются.
+    """
+
+    def __init__(self, scope, limit=10, window=60, lockout=60, max_lockout=3600):
+        self.scope = scope
+        self.limit = limit
+        self.window = window
+        self.lockout = lockout
+        self.max_lockout = max_lockout
+
+    def _key(self, kind, identity, *suffix):
+        name, value = identity
+        return ':'.join(['rl', self.scope, kind, name, str(value)] + [str(part) for part in suffix])
+
+    def check(self, identities):
+        """
+        Проверка блокировки до любой работы с базой.
+        Возвращает количество секунд до снятия блокировки или 0, если запрос разрешен.
+        """
+        try:
+            client = get_redis()
+            pipe = client.pipeline(transaction=False)
+            for identity in identities:
+                pipe.ttl(self._key('lock', identity))
+            ttls = pipe.execute()
+        except redis.RedisError:
+            return 0
+
+        blocked = [(identity, ttl) for identity, ttl in zip(identities, ttls) if ttl and ttl > 0]
+        if not blocked:
+            return 0
+
+        self._record_rejected(blocked)
+        return max(ttl for _, ttl in blocked)
+
+    def _record_rejected(self, blocked):
+        """Подсчет отклоненных запросов; первый отказ в окне пишет одну запись с итогом предыдущего окна"""
+        current = int(time.time() // self.window)
+        try:
+            client = get_redis()
+            pipe = client.pipeline(transaction=False)
+            for identity, _ in blocked:
+                key = self._key('rejected', identity, current)
+                pipe.incr(key)
+                pipe.expire(key, self.window * 2)
+                pipe.get(self._key('rejected', identity, current - 1))
+            results = pipe.execute()
+        except redis.RedisError:
+            return
+
+        for index, (identity, ttl) in enumerate(blocked):
+            count, _, previous = results[index * 3:index * 3 + 3]
+            if count == 1:
+                logger.warning(
+                    f"Rate limit {self.scope}: {identity[0]} {identity[1]} заблокирован еще на {ttl} с, "
+                    f"отклонено попыток за предыдущее окно: {int(previous or 0)}",
+                    extra={'ip_address': identity[1] if identity[0] == 'ip' else None}
+                )
+
+    def register_failure(self, identities):
+        """Учет неудачной попытки; при превышении лимита в окне - блокировка с нарастающим сроком"""
+        now = time.time()
+        current = int(now // self.window)
+        # Доля предыдущего окна, попадающая в скользящее окно
+        weight = 1 - (now % self.window) / self.window
+
+        try:
+            client = get_redis()
+            pipe = client.pipeline(transaction=False)
+            for identity in identities:
+                key = self._key('fail', identity, current)
+                pipe.incr(key)
+                pipe.expire(key, self.window * 2)
+                pipe.get(self._key('fail', identity, current - 1))
+            results = pipe.execute()
+
+            for index, identity in enumerate(identities):
+                count, _, previous = results[index * 3:index * 3 + 3]
+                attempts = count + int(previous or 0) * weight
+                if attempts > self.limit:
+                    self._lock(client, identity, attempts)
+        except redis.RedisError:
+            return
+
+    def _lock(self, client, identity, attempts):
+        """Блокировка идентификатора; срок удваивается с каждой блокировкой за сутки"""
+        strikes_key = self._key('strikes', identity)
+        strikes = client.incr(strikes_key)
+        client.expire(strikes_key, 86400)
+
+        duration = min(self.lockout * 2 ** (strikes - 1), self.max_lockout)
+        client.set(self._key('lock', identity), 1, ex=int(duration))
+        # Счетчик окна сбрасывается, чтобы после блокировки отсчет начался заново
+        client.delete(self._key('fail', identity, int(time.time() // self.window)))
+
+        logger.warning(
+            f"Rate limit {self.scope}: {identity[0]} {identity[1]} заблокирован на {int(duration)} с "
+            f"после {int(attempts)} неудачных попыток (блокировка #{strikes} за сутки)",
+            extra={'ip_address': identity[1] if identity[0] == 'ip' else None}
+        )
+
+
+def get_rate_limiter(scope):
+    """Ограничитель с параметрами из настройки RATE_LIMITS"""
+    return RateLimiter(scope, **getattr(settings, 'RATE_LIMITS', {}).get(scope, {}))
@@ -136,6 +136,12 @@ STATICFILES_DIRS = [os.path.join(BASE_DIR, 'static')]
 MEDIA_URL = 'media/'
 MEDIA_ROOT = os.path.join(BASE_DIR, 'media')
 
+# Обработчики загрузки с вычислением SHA-256 по ходу приема файла (keys.uploads)
+FILE_UPLOAD_HANDLERS = [
+    'keys.uploads.HashingMemoryFileUploadHandler',
+    'keys.uploads.HashingTemporaryFileUploadHandler',
+]
+
 # Default primary key field type
 DEFAULT_AUTO_FIELD = 'django.db.models.BigAutoField'
 
@@ -157,7 +163,7 @@ REST_FRAMEWORK = {
     'DEFAULT_PERMISSION_CLASSES': (
         'rest_framework.permissions.IsAuthenticated',
     ),
-    'DEFAULT_PAGINATION_CLASS': 'rest_framework.pagination.PageNumberPagination',
+    'DEFAULT_PAGINATION_CLASS': 'zalupaspb.pagination.KeysetPagination',
     'PAGE_SIZE': 20
 }
 
@@ -196,6 +202,8 @@ CORS_ALLOWED_ORIGINS = os.getenv('CORS_ALLOWED_ORIGINS', 'https://localhost:8000
 
 # Discord Bot настройки
 DISCORD_BOT_TOKEN = os.getenv('DISCORD_BOT_TOKEN', '')
+# id пользователя сайта, под которым бот обращается к API (активация ключей от имени пользователей)
+BOT_SERVICE_USER_ID = os.getenv('BOT_SERVICE_USER_ID', '')
 DISCORD_GUILD_ID = os.getenv('DISCORD_GUILD_ID', '')
 DISCORD_LOG_CHANNEL_ID = os.getenv('DISCORD_LOG_CHANNEL_ID', '')
 DISCORD_ROLES = {
@@ -219,6 +227,104 @@ KEY_EXPIRY_TIME = {
     'default': 30,  # дней
 }
 
+# Фоновая очистка истекших ключей, инвайтов и кодов привязки
+EXPIRY_SWEEPER = {
+    'interval': int(os.getenv('EXPIRY_SWEEP_INTERVAL', '60')),  # секунд
+    'batch_size': int(os.getenv('EXPIRY_SWEEP_BATCH_SIZE', '1000')),
+}
+
+# Максимальное время жизни записи права доступа в кеше (keys.entitlements), секунд
+ENTITLEMENT_CACHE_MAX_TTL = int(os.getenv('ENTITLEMENT_CACHE_MAX_TTL', '3600'))
+
+# Кеш поиска ключей по коду и id (keys.lookup), секунд
+KEY_LOOKUP_CACHE = {
+    'ttl': int(os.getenv('KEY_LOOKUP_CACHE_TTL', '300')),
+    'negative_ttl': int(os.getenv('KEY_LOOKUP_NEGATIVE_TTL', '30')),  # для несуществующих кодов
+}
+
+# Пул заранее сгенерированных кодов ключей (keys.pool): пополнение при остатке типа ниже low_watermark до high_watermark
+KEY_POOL = {
+    'low_watermark': int(os.getenv('KEY_POOL_LOW_WATERMARK', '200')),
+    'high_watermark': int(os.getenv('KEY_POOL_HIGH_WATERMARK', '1000')),
+    'batch_size': int(os.getenv('KEY_POOL_BATCH_SIZE', '500')),
+}
+
+# Счетчики ключей по типам и статусам (keys.inventory): слотов на пару, пауза между пересчетами reconcile_key_inventory
+KEY_INVENTORY = {
+    'shards': int(os.getenv('KEY_INVENTORY_SHARDS', '8')),
+    'reconcile_interval': int(os.getenv('KEY_INVENTORY_RECONCILE_INTERVAL', '3600')),  # секунд
+}
+
+# Скачивание лоадера (keys.downloads): префикс internal location nginx для X-Accel-Redirect
+# (пусто - файл отдает Django) и время жизни кеша активного лоадера в процессе
+LOADER_DOWNLOAD = {
+    'accel_redirect_prefix': os.getenv('LOADER_ACCEL_REDIRECT_PREFIX', '') or None,  # например /protected-media/
+    'cache_ttl': int(os.getenv('LOADER_CACHE_TTL', '30')),  # секунд
+}
+
+# Размер порции строк, читаемых серверным курсором при потоковой выгрузке (zalupaspb.export)
+EXPORT_CHUNK_SIZE = int(os.getenv('EXPORT_CHUNK_SIZE', '2000'))
+
+# Коды ключей с контрольной группой (keys.codes). Без KEY_CODE_SECRET ключ HMAC выводится из SECRET_KEY
+KEY_CODE_SECRET = os.getenv('KEY_CODE_SECRET')
+# Принимать коды старого формата (XXXX-XXXX-XXXX без префикса версии)
+KEY_CODE_ACCEPT_LEGACY = os.getenv('KEY_CODE_ACCEPT_LEGACY', 'True') == 'True'
+
+# Ограничение подбора кодов (zalupaspb.ratelimit): неудачных попыток за окно, окно и блокировка в секундах
+RATE_LIMIT_REDIS_URL = f'redis://{REDIS_HOST}:{REDIS_PORT}/2'
+RATE_LIMITS = {
+    'key_redeem': {
+        'limit': int(os.getenv('KEY_REDEEM_RATE_LIMIT', '10')),
+        'window': 60,
+        'lockout': int(os.getenv('RATE_LIMIT_LOCKOUT', '60')),
+        'max_lockout': 3600,
+    },
+    'invite_validate': {
+        'limit': int(os.getenv('INVITE_VALIDATE_RATE_LIMIT', '10')),
+        'window': 60,
+        'lockout': int(os.getenv('RATE_LIMIT_LOCKOUT', '60')),
+        'max_lockout': 3600,
+    },
+}
+
+# Лицензии для офлайн-проверки лоадером (keys.licenses)
+LICENSE_PRIVATE_KEY = os.getenv('LICENSE_PRIVATE_KEY')  # base64, manage.py generate_license_key
+LICENSE_TOKEN_TTL = int(os.getenv('LICENSE_TOKEN_TTL', '3600'))  # секунд
+
+# Очередь WebSocket-уведомлений, отправляемых фоновым потоком (keys.outbox)
+NOTIFICATION_OUTBOX = {
+    'batch_size': int(os.getenv('NOTIFICATION_OUTBOX_BATCH_SIZE', '1000')),
+    'flush_interval': float(os.getenv('NOTIFICATION_OUTBOX_FLUSH_INTERVAL', '0.1')),  # секунд, окно объединения событий
+    'max_queue_size': int(os.getenv('NOTIFICATION_OUTBOX_MAX_SIZE', '10000')),
+    'max_retries': int(os.getenv('NOTIFICATION_OUTBOX_MAX_RETRIES', '5')),
+    'max_batch_events': int(os.getenv('NOTIFICATION_MAX_BATCH_EVENTS', '500')),  # событий в одном сообщении *_batch
+    'drain_timeout': float(os.getenv('NOTIFICATION_OUTBOX_DRAIN_TIMEOUT', '5')),  # секунд на отправку очереди при завершении
+}
+
+# Отчеты об отклоненных строках импорта ключей (keys.importer): вне MEDIA_ROOT, отдаются только админ-панелью
+KEY_IMPORT_REPORTS = {
+    'dir': os.getenv('KEY_IMPORT_REPORTS_DIR', os.path.join(BASE_DIR, 'private', 'key_imports')),
+    'max_age_days': int(os.getenv('KEY_IMPORT_REPORTS_MAX_AGE_DAYS', '7')),  # старые отчеты удаляет sweep_expired
+}
+
+# Реестр подписок WebSocket на отдельные ключи (keys.subscriptions): события уходят только в группы ключей с подписчиками
+KEY_SUBSCRIPTIONS_REDIS_URL = f'redis://{REDIS_HOST}:{REDIS_PORT}/3'
+
+# Партиционирование истории ключей по месяцам и архивация старых партиций в gzip NDJSON (manage.py key_history_partitions)
+KEY_HISTORY = {
+    'premake': int(os.getenv('KEY_HISTORY_PARTITION_PREMAKE', '2')),  # сколько месячных партиций создавать заранее
+    'archive_after_months': int(os.getenv('KEY_HISTORY_ARCHIVE_AFTER_MONTHS', '0')) or None,  # None - не архивировать
+    'archive_dir': os.getenv('KEY_HISTORY_ARCHIVE_DIR', os.path.join(BASE_DIR, 'archive', 'key_history')),
+    'member_rows': int(os.getenv('KEY_HISTORY_ARCHIVE_MEMBER_ROWS', '5000')),  # строк в одном gzip-члене архива
+}
+
+# Партиционирование таблицы логов по времени (manage.py log_partitions)
+LOG_PARTITIONING = {
+    'interval': os.getenv('LOG_PARTITION_INTERVAL', 'day'),  # day или month
+    'premake': int(os.getenv('LOG_PARTITION_PREMAKE', '7')),  # сколько партиций создавать заранее
+    'retention_days': int(os.getenv('LOG_RETENTION_DAYS', '0')) or None,  # None - хранить все логи
+}
+
 # CSRF настройки
 CSRF_TRUSTED_ORIGINS = ['https://dinozavrikgugl.ru', 'https://www.dinozavrikgugl.ru']
 
@@ -263,6 +369,10 @@ LOGGING = {
             'level': 'INFO',
             'class': 'logs.handlers.DatabaseLogHandler',
             'formatter': 'verbose',
+            # Запись в базу выполняется фоновым потоком пачками
+            'batch_size': 100,
+            'flush_interval': 1.0,  # секунд
+            'max_queue_size': 10000,
         }
     },
     'loggers': {
@@ -296,5 +406,10 @@ LOGGING = {
             'level': 'INFO',
             'propagate': True,
         },
+        'security': {
+            'handlers': ['console', 'file', 'db_handler'],
+            'level': 'INFO',
+            'propagate': True,
+        },
     },
 } 
\ No newline at end of file
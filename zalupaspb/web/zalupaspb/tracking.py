@@ -0,0 +1,49 @@
+class FieldTrackerMixin:
+    """
+    Отслеживание изменений полей модели без повторного чтения из базы.
+    Значения полей из tracked_fields запоминаются при загрузке экземпляра (from_db),
+    после refresh_from_db и после save(). Сигналы pre_save/post_save видят значения
+    до сохранения через previous() и has_changed(), так как снимок обновляется
+    только после завершения save().
+    """
+    tracked_fields = ()
+
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        instance._snapshot_tracked_fields()
+        return instance
+
+    def refresh_from_db(self, using=None, fields=None, **kwargs):
+        super().refresh_from_db(using=using, fields=fields, **kwargs)
+        self._snapshot_tracked_fields(fields)
+
+    def save(self, *args, **kwargs):
+        super().save(*args, **kwargs)
+        self._snapshot_tracked_fields(kwargs.get('update_fields'))
+
+    def _snapshot_tracked_fields(self, fields=None):
+        """Запоминает текущие значения отслеживаемых полей (отложенные поля пропускаются)"""
+        snapshot = self.__dict__.setdefault('_tracked_snapshot', {})
+        for name in self.tracked_fields:
+            attname = self._meta.get_field(name).attname
+            if fields is not None and name not in fields and attname not in fields:
+                continue
+            if attname in self.__dict__:
+                snapshot[name] = self.__dict__[attname]
+
+    def previous(self, field):
+        """Значение поля на момент загрузки или последнего сохранения (None для нового объекта)"""
+        return self.__dict__.get('_tracked_snapshot', {}).get(field)
+
+    def has_changed(self, field):
+        """
+        Изменилось ли поле с момента загрузки или последнего сохранения.
+        Для нового объекта всегда True, для поля, не загруженного из базы, - False.
+        """
+        if self._state.adding:
+            return True
+        snapshot = self.__dict__.get('_tracked_snapshot', {})
+        if field not in snapshot:
+            return False
+        return snapshot[field] != getattr(self, self._meta.get_field(field).attname)
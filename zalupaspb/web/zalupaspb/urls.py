@@ -50,6 +50,10 @@ def profile_view(request):
 @login_required
 def activate_key_view(request):
     from keys.models import Key
+    from keys.lookup import key_lookup
+    from keys.codes import is_valid_key_code, normalize_key_code
+    from keys.views import redeem_limiter
+    from zalupaspb.ratelimit import request_identities
     
     logger = logging.getLogger('keys')
     context = {}
@@ -64,6 +68,14 @@ def activate_key_view(request):
             'user_id': request.user.id,
             'ip_address': ip_address
         }
+        
+        # Ограничение подбора кодов проверяется до любых запросов к базе
+        identities = request_identities(request)
+        retry_after = redeem_limiter.check(identities)
+        if retry_after:
+            messages.error(request, f'Слишком много неудачных попыток, попробуйте через {retry_after} с')
+            return render(request, 'activate_key.html', context, status=429)
+        
         logger.info(f"Попытка активации ключа: {key_code} пользователем {request.user.username}", extra=extra)
         
         if not key_code:
@@ -71,48 +83,59 @@ def activate_key_view(request):
             logger.warning(f"Пользователь {request.user.username} не ввел код ключа", extra=extra)
             return render(request, 'activate_key.html', context)
         
-        # Проверка существования и валидности ключа по key_code
-        try:
-            key = Key.objects.get(key_code=key_code)
-            
-            if key.status == Key.KeyStatus.USED:
+        # Опечатки и подделанные коды отсекаются по контрольной группе без запроса к базе
+        key_code = normalize_key_code(key_code)
+        if not is_valid_key_code(key_code):
+            redeem_limiter.register_failure(identities)
+            messages.error(request, 'Неверный код ключа')
+            logger.warning(f"Неверный код ключа: {key_code}", extra=extra)
+            return render(request, 'activate_key.html', context)
+        
+        # Неизвестные и неактивные коды отсекаются кешем поиска ключей без запроса к базе,
+        # активация выполняется атомарно по key_code
+        key = key_lookup.get(key_code=key_code)
+        activated = None
+        if key is not None and key.current_status == Key.KeyStatus.ACTIVE:
+            activated = Key.objects.redeem(request.user, key_code=key_code)
+            if activated is None:
+                # Ключ активировали параллельно - берем актуальный статус
+                key = Key.objects.filter(key_code=key_code).first()
+        
+        if activated is not None:
+            messages.success(request, 'Ключ успешно активирован')
+            logger.info(f"Ключ {key_code} успешно активирован пользователем {request.user.username}", extra=extra)
+            context['activated_key'] = activated
+        else:
+            # Ключ не активирован - выясняем причину для сообщения пользователю
+            redeem_limiter.register_failure(identities)
+            if key is None:
+                messages.error(request, 'Ключ не найден')
+                logger.warning(f"Ключ не найден: {key_code}", extra=extra)
+            elif key.current_status == Key.KeyStatus.USED:
                 messages.error(request, 'Этот ключ уже был использован')
                 logger.warning(f"Ключ {key_code} уже был использован", extra=extra)
-            elif key.status == Key.KeyStatus.EXPIRED:
+            elif key.current_status == Key.KeyStatus.EXPIRED:
                 messages.error(request, 'Срок действия ключа истек')
                 logger.warning(f"Ключ {key_code} истек", extra=extra)
-            elif key.status == Key.KeyStatus.REVOKED:
+            elif key.current_status == Key.KeyStatus.REVOKED:
                 messages.error(request, 'Этот ключ был отозван')
                 logger.warning(f"Ключ {key_code} отозван", extra=extra)
-            elif key.status == Key.KeyStatus.ACTIVE:
-                # Активируем ключ для текущего пользователя
-                if key.activate(request.user):
-                    messages.success(request, 'Ключ успешно активирован')
-                    logger.info(f"Ключ {key_code} успешно активирован пользователем {request.user.username}", extra=extra)
-                    context['activated_key'] = key
-                else:
-                    messages.error(request, 'Не удалось активировать ключ')
-                    logger.error(f"Ошибка активации ключа {key_code} пользователем {request.user.username}", extra=extra)
             else:
-                messages.error(request, 'Ключ не может быть активирован')
-                logger.warning(f"Ключ {key_code} имеет некорректный статус: {key.status}", extra=extra)
-        except Key.DoesNotExist:
-            messages.error(request, 'Ключ не найден')
-            logger.warning(f"Ключ не найден: {key_code}", extra=extra)
+                messages.error(request, 'Не удалось активировать ключ')
+                logger.error(f"Ошибка активации ключа {key_code} пользователем {request.user.username}", extra=extra)
     
     return render(request, 'activate_key.html', context)
 
 # Функция для скачивания лоадера (доступна только авторизованным пользователям)
 @login_required
 def download_loader(request):
-    # Здесь будет логика для скачивания последней версии лоадера
-    from keys.models import Loader
-    try:
-        latest_loader = Loader.objects.filter(is_active=True).latest('upload_date')
-        return redirect(latest_loader.file.url)
-    except:
+    # Активный лоадер из кеша процесса, файл отдается через nginx (X-Accel-Redirect) или Django
+    from keys.downloads import loader_cache, serve_loader
+    loader = loader_cache.get()
+    if loader is None:
         # Если лоадера нет, перенаправляем на главную с сообщением
         return redirect('/?error=Лоадер не найден или вы не имеете прав для скачивания')
+    return serve_loader(request, loader)
 
 urlpatterns = [
     # Главная страница